@@ -1,14 +1,40 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
 from flask_cors import CORS
+import hmac
+import json
+import logging
 import random
 import os
+import sys
+import queue
+import threading
+import time
+import uuid
 import cloudinary
-import cloudinary.uploader
 from deepfake_proper import DeepfakeDetector
-from voice_signature_with_deepfake import transcribe_audio, is_exact_match
+from request_audio import RequestAudio
+from prompt_matching import SentenceIndex
+from transcription import transcriber_from_env
 from voice_matching import compare_with_previous_recordings
-from cryptography.fernet import Fernet
-import tempfile
+from speaker_verification import ECAPAEmbedder, SpeakerVerifier, embedder_from_env
+from model_registry import ModelRegistry
+from result_cache import ResultCache
+from audio_features import HOP_LENGTH
+from vad import SpeechTrimmer
+from serving import StageExecutor, cpu_count
+from streaming_audio import StreamingUpload
+from recording_format import SIGNATURE_SLOT, default_keyring, recording_name, seal_recording
+from fingerprint import FingerprintIndex, audio_fingerprint
+from instrumentation import increment, profiler, prometheus_text, recorder, span
+from embedding_store import EmbeddingStore
+from storage import storage_from_env
+from persistence import PersistenceQueue
+from session_store import session_store_from_env
+
+# VOICEPAY_LOG_LEVEL=DEBUG brings back the per-request detail the old debug prints gave
+logging.basicConfig(level=os.environ.get("VOICEPAY_LOG_LEVEL", "INFO").upper(),
+                    format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger("voicepay.app")
 
 app = Flask(__name__)
 CORS(app)
@@ -35,9 +61,174 @@ SENTENCES = [
     "Blockchain technology ensures secure transactions."
 ]
 
-deepfake_detector = DeepfakeDetector("python/dataset/shuffled_file.csv")
+# Normalized once here; VOICEPAY_MATCH_POLICY is exact | normalized | edit | token
+sentence_index = SentenceIndex(SENTENCES,
+                               policy=os.environ.get("VOICEPAY_MATCH_POLICY", "edit"),
+                               threshold=float(os.environ.get("VOICEPAY_MATCH_THRESHOLD", "0.9")))
+
+# Cloudinary by default; VOICEPAY_STORAGE=local:<dir> keeps everything on disk for offline runs
+storage = storage_from_env()
+
+# Each recording is one encrypted .vpr object (recording_format.py) whose key is wrapped by VOICEPAY_MASTER_KEY.
+# Payloads are 16 kHz FLAC; VOICEPAY_RECORDING_CODEC=original keeps uploads as received.
+try:
+    keyring = default_keyring()
+except (RuntimeError, ValueError) as e:
+    logger.critical("❌ Cannot start: %s", e)
+    sys.exit(4)  # gunicorn's "App failed to load": the master stops instead of restarting workers forever
+RECORDING_CODEC = os.environ.get("VOICEPAY_RECORDING_CODEC", "flac")
+
+embedding_store = EmbeddingStore()  # Enrollment voice embeddings, written when enrollment completes
+
+SPEAKER_COHORT = os.environ.get("VOICEPAY_SPEAKER_COHORT", "0") == "1"
+
+# With VOICEPAY_VAD=1, uploads are cut to their speech region (capped at VOICEPAY_MAX_SPEECH_SECONDS) before any
+# stage sees them; by default whole clips are processed
+# Speech starts on the deepfake STFT's hop grid, so streamed uploads reuse their frames (streaming_audio.py)
+speech_trimmer = SpeechTrimmer.from_env(align=HOP_LENGTH)
+
+# Deepfake features and scores of recent uploads, so a client resending the same bytes skips inference
+result_cache = ResultCache(max_entries=int(os.environ.get("VOICEPAY_RESULT_CACHE_SIZE", "4096")),
+                           ttl=float(os.environ.get("VOICEPAY_RESULT_CACHE_TTL", "600")))
+
+# Spectral-peak fingerprints of every stored recording (fingerprint.py); an upload replaying one of them, for any
+# user, is rejected before the models run. VOICEPAY_FINGERPRINT=0 turns the check off.
+fingerprint_index = FingerprintIndex.from_env()
+
+
+def build_deepfake_detector():
+    # Loads the trained artifact; retrains only if dataset/shuffled_file.csv changed since it was built.
+    detector = DeepfakeDetector.from_csv()
+    # Micro-batch concurrent predictions; VOICEPAY_BATCH_WINDOW_MS=0 scores each request on its own
+    if float(os.environ.get("VOICEPAY_BATCH_WINDOW_MS", "2")) > 0:
+        detector.enable_batching(max_batch_size=int(os.environ.get("VOICEPAY_BATCH_MAX_SIZE", "32")),
+                                 max_wait_ms=float(os.environ.get("VOICEPAY_BATCH_WINDOW_MS", "2")))
+    detector.enable_result_cache(result_cache)  # Drops results of any previously loaded artifact
+    return detector
+
+
+def build_speaker_verifier():
+    # Mean-MFCC embeddings by default; VOICEPAY_SPEAKER_EMBEDDING=ecapa uses the speechbrain speaker model.
+    # VOICEPAY_SPEAKER_COHORT=1 normalizes scores against every other enrolled user.
+    verifier = SpeakerVerifier(embedder_from_env(), store=embedding_store, storage=storage, trimmer=speech_trimmer)
+    if SPEAKER_COHORT:
+        verifier.load_cohort()
+    return verifier
+
+
+# Heavy models are built on first use; VOICEPAY_WARM_UP=1 (or warm_up() from a worker hook) loads them up front
+models = ModelRegistry()
+models.register("deepfake", build_deepfake_detector)
+# AssemblyAI by default; VOICEPAY_TRANSCRIBER=vosk checks the prompt offline with a constrained decoder
+models.register("transcriber", transcriber_from_env)
+models.register("speaker_verifier", build_speaker_verifier)
+
+
+def warm_up():
+    """Load every model now (e.g. in a pre-forked worker) instead of on the first request."""
+    models.warm_up()
+    verifier = models.get("speaker_verifier")
+    if isinstance(verifier.embedder, ECAPAEmbedder):
+        verifier.embedder.model  # The ECAPA network itself is loaded lazily too
+    return models.status()
+
+
+if os.environ.get("VOICEPAY_WARM_UP", "0") == "1":
+    warm_up()
+
+# Encrypts and uploads verified sentences off the request thread
+persistence_queue = PersistenceQueue(
+    workers=int(os.environ.get("VOICEPAY_PERSIST_WORKERS", "4")),
+    capacity=int(os.environ.get("VOICEPAY_PERSIST_CAPACITY", "64")),
+)
+
+# CPU-bound stages (decode, features, inference, embedding) queue for this worker's share of the cores,
+# which gunicorn.conf.py passes as VOICEPAY_CPU_THREADS. I/O stages (transcription, reference downloads)
+# run on their own pool so they overlap with the CPU stages of the same request.
+cpu_executor = StageExecutor(int(os.environ.get("VOICEPAY_CPU_THREADS", "0")) or cpu_count(), "cpu")
+io_executor = StageExecutor(int(os.environ.get("VOICEPAY_IO_THREADS", "16")), "io")
+# Transcribe enrollment sentences while the deepfake check runs (lower latency). With VOICEPAY_EARLY_TRANSCRIPTION=0
+# a recording only reaches the transcription service (AssemblyAI by default) once the deepfake check has passed.
+EARLY_TRANSCRIPTION = os.environ.get("VOICEPAY_EARLY_TRANSCRIPTION", "1") == "1"
+
+# Tracks user verification progress; VOICEPAY_SESSION_STORE=sqlite:<path> shares it across workers
+session_store = session_store_from_env()
+
+# Streamed recordings are read in pieces of this size and refused beyond the limit
+STREAM_CHUNK_BYTES = 64 * 1024
+STREAM_MAX_BYTES = int(os.environ.get("VOICEPAY_STREAM_MAX_BYTES", str(20 * 1024 * 1024)))
+
+# How long the final sentence waits for uploads accepted by other workers
+UPLOAD_WAIT_TIMEOUT = float(os.environ.get("VOICEPAY_UPLOAD_WAIT_TIMEOUT", "60"))
 
-user_progress = {}  # Tracks user verification progress
+# Fraction of requests to cProfile; change at runtime with POST /debug/profiling
+profiler.sample_rate = float(os.environ.get("VOICEPAY_PROFILE_SAMPLE_RATE", "0"))
+
+# The /debug routes are off unless VOICEPAY_DEBUG_TOKEN is set; requests must send it as X-Debug-Token
+DEBUG_TOKEN = os.environ.get("VOICEPAY_DEBUG_TOKEN", "")
+
+# The /debug routes write their settings here, and every worker applies them on its next request
+DEBUG_SETTINGS_PATH = os.environ.get("VOICEPAY_DEBUG_SETTINGS",
+                                     os.path.join(os.path.dirname(os.path.abspath(__file__)), "data",
+                                                  "debug_settings.json"))
+_debug_settings = {"mtime": None, "profile_resets": None}
+
+def read_debug_settings():
+    try:
+        with open(DEBUG_SETTINGS_PATH) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def write_debug_settings(**updates):
+    """Merge `updates` into the shared debug settings (atomically replaced) and apply them here."""
+    settings = read_debug_settings()
+    settings.update(updates)
+    os.makedirs(os.path.dirname(DEBUG_SETTINGS_PATH), exist_ok=True)
+    tmp_path = f"{DEBUG_SETTINGS_PATH}.tmp-{os.getpid()}-{threading.get_ident()}"
+    with open(tmp_path, "w") as f:
+        json.dump(settings, f)
+    os.replace(tmp_path, DEBUG_SETTINGS_PATH)
+    apply_debug_settings()
+    return settings
+
+def apply_debug_settings():
+    """Apply debug settings written by any worker since the last check (one stat() when nothing changed)."""
+    try:
+        mtime = os.stat(DEBUG_SETTINGS_PATH).st_mtime_ns
+    except FileNotFoundError:
+        return
+    if mtime == _debug_settings["mtime"]:
+        return
+    _debug_settings["mtime"] = mtime
+    settings = read_debug_settings()
+    if "profile_sample_rate" in settings:
+        profiler.sample_rate = settings["profile_sample_rate"]
+    if "log_level" in settings:
+        logging.getLogger().setLevel(settings["log_level"])
+    resets = settings.get("profile_resets", 0)
+    if _debug_settings["profile_resets"] is not None and resets != _debug_settings["profile_resets"]:
+        profiler.reset()
+    _debug_settings["profile_resets"] = resets
+
+@app.before_request
+def start_request_instrumentation():
+    g.request_started = time.perf_counter()
+    apply_debug_settings()
+    g.profile = profiler.start()
+
+@app.after_request
+def count_request(response):
+    endpoint = request.endpoint or "unknown"
+    increment("http_requests_total", endpoint=endpoint, status=response.status_code)
+    started = g.pop("request_started", None)
+    if started is not None:
+        recorder.record(f"request_{endpoint}", (time.perf_counter() - started) * 1e3)
+    return response
+
+@app.teardown_request
+def stop_request_profile(exc):
+    profiler.stop(g.pop("profile", None))
 
 @app.route("/", methods=["GET"])
 def index():
@@ -47,6 +238,7 @@ def index():
         "endpoints": [
             "/get_sentences",
             "/verify_speech",
+            "/verify_speech/stream",
             "/create_voice_signature"
         ]
     })
@@ -60,26 +252,109 @@ def get_sentences():
         return jsonify({"error": "Username is required"}), 400
 
     selected_sentences = random.sample(SENTENCES, 3)
-    user_progress[username] = {"sentences": selected_sentences, "index": 0, "audio_files": []}
+    previous = session_store.create(username, {"session_id": uuid.uuid4().hex, "sentences": selected_sentences,
+                                               "index": 0, "embeddings": [], "uploads": {}})
+    if previous:
+        persistence_queue.discard(previous["session_id"])  # Restarted enrollment
     
     return jsonify({"sentences": selected_sentences})
 
-def encrypt_audio(file_data):
-    """Encrypt audio data using Fernet encryption."""
-    encryption_key = Fernet.generate_key()
-    cipher = Fernet(encryption_key)
-    encrypted_data = cipher.encrypt(file_data)
-    return encrypted_data, encryption_key
+def session_is_current(username, session_id):
+    session = session_store.get(username)
+    return session is not None and session["session_id"] == session_id
+
+def store_recording(username, slot, audio_clip, embeddings, session_id=None):
+    """Compress and encrypt a recording into one .vpr object with its embeddings and upload it; returns its URL.
+
+    With a `session_id`, nothing is uploaded (and None is returned) once that enrollment session is gone.
+    """
+    with span("encrypt"):
+        blob = seal_recording(audio_clip, keyring, RECORDING_CODEC, embeddings)
+    if session_id is not None and not session_is_current(username, session_id):
+        return None
+    with span("upload"):
+        return storage.put(recording_name(username, slot), blob)
+
+def find_replay(audio_clip):
+    """The stored recording that `audio_clip` replays, as a FingerprintMatch, or None."""
+    if fingerprint_index is None:
+        return None
+    try:
+        hashes, frames = cpu_executor.run(audio_fingerprint, audio_clip)
+    except Exception as e:  # An undecodable upload is reported by the stages that follow
+        logger.debug("❌ Fingerprinting failed: %s", e)
+        return None
+    try:
+        with span("replay_lookup"):
+            match = fingerprint_index.find_duplicate(hashes, frames)
+    except Exception:  # A broken index must not block enrollment; the other checks still run
+        increment("replay_lookup_failures_total")
+        logger.exception("❌ Replay lookup failed")
+        return None
+    if match is not None:
+        logger.warning("🔁 Upload replays recording %s of %s (%d matching hashes, %.0f%%)",
+                       match.slot, match.username, match.votes, match.ratio * 100)
+    return match
+
+def remember_recording(username, slot, audio_clip):
+    """Index a stored recording so that later replays of it are rejected."""
+    if fingerprint_index is None:
+        return
+    try:
+        fingerprint_index.add(username, slot, *audio_fingerprint(audio_clip))
+    except Exception as e:
+        logger.warning("❌ Could not index the fingerprint of %s: %s", recording_name(username, slot), e)
+
+def persist_recording(username, session_id, slot, audio_clip, embeddings):
+    """Store a verified recording (runs on the persistence queue).
 
-def upload_to_cloudinary(file_path, filename, resource_type="raw"):
-    """Upload a file from disk to Cloudinary."""
-    response = cloudinary.uploader.upload(file_path, resource_type=resource_type, public_id=filename, overwrite=True)
-    return response["secure_url"]
+    The outcome is recorded in the session so whichever worker handles the final
+    sentence can tell when every upload of the enrollment has landed. A job whose
+    session was abandoned or restarted stores nothing, so it cannot overwrite the
+    recordings of the session that replaced it.
+    """
+    try:
+        with span("persist"):
+            audio_url = store_recording(username, slot, audio_clip, embeddings, session_id)
+        if audio_url is None:
+            logger.info("🔹 Skipped storing %s: its enrollment session ended", recording_name(username, slot))
+            return None
+        remember_recording(username, slot, audio_clip)
+    except Exception as e:
+        increment("upload_failures_total")
+        session_store.record(username, session_id, "uploads", str(slot), {"error": str(e)})
+        raise
+    uploaded = {"audio_url": audio_url}
+    session_store.record(username, session_id, "uploads", str(slot), uploaded)
+    return uploaded
+
+def wait_for_uploads(username, session_id, count, timeout=UPLOAD_WAIT_TIMEOUT):
+    """Wait until `count` uploads of the session are recorded; returns them ordered by slot."""
+    persistence_queue.wait_for(session_id)  # Jobs this worker accepted; re-raises their failure
+    deadline = time.monotonic() + timeout
+    while True:
+        session = session_store.get(username)
+        if session is None or session["session_id"] != session_id:
+            raise RuntimeError("Session ended while recordings were being saved")
+        uploads = session.get("uploads", {})
+        failed = [upload["error"] for upload in uploads.values() if "error" in upload]
+        if failed:
+            raise RuntimeError(failed[0])
+        if len(uploads) >= count:
+            return [uploads[slot] for slot in sorted(uploads, key=int)]
+        if time.monotonic() > deadline:
+            raise TimeoutError("Timed out waiting for recordings to be saved")
+        time.sleep(0.05)
+
+def transcribe(audio_clip, expected_text):
+    with span("transcribe"):
+        return models.get("transcriber").transcribe(audio_clip, expected_text)
 
 @app.route("/verify_speech", methods=["POST"])
 def verify_speech():
     username = request.form.get("username")
-    if username not in user_progress:
+    session = session_store.get(username) if username else None
+    if session is None:
         return jsonify({"error": "Session expired. Restart required.", "deepfake_result": "N/A"}), 400
 
     if "audio" not in request.files:
@@ -87,185 +362,320 @@ def verify_speech():
 
     audio = request.files["audio"]
     file_data = audio.read()  # Read file into memory
+    # Decoded (and trimmed) once, shared by every stage below
+    audio_clip = RequestAudio(file_data, audio.filename, trimmer=speech_trimmer)
+    return verify_session_audio(username, session, audio_clip)
+
+@app.route("/verify_speech/stream", methods=["POST"])
+def verify_speech_stream():
+    """`verify_speech` with the recording as the request body: a 16-bit PCM WAV, chunked uploads welcome.
+
+    Deepfake features are computed frame by frame while the body arrives, so the
+    verdict is ready right after the last chunk. The username is a query parameter.
+    """
+    username = request.args.get("username")
+    session = session_store.get(username) if username else None
+    if session is None:
+        return jsonify({"error": "Session expired. Restart required.", "deepfake_result": "N/A"}), 400
 
-    expected_text = user_progress[username]["sentences"][user_progress[username]["index"]].strip().lower()
+    upload = StreamingUpload()
+    while True:
+        chunk = request.stream.read(STREAM_CHUNK_BYTES)
+        if not chunk:
+            break
+        if upload.size + len(chunk) > STREAM_MAX_BYTES:
+            return jsonify({"error": "Recording too large", "deepfake_result": "N/A"}), 413
+        try:
+            cpu_executor.run(upload.feed, chunk)
+        except ValueError as e:
+            return jsonify({"error": str(e), "deepfake_result": "N/A"}), 400
+    try:
+        file_data, y, sr = cpu_executor.run(upload.finish)
+    except ValueError as e:
+        return jsonify({"error": str(e), "deepfake_result": "N/A"}), 400
+
+    audio_clip = RequestAudio.from_signal(y, sr, data=file_data, trimmer=speech_trimmer)
+    # Equal to extract_features on the trimmed signal (tests/test_streaming_audio.py); only the cut frames are redone
+    audio_clip.cached("deepfake_features", lambda: upload.features(audio_clip.speech_bounds))
+    return verify_session_audio(username, session, audio_clip)
+
+def verify_session_audio(username, session, audio_clip):
+    """Check one enrollment recording against the session's current sentence and advance the session."""
+    index = session["index"]
+    session_id = session["session_id"]
+    expected_text = session["sentences"][index].strip().lower()
+
+    # 🔁 Reject a replay of any stored recording before a model runs
+    if find_replay(audio_clip) is not None:
+        increment("verification_failures_total", route="verify_speech", reason="replay")
+        persistence_queue.discard(session_id)
+        session_store.delete(username)  # Reset session
+        return jsonify({
+            "result": "Replay detected",
+            "message": "🚨 This recording was already used! Restarting process with new sentences.",
+            "deepfake_result": "N/A"
+        }), 403
 
-    # 🔹 Create a temporary audio file
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as temp_audio:
-        temp_audio.write(file_data)
-        temp_audio_path = temp_audio.name  # Save the file path
+    # 🎙️ Transcribe while the deepfake check runs; a deepfake verdict cancels it if it has not started yet
+    transcription = io_executor.submit(transcribe, audio_clip, expected_text) if EARLY_TRANSCRIPTION else None
 
     try:
-        # 🔍 Deepfake detection using temp file
-        deepfake_result = deepfake_detector.predict_audio_deepfake(temp_audio_path)
+        # 🔍 Deepfake detection on the audio decoded in memory
+        deepfake_result = cpu_executor.run(models.get("deepfake").predict_audio_deepfake, audio_clip)
     except Exception as e:
         deepfake_result = f"Error: {str(e)}"
 
-    # 🗑️ Delete the temporary file
-    os.remove(temp_audio_path)
-
     # 🚫 Reject if AI-generated voice detected
     if deepfake_result == "FAKE(AI Voice)":
-        del user_progress[username]  # Reset session
+        increment("verification_failures_total", route="verify_speech", reason="deepfake")
+        if transcription is not None:
+            transcription.cancel()
+        persistence_queue.discard(session_id)
+        session_store.delete(username)  # Reset session
         return jsonify({
             "result": "Deepfake detected",
             "message": "🚨 Deepfake detected! Restarting process with new sentences.",
             "deepfake_result": deepfake_result
         }), 403
 
-    # 🎙️ Transcribe the recorded speech
-    transcribed_text = transcribe_audio(file_data)
-    if not transcribed_text or not is_exact_match(transcribed_text, expected_text):
+    if transcription is None:
+        transcription = io_executor.submit(transcribe, audio_clip, expected_text)
+    transcribed_text = transcription.result()
+    with span("match"):
+        matched = sentence_index.matches(transcribed_text, expected_text)
+    if not matched:
+        increment("verification_failures_total", route="verify_speech", reason="transcript")
+        read_sentence, read_score = sentence_index.best_match(transcribed_text)
         return jsonify({
             "result": "Failure",
             "message": f"❌ Incorrect! Please repeat: \"{expected_text}\"",
+            "transcript": transcribed_text,
+            # The prompt the user seems to have read instead, if any is close enough
+            "read_sentence": read_sentence if read_score >= sentence_index.threshold else None,
             "deepfake_result": deepfake_result
         }), 401
 
-    # 🔐 Encrypt the audio file
-    encrypted_audio, encryption_key = encrypt_audio(file_data)
-
-    # 🔹 Create temporary files for encrypted audio & encryption key
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".enc") as enc_file:
-        enc_file.write(encrypted_audio)
-        enc_file_path = enc_file.name
-
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".txt") as key_file:
-        key_file.write(encryption_key)
-        key_file_path = key_file.name
-
-    # 🔼 Upload encrypted audio & key to Cloudinary
-    enc_filename = f"{username}_{user_progress[username]['index']+1}.enc"
-    key_filename = f"{username}_key{user_progress[username]['index']+1}.txt"
+    # Reference embedding for later voice matching, also stored inside the recording
+    speaker_verifier = models.get("speaker_verifier")
+    with span("embed"):
+        embedding = cpu_executor.run(speaker_verifier.embed, audio_clip).tolist()
 
-    cloudinary_audio_url = upload_to_cloudinary(enc_file_path, enc_filename)
-    cloudinary_key_url = upload_to_cloudinary(key_file_path, key_filename)
+    # ✅ Claim the slot first: only the request that moves the session to the next sentence stores its recording
+    previous_embeddings = session["embeddings"]
+    session = session_store.advance(username, index, {"embeddings": previous_embeddings + [embedding]})
+    if session is None:
+        increment("verification_failures_total", route="verify_speech", reason="conflict")
+        return jsonify({"error": "Session changed while verifying. Please retry.",
+                        "deepfake_result": deepfake_result}), 409
 
-    # 🗑️ Delete temporary encrypted files
-    os.remove(enc_file_path)
-    os.remove(key_file_path)
-
-    user_progress[username]["audio_files"].append({
-        "audio_url": cloudinary_audio_url,
-        "key_url": cloudinary_key_url
-    })
-
-    # ✅ Success: Move to next sentence
-    user_progress[username]["index"] += 1
-
-    if user_progress[username]["index"] == 3:
+    # 🔐 Encrypt & upload in the background so the client hears back right away
+    try:
+        persistence_queue.submit(session_id, persist_recording, username, session_id, index + 1,
+                                 audio_clip, {speaker_verifier.kind: embedding})
+    except queue.Full:
+        session_store.rewind(username, session_id, index, {"embeddings": previous_embeddings})  # Free the slot
+        increment("verification_failures_total", route="verify_speech", reason="busy")
+        return jsonify({
+            "result": "Failure",
+            "message": "⏳ Server is busy saving recordings. Please try again in a moment.",
+            "deepfake_result": deepfake_result
+        }), 503
+
+    if session["index"] == 3:
+        # Enrollment is only complete once every upload of this session has landed
+        try:
+            audio_files = wait_for_uploads(username, session_id, 3)
+        except Exception as e:
+            increment("verification_failures_total", route="verify_speech", reason="upload")
+            persistence_queue.discard(session_id)
+            session_store.delete(username)
+            return jsonify({"error": "Saving recordings failed. Restart required.", "message": str(e),
+                            "deepfake_result": deepfake_result}), 500
+
+        # Re-enrollment drops the user's embeddings of every kind (other embedders, with or without VAD), so a
+        # later switch of kind rebuilds them from these recordings instead of matching against the old voice.
+        # Every worker's cohort picks the new embeddings up from the store version (SpeakerVerifier.refresh_cohort)
+        embedding_store.invalidate(username)
+        embedding_store.replace(username, session["embeddings"], speaker_verifier.kind)
         result = {
             "result": "Success",
             "message": "✅ All sentences verified!\n🛡️ Deepfake Check: " + deepfake_result,
             "deepfake_result": deepfake_result,
             "training_complete": True,
-            "cloudinary_files": user_progress[username]["audio_files"]
+            "cloudinary_files": audio_files
         }
-        del user_progress[username]  # Clear session after completion
+        session_store.delete(username)  # Clear session after completion
+        increment("enrollments_completed_total")
         return jsonify(result)
 
     return jsonify({
         "result": "Success",
-        "message": f"✅ Correct! Next sentence: \"{user_progress[username]['sentences'][user_progress[username]['index']]}\"",
+        "message": f"✅ Correct! Next sentence: \"{session['sentences'][session['index']]}\"",
         "deepfake_result": deepfake_result
     })
 
 @app.route("/create_voice_signature", methods=["POST"])
 def create_voice_signature():
-    print("🔹 Received request to create voice signature.")  # Debug message
-    print(f"🔹 Request URL: {request.url}")
-    print(f"🔹 Request method: {request.method}")
-    print(f"🔹 Request form data: {request.form}")
-    print(f"🔹 Request files: {request.files}")
+    logger.debug("🔹 Received request to create voice signature: %s %s form=%s files=%s",
+                 request.method, request.url, request.form, request.files)
 
     username = request.form.get("username")
     if not username:
-        print("❌ Error: Username not provided.")  # Debug message
+        logger.debug("❌ Error: Username not provided.")
         return jsonify({"error": "Username is required"}), 400
 
     if "audio" not in request.files:
-        print("❌ Error: No audio file received in request.")  # Debug message
+        logger.debug("❌ Error: No audio file received in request.")
         return jsonify({"error": "No audio file provided"}), 400
 
     audio = request.files["audio"]
     file_data = audio.read()
-    print(f"🔹 Received audio file: {audio.filename}, Size: {len(file_data)} bytes")  # Debug message
+    # Decoded (and trimmed) once, shared by every stage below
+    audio_clip = RequestAudio(file_data, audio.filename, trimmer=speech_trimmer)
+    logger.debug("🔹 Received audio file: %s, Size: %d bytes", audio.filename, len(file_data))
+
+    # 🔁 Reject a replay of any stored recording before a model runs
+    if find_replay(audio_clip) is not None:
+        increment("verification_failures_total", route="create_voice_signature", reason="replay")
+        return jsonify({"error": "🚨 This recording was already used! Voice signature cannot be created."}), 403
+
+    # Fetch the enrollment references while the deepfake check runs
+    speaker_verifier = models.get("speaker_verifier")
+    references = io_executor.submit(speaker_verifier.references, username)
 
-    # 🔹 Create a temporary audio file for deepfake detection
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as temp_audio:
-        temp_audio.write(file_data)
-        temp_audio_path = temp_audio.name  # Save the file path
+    def detect_deepfake():
+        audio_clip.signal  # decode now so a corrupt upload is reported as a detection failure
+        return models.get("deepfake").predict_audio_deepfake(audio_clip)
 
     try:
-        # 🔍 Deepfake detection using temp file
-        print("🔹 Running deepfake detection...")
-        deepfake_result = deepfake_detector.predict_audio_deepfake(temp_audio_path)
-        print(f"✅ Deepfake detection result: {deepfake_result}")  # Debug message
+        # 🔍 Deepfake detection on the audio decoded in memory
+        deepfake_result = cpu_executor.run(detect_deepfake)
+        logger.debug("✅ Deepfake detection result: %s", deepfake_result)
     except Exception as e:
-        deepfake_result = f"Error: {str(e)}"
-        print(f"❌ Deepfake detection error: {deepfake_result}")  # Debug message
+        logger.warning("❌ Deepfake detection error: %s", e)
+        increment("verification_failures_total", route="create_voice_signature", reason="detection_error")
         return jsonify({"error": "Deepfake detection failed", "message": str(e)}), 500
 
-    # 🗑️ Delete the temporary audio file
-    os.remove(temp_audio_path)
-    print("✅ Temporary audio file deleted.")  # Debug message
-
     # 🚫 Reject if AI-generated voice detected
     if deepfake_result == "FAKE(AI Voice)":
+        increment("verification_failures_total", route="create_voice_signature", reason="deepfake")
         return jsonify({
             "error": "🚨 Deepfake detected! Voice signature cannot be created.",
             "deepfake_result": deepfake_result
         }), 403
 
     # 🔍 Compare with previous voice signatures
-    print("🔹 Comparing with previous recordings...")
-    if not compare_with_previous_recordings(username, file_data):
-        print("❌ Voice mismatch detected!")  # Debug message
+    with span("voice_match"):
+        references.exception()  # Wait for the prefetch; if it failed, the comparison fetches them itself
+        voice_matches = cpu_executor.run(compare_with_previous_recordings, username, audio_clip,
+                                         verifier=speaker_verifier)
+    if not voice_matches:
+        logger.info("❌ Voice mismatch detected for %s", username)
+        increment("verification_failures_total", route="create_voice_signature", reason="voice_mismatch")
         return jsonify({"error": "❌ Voice mismatch! Signature does not match previous recordings."}), 401
 
-    # 🔐 Encrypt the audio file
-    print("🔹 Encrypting audio file...")
-    encrypted_audio, encryption_key = encrypt_audio(file_data)
-    print(f"✅ Encryption successful. Encrypted file size: {len(encrypted_audio)} bytes")  # Debug message
-
-    # 🔹 Save encrypted file temporarily
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".enc") as enc_file:
-        enc_file.write(encrypted_audio)
-        enc_file_path = enc_file.name
-    print(f"✅ Encrypted audio saved temporarily at: {enc_file_path}")  # Debug message
-
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".txt") as key_file:
-        key_file.write(encryption_key)
-        key_file_path = key_file.name
-    print(f"✅ Encryption key saved temporarily at: {key_file_path}")  # Debug message
-
-    # 🔼 Upload encrypted audio and key to Cloudinary
-    enc_filename = f"{username}_voiceSignature.enc"
-    key_filename = f"{username}_keySignature.txt"
-
-    print("🔹 Uploading encrypted audio to Cloudinary...")
-    cloudinary_audio_url = upload_to_cloudinary(enc_file_path, enc_filename)
-    print(f"✅ Encrypted audio uploaded: {cloudinary_audio_url}")  # Debug message
+    # 🔐 Compress, encrypt and upload the recording as one object
+    with span("persist"):
+        embedding = speaker_verifier.embed(audio_clip)  # Computed (and cached) by the voice match
+        cloudinary_audio_url = store_recording(username, SIGNATURE_SLOT, audio_clip,
+                                               {speaker_verifier.kind: embedding})
+    logger.debug("✅ Encrypted recording uploaded: %s", cloudinary_audio_url)
     if not cloudinary_audio_url:
+        increment("upload_failures_total")
         return jsonify({"error": "Cloudinary upload failed"}), 500
+    remember_recording(username, SIGNATURE_SLOT, audio_clip)
 
-    print("🔹 Uploading encryption key to Cloudinary...")
-    cloudinary_key_url = upload_to_cloudinary(key_file_path, key_filename)
-    print(f"✅ Encryption key uploaded: {cloudinary_key_url}")  # Debug message
-
-    # 🗑️ Delete temporary files
-    os.remove(enc_file_path)
-    os.remove(key_file_path)
-    print("✅ Temporary files deleted.")  # Debug message
+    increment("voice_signatures_created_total")
 
     return jsonify({
         "result": "Success",
         "message": "✅ Voice Signature Created!",
         "deepfake_result": deepfake_result,
-        "audio_url": cloudinary_audio_url,
-        "key_url": cloudinary_key_url
+        "audio_url": cloudinary_audio_url
     })
 
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Stage timings, counters and queue/cache gauges in the Prometheus text format."""
+    persistence = persistence_queue.metrics()
+    cache = result_cache.stats()
+    counters = {
+        "persistence_jobs_total": {(("outcome", "completed"),): persistence["completed"],
+                                   (("outcome", "failed"),): persistence["failed"]},
+        "result_cache_hits_total": cache["hits"],
+        "result_cache_misses_total": cache["misses"],
+        "result_cache_evictions_total": cache["evictions"],
+    }
+    # Time jobs spent queued and running; quantiles over the queue's recent window
+    jobs_run = persistence["completed"] + persistence["failed"]
+    summaries = {"persistence_job_duration_seconds": [
+        ((("phase", phase),),
+         {quantile: window[key] / 1e3 for quantile, key in (("0.5", "p50"), ("0.95", "p95"), ("0.99", "p99"))
+          if key in window},
+         persistence[total_key] / 1e3, jobs_run)
+        for phase, window, total_key in (("queue_wait", persistence["queue_wait_ms"], "queue_wait_total_ms"),
+                                         ("run", persistence["job_run_ms"], "job_run_total_ms"))]}
+    gauges = {
+        "persistence_queue_depth": persistence["queue_depth"],
+        "persistence_in_flight": persistence["in_flight"],
+        "result_cache_entries": cache["entries"],
+        "model_loaded": {(("model", name),): int(status["loaded"]) for name, status in models.status().items()},
+        "profile_sample_rate": profiler.sample_rate,
+        "cpu_executor_pending": cpu_executor.stats()["pending"],
+        "io_executor_pending": io_executor.stats()["pending"],
+    }
+    if models.is_loaded("deepfake") and models.get("deepfake").batcher is not None:
+        batcher = models.get("deepfake").batcher.stats()
+        gauges["inference_batches"] = batcher["batches"]
+        gauges["inference_mean_batch_size"] = batcher["mean_batch_size"]
+    if fingerprint_index is not None:
+        fingerprints = fingerprint_index.stats()
+        gauges["fingerprint_postings"] = fingerprints["postings"]
+        gauges["fingerprint_pending_postings"] = fingerprints["pending"]
+    # Each worker reports its own numbers; the pid label keeps the series of different workers apart
+    return Response(prometheus_text(recorder, gauges, labels=[("pid", os.getpid())], counters=counters,
+                                    summaries=summaries),
+                    mimetype="text/plain; version=0.0.4")
+
+def debug_authorized():
+    """Debug routes only answer requests carrying VOICEPAY_DEBUG_TOKEN, and not at all when it is unset."""
+    token = request.headers.get("X-Debug-Token", "")
+    return bool(DEBUG_TOKEN) and hmac.compare_digest(token.encode(), DEBUG_TOKEN.encode())
+
+@app.route("/debug/profiling", methods=["GET", "POST"])
+def debug_profiling():
+    """POST changes the sample rate (or resets the profiles) of every worker; GET reports this worker's profile."""
+    if not debug_authorized():
+        return jsonify({"error": "The requested URL was not found"}), 404
+    if request.method == "POST":
+        data = request.json or {}
+        updates = {}
+        if "sample_rate" in data:
+            updates["profile_sample_rate"] = min(max(float(data["sample_rate"]), 0.0), 1.0)
+        if data.get("reset"):
+            updates["profile_resets"] = read_debug_settings().get("profile_resets", 0) + 1
+        if updates:
+            write_debug_settings(**updates)
+        return jsonify({"sample_rate": profiler.sample_rate})
+    limit = int(request.args.get("limit", 30))
+    report = profiler.report(limit, request.args.get("sort", "cumulative"))
+    return Response(f"Worker {os.getpid()}: " + report, mimetype="text/plain")
+
+@app.route("/debug/log_level", methods=["POST"])
+def debug_log_level():
+    """Set the log level of every worker."""
+    if not debug_authorized():
+        return jsonify({"error": "The requested URL was not found"}), 404
+    level = str((request.json or {}).get("level", "INFO")).upper()
+    if not isinstance(logging.getLevelName(level), int):
+        return jsonify({"error": f"Unknown log level: {level}"}), 400
+    write_debug_settings(log_level=level)
+    return jsonify({"level": level})
+
+@app.route("/models", methods=["GET"])
+def model_status():
+    return jsonify(models.status())
+
 @app.errorhandler(404)
 def not_found(e):
     return jsonify({"error": "The requested URL was not found"}), 404
@@ -276,8 +686,9 @@ def test():
 
 @app.errorhandler(Exception)
 def handle_exception(e):
-    print(f"❌ Server Error: {str(e)}")  # Debugging
+    logger.exception("❌ Server Error: %s", e)
     return jsonify({"error": "Internal Server Error", "message": str(e)}), 500
 
 if __name__ == "__main__":
+    # Development server only; in production run `gunicorn -c gunicorn.conf.py app:app`
     app.run(host="192.168.147.43", port=5002, debug=True)
@@ -0,0 +1,74 @@
+"""Extraction of the 26 features the deepfake model was trained on.
+
+Every spectral feature in dataset/shuffled_file.csv is a frame mean computed by
+librosa with its defaults (n_fft=2048, hop_length=512, centered Hann STFT).
+Instead of letting each librosa.feature call recompute that STFT, we compute the
+magnitude spectrogram once and pass it (or its square) to every feature.
+RMS and zero-crossing rate are time-domain frame statistics and stay on `y`.
+"""
+import io
+
+import numpy as np
+import librosa
+
+N_FFT = 2048
+HOP_LENGTH = 512
+N_MFCC = 20
+
+# Column order of dataset/shuffled_file.csv (minus LABEL); the model and scaler expect exactly this order.
+REQUIRED_FEATURES = [
+                        'chroma_stft', 'rms', 'spectral_centroid', 'spectral_bandwidth',
+                        'rolloff', 'zero_crossing_rate'
+                    ] + [f'mfcc{i + 1}' for i in range(N_MFCC)]
+
+
+def load_audio(source, sr=None):
+    """Decode a path, raw bytes or file-like object to a mono float32 signal; returns (y, sr).
+
+    Bytes are decoded from an in-memory buffer, so uploads never need a temp file.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    return librosa.load(source, sr=sr)
+
+
+def magnitude_spectrogram(y):
+    return np.abs(librosa.stft(y, n_fft=N_FFT, hop_length=HOP_LENGTH))
+
+
+def features_from_spectrogram(y, sr, S):
+    """Return the 26 features in REQUIRED_FEATURES order from `y` and its magnitude spectrogram `S`."""
+    power = S ** 2
+    centroid = librosa.feature.spectral_centroid(S=S, sr=sr, n_fft=N_FFT, hop_length=HOP_LENGTH)
+    mel_db = librosa.power_to_db(librosa.feature.melspectrogram(S=power, sr=sr))
+    mfccs = librosa.feature.mfcc(S=mel_db, n_mfcc=N_MFCC)
+
+    features = np.empty(len(REQUIRED_FEATURES))
+    features[0] = np.mean(librosa.feature.chroma_stft(S=power, sr=sr))
+    features[1] = np.mean(librosa.feature.rms(y=y, frame_length=N_FFT, hop_length=HOP_LENGTH))
+    features[2] = np.mean(centroid)
+    features[3] = np.mean(librosa.feature.spectral_bandwidth(S=S, sr=sr, centroid=centroid))
+    features[4] = np.mean(librosa.feature.spectral_rolloff(S=S, sr=sr))
+    features[5] = np.mean(librosa.feature.zero_crossing_rate(y, frame_length=N_FFT, hop_length=HOP_LENGTH))
+    features[6:] = np.mean(mfccs, axis=1)
+    return features
+
+
+def extract_features(y, sr):
+    """Return the 26 features of signal `y` as a 1-D ndarray in REQUIRED_FEATURES order."""
+    return features_from_spectrogram(y, sr, magnitude_spectrogram(y))
+
+
+def reference_features(y, sr):
+    """The original one-call-per-feature extractor, kept to check `extract_features` against."""
+    features = [
+        np.mean(librosa.feature.chroma_stft(y=y, sr=sr)),
+        np.mean(librosa.feature.rms(y=y)),
+        np.mean(librosa.feature.spectral_centroid(y=y, sr=sr)),
+        np.mean(librosa.feature.spectral_bandwidth(y=y, sr=sr)),
+        np.mean(librosa.feature.spectral_rolloff(y=y, sr=sr)),
+        np.mean(librosa.feature.zero_crossing_rate(y)),
+    ]
+    mfccs = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=N_MFCC)
+    features.extend(np.mean(mfccs, axis=1))
+    return np.asarray(features, dtype=np.float64)
@@ -0,0 +1,75 @@
+"""Micro-batching of deepfake inference across concurrent requests.
+
+Each request scores a single 26-feature row, so under concurrent traffic the
+per-call overhead of the model dominates. `MicroBatcher` queues rows from any
+number of request threads and a single worker thread scores them together: a
+batch is flushed as soon as `max_batch_size` rows are waiting or `max_wait_ms`
+after the first row of the batch arrived, whichever comes first. Every caller
+gets back its own score through a Future.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class MicroBatcher:
+    def __init__(self, score_fn, max_batch_size=32, max_wait_ms=2.0):
+        """`score_fn` maps an (n, d) array of rows to n scores in a single vectorized call."""
+        self.score_fn = score_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1e3
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._batches = 0
+        self._rows = 0
+        self._worker = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, row):
+        """Queue one feature row; returns a Future resolving to its score."""
+        future = Future()
+        self._queue.put((np.asarray(row).ravel(), future))
+        return future
+
+    def score(self, row, timeout=None):
+        """Score one feature row, blocking until its batch has been evaluated."""
+        return self.submit(row).result(timeout=timeout)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            futures = [future for _, future in batch]
+            try:
+                scores = np.asarray(self.score_fn(np.stack([row for row, _ in batch]))).ravel()
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+            else:
+                for future, score in zip(futures, scores):
+                    future.set_result(float(score))
+            with self._lock:
+                self._batches += 1
+                self._rows += len(batch)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "batches": self._batches,
+                "rows": self._rows,
+                "mean_batch_size": self._rows / self._batches if self._batches else 0.0,
+                "pending": self._queue.qsize(),
+            }
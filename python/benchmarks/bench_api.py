@@ -0,0 +1,249 @@
+"""End-to-end load test of the Flask API with local stand-ins for the remote services.
+
+Drives the real app (through Flask's test client, one per thread) with
+VOICEPAY_STORAGE=local:<tmp> instead of Cloudinary and, in place of AssemblyAI,
+an EchoTranscriber that reports the expected prompt after an optional delay, so
+it runs offline. The echo transcriber only exists here: the server cannot be
+configured to skip the spoken-prompt check. Each virtual user runs the full flow:
+/get_sentences, /verify_speech for each of the 3 prompts, then
+/create_voice_signature. Synthetic clips keep one voice per user and give each
+prompt and the signature a different take (its own pitch contour, envelope and
+noise), so the replay check runs as it does in production. The bundled
+test_audio.wav can only be replayed, so `--audio bundled` turns that check off.
+
+The trained detector scores these clips FAKE, which would end every flow at the
+first /verify_speech. So the benchmark runs the real feature extraction and
+inference but accepts every clip, and each flow goes through enrollment and the
+signature (embed, voice_match, persist). --real-verdicts keeps the model's
+verdicts, to measure the rejection path instead.
+
+Reports throughput, p50/p95/p99 latency and status codes per endpoint, plus the
+per-stage timings recorded by instrumentation.span (decode, vad, features, inference,
+transcribe, match, embed, voice_match, encrypt, upload, persist). Results can be stored as a baseline and later
+runs compared against it; a p95 or throughput regression beyond --tolerance exits
+non-zero.
+
+Usage (from python/; needs a trained artifact, see train_deepfake.py):
+    python benchmarks/bench_api.py [--users 32] [--concurrency 8] [--audio synthetic|bundled]
+        [--real-verdicts] [--save-baseline] [--compare] [--baseline benchmarks/baselines/bench_api.json]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from deepfake_proper import LABEL_DISPLAY  # noqa: E402
+from transcription import Transcriber  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(BASE_DIR, "benchmarks", "baselines", "bench_api.json")
+ENDPOINTS = ("/get_sentences", "/verify_speech", "/create_voice_signature")
+
+
+class EchoTranscriber(Transcriber):
+    """No speech recognition at all: "hears" the expected prompt after `latency` seconds."""
+    name = "echo"
+
+    def __init__(self, latency=0.0):
+        self.latency = latency  # Seconds, to stand in for the remote service
+
+    def transcribe(self, audio, expected_text=None):
+        if self.latency:
+            time.sleep(self.latency)
+        return expected_text.strip().lower() if expected_text else None
+
+
+def accept_every_clip(detector):
+    """Keep the detector's features and inference but label every score REAL, so flows run to the end."""
+    detector.label_for = lambda score: (LABEL_DISPLAY["REAL"], 1.0)
+    return detector
+
+
+def synthetic_clip(seed, take=0, seconds=3.0, sr=16000):
+    """A voiced-sounding clip (harmonics with vibrato and noise) as 16-bit WAV bytes.
+
+    `seed` picks the voice; each `take` of it has its own intonation, so its fingerprint is not a replay.
+    """
+    voice, rng = np.random.default_rng(seed), np.random.default_rng([seed, take])
+    t = np.arange(int(seconds * sr)) / sr
+    pitch = voice.uniform(100, 220)
+    intonation = rng.uniform(0.02, 0.04) * np.sin(2 * np.pi * rng.uniform(0.5, 1.5) * t + rng.uniform(0, 2 * np.pi))
+    f0 = pitch * (1 + intonation) * (1 + 0.02 * np.sin(2 * np.pi * 5 * t))
+    phase = 2 * np.pi * np.cumsum(f0) / sr
+    y = sum(np.sin(k * phase) / k for k in range(1, 8))
+    syllables = voice.uniform(2, 4)
+    y *= 0.5 * (1 + np.sin(2 * np.pi * syllables * t + rng.uniform(0, 2 * np.pi)))  # Syllable-like envelope
+    y = 0.3 * y / np.max(np.abs(y)) + 0.005 * rng.standard_normal(len(t))
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sr)
+        f.writeframes((np.clip(y, -1, 1) * 32767).astype("<i2").tobytes())
+    return buffer.getvalue()
+
+
+def run_user(server, username, clips):
+    """Run one enrollment + signature flow with a clip per prompt and one for the signature.
+
+    Returns [(endpoint, status, latency_ms), ...].
+    """
+    client = server.app.test_client()
+    results = []
+
+    def call(endpoint, **kwargs):
+        start = time.perf_counter()
+        response = client.post(endpoint, **kwargs)
+        results.append((endpoint, response.status_code, (time.perf_counter() - start) * 1e3))
+        return response
+
+    call("/get_sentences", json={"username": username})
+    for clip in clips[:3]:
+        response = call("/verify_speech",
+                        data={"username": username, "audio": (io.BytesIO(clip), "clip.wav")},
+                        content_type="multipart/form-data")
+        if response.status_code != 200:
+            return results  # Deepfake verdict or failure ends the flow, as in the app
+    call("/create_voice_signature",
+         data={"username": username, "audio": (io.BytesIO(clips[3]), "signature.wav")},
+         content_type="multipart/form-data")
+    return results
+
+
+def summarize(latencies):
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {"count": len(latencies), "mean_ms": float(np.mean(latencies)),
+            "p50_ms": float(p50), "p95_ms": float(p95), "p99_ms": float(p99)}
+
+
+def compare(report, baseline, tolerance):
+    """Return human-readable regressions of `report` against `baseline`."""
+    regressions = []
+    if report["throughput_rps"] < baseline["throughput_rps"] * (1 - tolerance):
+        regressions.append(f"throughput {report['throughput_rps']:.1f} < baseline {baseline['throughput_rps']:.1f} rps")
+    for endpoint, stats in report["endpoints"].items():
+        reference = baseline["endpoints"].get(endpoint)
+        if reference and stats["p95_ms"] > reference["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{endpoint} p95 {stats['p95_ms']:.1f} > baseline {reference['p95_ms']:.1f} ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=32)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--audio", choices=["synthetic", "bundled"], default="synthetic")
+    parser.add_argument("--transcriber-latency", type=float, default=0.0,
+                        help="Seconds the echo transcriber sleeps, to model the remote service")
+    parser.add_argument("--real-verdicts", action="store_true",
+                        help="Keep the detector's verdicts (synthetic clips are rejected as FAKE)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression")
+    parser.add_argument("--verbose", action="store_true", help="Keep the app's own log output")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="voicepay-bench-")
+    os.environ.update({
+        "VOICEPAY_STORAGE": f"local:{os.path.join(tmp, 'storage')}",
+        "VOICEPAY_EMBEDDING_DB": os.path.join(tmp, "embeddings.sqlite3"),
+        "VOICEPAY_SESSION_STORE": "memory",
+        # The bundled clip is the same recording for every prompt and user, which the replay check rejects
+        "VOICEPAY_FINGERPRINT": "0" if args.audio == "bundled" else "1",
+        "VOICEPAY_FINGERPRINT_DIR": os.path.join(tmp, "fingerprints"),
+        "VOICEPAY_WARM_UP": "0",  # Warmed up below, once the echo transcriber is registered
+        "VOICEPAY_LOG_LEVEL": "INFO" if args.verbose else "WARNING",
+    })
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with quiet:
+        import app as server
+        import instrumentation
+
+        server.models.register("transcriber", lambda: EchoTranscriber(args.transcriber_latency))
+        if not args.real_verdicts:
+            server.models.register("deepfake", lambda: accept_every_clip(server.build_deepfake_detector()))
+        server.warm_up()  # Model loading is not part of request latency
+
+    if args.audio == "bundled":
+        with open(os.path.join(BASE_DIR, "test_audio.wav"), "rb") as f:
+            bundled = f.read()
+        clips = [[bundled] * 4] * (args.users + 1)
+    else:
+        clips = [[synthetic_clip(seed, take) for take in range(4)] for seed in range(args.users + 1)]
+
+    # One untimed flow (with its own voice) warms up librosa/numba caches
+    with quiet:
+        run_user(server, "warmup-user", clips[args.users])
+    instrumentation.reset()
+
+    started = time.perf_counter()
+    with quiet, ThreadPoolExecutor(args.concurrency) as pool:
+        flows = list(pool.map(lambda i: run_user(server, f"bench-user-{i}", clips[i]), range(args.users)))
+        server.persistence_queue.join()  # Count background uploads in the run
+    wall = time.perf_counter() - started
+
+    results = [result for flow in flows for result in flow]
+    report = {
+        "config": {"users": args.users, "concurrency": args.concurrency, "audio": args.audio,
+                   "transcriber_latency": args.transcriber_latency,
+                   "real_verdicts": args.real_verdicts,
+                   "python": platform.python_version(), "machine": platform.machine()},
+        "requests": len(results),
+        "wall_seconds": wall,
+        "throughput_rps": len(results) / wall,
+        "endpoints": {},
+        "status_codes": {},
+        "stages": instrumentation.snapshot(),
+    }
+    for endpoint in ENDPOINTS:
+        latencies = [ms for name, _, ms in results if name == endpoint]
+        if latencies:
+            report["endpoints"][endpoint] = summarize(latencies)
+            codes = [status for name, status, _ in results if name == endpoint]
+            report["status_codes"][endpoint] = {str(code): codes.count(code) for code in sorted(set(codes))}
+
+    print(f"{report['requests']} requests from {args.users} users at concurrency {args.concurrency} "
+          f"in {wall:.2f}s: {report['throughput_rps']:.1f} req/s\n")
+    print(f"{'endpoint':>24} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}  status codes")
+    for endpoint, stats in report["endpoints"].items():
+        print(f"{endpoint:>24} {stats['count']:>6} {stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} "
+              f"{stats['p99_ms']:>9.1f}  {report['status_codes'][endpoint]}")
+    print(f"\n{'stage':>24} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'total s':>9}")
+    for stage, stats in report["stages"].items():
+        print(f"{stage:>24} {stats['count']:>6} {stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} "
+              f"{stats['p99_ms']:>9.1f} {stats['total_ms'] / 1e3:>9.2f}")
+
+    failed = False
+    if args.compare:
+        if not os.path.exists(args.baseline):
+            print(f"\n⚠ No baseline at {args.baseline}; run with --save-baseline first.")
+        else:
+            with open(args.baseline) as f:
+                regressions = compare(report, json.load(f), args.tolerance)
+            for regression in regressions:
+                print(f"❌ Regression: {regression}")
+            if not regressions:
+                print(f"\n✅ Within {args.tolerance:.0%} of the baseline")
+            failed = bool(regressions)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n✅ Saved baseline to {args.baseline}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
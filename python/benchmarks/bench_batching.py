@@ -0,0 +1,80 @@
+"""Load test of deepfake inference with and without micro-batching.
+
+Concurrent client threads each score feature rows taken from the dataset, once
+calling the detector directly per row and once through a MicroBatcher. Reports
+per-request p50/p99 latency and overall throughput for each mode.
+
+Usage (from python/):
+    python benchmarks/bench_batching.py [--backend numpy|keras] [--clients 16] [--requests 200]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batching import MicroBatcher  # noqa: E402
+from deepfake_proper import DEFAULT_ARTIFACT_DIR, DEFAULT_DATASET_PATH, DeepfakeDetector  # noqa: E402
+
+
+def run_load(score_one, rows, clients, requests_per_client):
+    latencies = [[] for _ in range(clients)]
+    barrier = threading.Barrier(clients + 1)
+
+    def client(i):
+        barrier.wait()
+        for j in range(requests_per_client):
+            row = rows[(i * requests_per_client + j) % len(rows)]
+            start = time.perf_counter()
+            score_one(row)
+            latencies[i].append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    all_latencies = np.concatenate([np.array(l) for l in latencies]) * 1e3
+    return all_latencies, len(all_latencies) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--artifact", default=DEFAULT_ARTIFACT_DIR)
+    parser.add_argument("--csv", default=DEFAULT_DATASET_PATH)
+    parser.add_argument("--backend", default="numpy", choices=["numpy", "keras"])
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200, help="Requests per client.")
+    parser.add_argument("--max-batch-size", type=int, default=32)
+    parser.add_argument("--window-ms", type=float, default=2.0)
+    args = parser.parse_args()
+
+    detector = DeepfakeDetector.load(args.artifact, backend=args.backend)
+    rows = detector.scale(pd.read_csv(args.csv)[detector.feature_names].values[:4096])
+    batcher = MicroBatcher(detector.score_batch, max_batch_size=args.max_batch_size, max_wait_ms=args.window_ms)
+
+    modes = {
+        "unbatched": lambda row: float(detector.score_batch(row[None, :])[0]),
+        "batched": batcher.score,
+    }
+    print(f"{args.backend} backend, {args.clients} clients x {args.requests} requests, "
+          f"batch <= {args.max_batch_size} rows / {args.window_ms} ms window")
+    print(f"{'mode':>10} {'p50 ms':>9} {'p99 ms':>9} {'req/s':>10}")
+    for name, score_one in modes.items():
+        run_load(score_one, rows, args.clients, min(10, args.requests))  # warm-up
+        latencies, throughput = run_load(score_one, rows, args.clients, args.requests)
+        print(f"{name:>10} {np.percentile(latencies, 50):>9.3f} {np.percentile(latencies, 99):>9.3f} "
+              f"{throughput:>10.0f}")
+    print(f"batcher: {batcher.stats()}")
+
+
+if __name__ == "__main__":
+    main()
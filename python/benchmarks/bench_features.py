@@ -0,0 +1,67 @@
+"""Tolerance check and timing of the single-pass feature extractor.
+
+Compares audio_features.extract_features against the original
+one-call-per-feature extractor on each input file, fails if any of the 26
+features differs by more than the tolerance, and reports per-call time.
+
+Usage (from python/):
+    python benchmarks/bench_features.py [audio ...] [--repeat 20]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import librosa
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_features import REQUIRED_FEATURES, extract_features, reference_features  # noqa: E402
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_AUDIO = os.path.join(BASE_DIR, "test_audio.wav")
+
+# Both extractors run the same librosa kernels, so only float rounding should differ.
+RTOL = 1e-4
+ATOL = 1e-5
+
+
+def best_time(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("audio", nargs="*", default=[DEFAULT_AUDIO])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    failed = False
+    for path in args.audio:
+        y, sr = librosa.load(path, sr=None)
+        expected = reference_features(y, sr)
+        actual = extract_features(y, sr)
+        mismatched = ~np.isclose(actual, expected, rtol=RTOL, atol=ATOL)
+        for i in np.flatnonzero(mismatched):
+            print(f"  {REQUIRED_FEATURES[i]}: expected {expected[i]:.6f}, got {actual[i]:.6f}")
+        failed |= bool(mismatched.any())
+
+        reference_ms = best_time(lambda: reference_features(y, sr), args.repeat)
+        single_pass_ms = best_time(lambda: extract_features(y, sr), args.repeat)
+        print(f"{os.path.basename(path)} ({len(y) / sr:.2f}s @ {sr} Hz): "
+              f"max rel diff {np.max(np.abs(actual - expected) / (np.abs(expected) + ATOL)):.2e}, "
+              f"reference {reference_ms:.1f} ms, single-pass {single_pass_ms:.1f} ms "
+              f"({reference_ms / single_pass_ms:.2f}x)")
+
+    if failed:
+        sys.exit(f"Single-pass features are outside rtol={RTOL}, atol={ATOL} of the reference extractor.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""Replay detection accuracy and lookup latency of the fingerprint index (fingerprint.py).
+
+Builds an index of synthetic recordings in a temporary directory. Their hashes
+draw each frequency bin and frame gap from the hashes of the real clips, so
+posting lists are as lopsided as speech makes them. They are written straight
+into a snapshot, sorted one range of hashes at a time so a million recordings
+(~450M postings, 6 GB) do not have to fit in memory; the log holds them only as
+a sparse prefix. The real clips are then indexed through the log. The script
+reports:
+
+- load time and size of the index;
+- for every clip, the best match of replayed variants (exact, quieter, noisy,
+  resampled, cut) and of unrelated audio (reversed, pitch-shifted, noise).
+  It fails if a variant is missed or unrelated audio is flagged;
+- fingerprinting time and lookup latency percentiles.
+
+Usage (from python/):
+    python benchmarks/bench_fingerprint.py [audio.wav ...] [--recordings 1000000] [--lookups 2000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import librosa
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fingerprint import (BUCKET_POSTINGS, BUCKETS_FILE, POSTING, POSTINGS_FILE, SNAPSHOT_PREFIX,  # noqa: E402
+                         FingerprintIndex, fingerprint, landmarks, spread)
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_AUDIO = os.path.join(BASE_DIR, "test_audio.wav")
+
+
+def replays(y, sr, rng):
+    noise = np.sqrt(np.mean(y ** 2))
+    return {
+        "exact": y,
+        "-6 dB": y * 0.5,
+        "20 dB SNR": y + rng.normal(0, noise / 10, len(y)).astype(np.float32),
+        "10 dB SNR": y + rng.normal(0, noise / np.sqrt(10), len(y)).astype(np.float32),
+        "16 kHz round trip": librosa.resample(librosa.resample(y, orig_sr=sr, target_sr=16000),
+                                              orig_sr=16000, target_sr=sr),
+        "starts 0.1 s late": y[int(0.1 * sr):],
+        "middle half": y[len(y) // 4:3 * len(y) // 4],
+    }
+
+
+def unrelated(y, sr, rng):
+    return {
+        "reversed": y[::-1].copy(),
+        "pitch +2": librosa.effects.pitch_shift(y, sr=sr, n_steps=2),
+        "white noise": rng.normal(0, 0.1, len(y)).astype(np.float32),
+    }
+
+
+def synthetic_postings(clip_landmarks, n_recordings, rng, block=10000):
+    """Blocks of postings of `n_recordings` synthetic recordings shaped like the real clips' landmarks."""
+    codes = np.concatenate([code for code, _ in clip_landmarks]).astype(np.int64)
+    # (shift, mask) of the three bins and two frame gaps in a packed landmark
+    fields = [(30, 0x1FF), (21, 0x1FF), (12, 0x1FF), (6, 0x3F), (0, 0x3F)]
+    values = [(codes >> shift) & mask for shift, mask in fields]
+    per_recording = int(np.mean([len(code) for code, _ in clip_landmarks]))
+    for start in range(0, n_recordings, block):
+        count = min(block, n_recordings - start) * per_recording
+        postings = np.empty(count, dtype=POSTING)
+        postings["hash"] = spread(np.bitwise_or.reduce(
+            [rng.choice(value, count) << shift for value, (shift, _) in zip(values, fields)]))
+        postings["recording"] = 1_000_000_000 + start + np.arange(count) // per_recording
+        postings["frame"] = rng.integers(0, 400, count)
+        yield postings
+
+
+def write_synthetic_snapshot(index_dir, blocks, partition_bits=8):
+    """Write `blocks` of postings as the index's snapshot, the way FingerprintIndex lays one out.
+
+    Postings are split into files by the top bits of their hash, then each file is sorted on its own.
+    The log gets a sparse prefix of as many records, which the snapshot stands for.
+    """
+    partitions = [os.path.join(index_dir, f"partition-{p}.bin") for p in range(1 << partition_bits)]
+    files = [open(path, "wb") for path in partitions]
+    total = 0
+    for postings in blocks:
+        top = (postings["hash"] >> np.uint64(64 - partition_bits)).astype(np.int64)
+        order = np.argsort(top, kind="stable")
+        bounds = np.searchsorted(top[order], np.arange(len(files) + 1))
+        for f, lo, hi in zip(files, bounds[:-1], bounds[1:]):
+            postings[order[lo:hi]].tofile(f)
+        total += len(postings)
+    for f in files:
+        f.close()
+
+    bits = max(partition_bits, (total // BUCKET_POSTINGS).bit_length())
+    staging_dir = os.path.join(index_dir, "staging")
+    os.makedirs(staging_dir)
+    columns = {name: np.lib.format.open_memmap(os.path.join(staging_dir, f"{name}.npy"), mode="w+",
+                                               dtype=POSTING[name], shape=(total,))
+               for name in ("hash", "recording", "frame")}
+    buckets = np.lib.format.open_memmap(os.path.join(staging_dir, BUCKETS_FILE), mode="w+", dtype=np.int64,
+                                        shape=((1 << bits) + 1,))
+    buckets[0] = 0
+    row, per_partition = 0, 1 << (bits - partition_bits)
+    for p, path in enumerate(partitions):
+        postings = np.fromfile(path, dtype=POSTING)
+        os.remove(path)
+        postings = postings[np.argsort(postings["hash"], kind="stable")]
+        for name, column in columns.items():
+            column[row:row + len(postings)] = postings[name]
+        local = (postings["hash"] >> np.uint64(64 - bits)).astype(np.int64) - p * per_partition
+        buckets[p * per_partition + 1:(p + 1) * per_partition + 1] = \
+            row + np.cumsum(np.bincount(local, minlength=per_partition))
+        row += len(postings)
+    for array in list(columns.values()) + [buckets]:
+        array.flush()
+    del columns, buckets
+    os.rename(staging_dir, os.path.join(index_dir, f"{SNAPSHOT_PREFIX}{total:012d}"))
+    with open(os.path.join(index_dir, POSTINGS_FILE), "wb") as f:
+        f.truncate(total * POSTING.itemsize)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("audio", nargs="*", default=[DEFAULT_AUDIO])
+    parser.add_argument("--recordings", type=int, default=1000000, help="Synthetic recordings in the index.")
+    parser.add_argument("--lookups", type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    clips = [librosa.load(path, sr=None) for path in args.audio]
+    fingerprints = [fingerprint(y, sr) for y, sr in clips]
+
+    with tempfile.TemporaryDirectory() as index_dir:
+        start = time.perf_counter()
+        write_synthetic_snapshot(index_dir, synthetic_postings([landmarks(y, sr) for y, sr in clips],
+                                                               args.recordings, rng))
+        print(f"Snapshot of {args.recordings} synthetic recordings written in {time.perf_counter() - start:.0f}s")
+        start = time.perf_counter()
+        index = FingerprintIndex(index_dir)
+        print(f"Index of {index.stats()['postings']} postings loaded in {time.perf_counter() - start:.1f}s")
+        for path, (hashes, frames) in zip(args.audio, fingerprints):
+            index.add(os.path.basename(path), 1, hashes, frames)
+
+        failed = False
+        fingerprint_ms, queries = [], []
+        for path, (y, sr) in zip(args.audio, clips):
+            print(f"{os.path.basename(path)} ({len(y) / sr:.2f}s @ {sr} Hz)")
+            for expected, variants in ((True, replays(y, sr, rng)), (False, unrelated(y, sr, rng))):
+                for name, variant in variants.items():
+                    start = time.perf_counter()
+                    query = fingerprint(variant, sr)
+                    fingerprint_ms.append((time.perf_counter() - start) * 1e3)
+                    queries.append(query)
+                    match = index.find_duplicate(*query)
+                    failed |= (match is not None) != expected
+                    found = f"{match.votes} votes ({match.ratio:.0%} of {len(query[0])} hashes)" if match else "-"
+                    print(f"  {'replay' if expected else 'other':>6} {name:<18} {found}"
+                          + ("" if (match is not None) == expected else "  <-- wrong"))
+
+        latencies = []
+        for i in range(args.lookups):
+            start = time.perf_counter()
+            index.find_duplicate(*queries[i % len(queries)])
+            latencies.append((time.perf_counter() - start) * 1e3)
+        p50, p99 = np.percentile(latencies, [50, 99])
+        print(f"fingerprint {np.median(fingerprint_ms):.1f} ms per clip; "
+              f"lookup p50 {p50:.3f} ms, p99 {p99:.3f} ms")
+
+    if failed:
+        sys.exit("A replay was missed or unrelated audio was flagged.")
+
+
+if __name__ == "__main__":
+    main()
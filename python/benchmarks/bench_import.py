@@ -0,0 +1,95 @@
+"""Import time of the server, and a guard against heavy imports creeping back in.
+
+Imports app.py in a fresh interpreter (with local storage and throwaway stores,
+so nothing touches the network) and reports the wall-clock import time and the
+slowest top-level imports from `-X importtime`. Exits non-zero if any of the
+lazily loaded frameworks (TensorFlow, torch, speechbrain) was imported, or if
+the import took longer than --budget seconds.
+
+Usage (from python/):
+    python benchmarks/bench_import.py [--module app] [--budget 10] [--repeat 3]
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FORBIDDEN = ("tensorflow", "keras", "torch", "torchaudio", "speechbrain")
+
+PROBE = """
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+loaded = sorted({{name.split(".")[0] for name in sys.modules}} & set({forbidden!r}))
+print("RESULT", elapsed, ",".join(loaded))
+"""
+
+
+def run_once(module, env, importtime=False):
+    command = [sys.executable]
+    if importtime:
+        command += ["-X", "importtime"]
+    command += ["-c", PROBE.format(module=module, forbidden=FORBIDDEN)]
+    proc = subprocess.run(command, cwd=BASE_DIR, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{proc.stderr[-2000:]}")
+    line = next(line for line in proc.stdout.splitlines() if line.startswith("RESULT"))
+    _, elapsed, loaded = line.split(" ", 2)  # `loaded` is "" when nothing heavy was imported
+    return float(elapsed), [name for name in loaded.split(",") if name], proc.stderr
+
+
+def slowest_imports(importtime_log, top=10):
+    """Top-level packages by cumulative import time from a `-X importtime` log."""
+    rows = []
+    for line in importtime_log.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \|( *)(\S+)", line)
+        if match and len(match.group(2)) <= 1:  # Only imports done directly by the probe
+            rows.append((int(match.group(1)) / 1e6, match.group(3)))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--budget", type=float, default=10.0, help="Maximum import time in seconds")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ,
+                   VOICEPAY_STORAGE=f"local:{os.path.join(tmp, 'storage')}",
+                   VOICEPAY_EMBEDDING_DB=os.path.join(tmp, "embeddings.sqlite3"),
+                   VOICEPAY_SESSION_STORE="memory",
+                   VOICEPAY_WARM_UP="0")
+        timings, loaded = [], set()
+        for _ in range(args.repeat):
+            elapsed, heavy, _ = run_once(args.module, env)
+            timings.append(elapsed)
+            loaded.update(heavy)
+        _, _, log = run_once(args.module, env, importtime=True)
+
+    best = min(timings)
+    print(f"import {args.module}: best {best:.2f}s, mean {sum(timings) / len(timings):.2f}s "
+          f"over {len(timings)} fresh interpreters")
+    print("\nslowest direct imports:")
+    for seconds, name in slowest_imports(log):
+        print(f"  {seconds:>7.3f}s  {name}")
+
+    failed = False
+    if loaded:
+        print(f"\n❌ Heavy frameworks imported at import time: {', '.join(sorted(loaded))}")
+        failed = True
+    if best > args.budget:
+        print(f"\n❌ Import took {best:.2f}s, over the {args.budget:.2f}s budget")
+        failed = True
+    if not failed:
+        print("\n✅ No heavy frameworks imported, within budget")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Parity check and per-call latency of the deepfake inference backends.
+
+Rebuilds the held-out X_test split used by train_deepfake.py, checks that the
+NumPy backend agrees with Keras on it, then times single-row predict() calls
+on each backend.
+
+Usage (from python/):
+    python benchmarks/bench_inference.py [--artifact models/deepfake] [--calls 2000]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from deepfake_proper import DEFAULT_ARTIFACT_DIR, DEFAULT_DATASET_PATH, DeepfakeDetector  # noqa: E402
+from train_deepfake import NUMPY_PARITY_TOLERANCE, SEED  # noqa: E402
+
+
+def held_out_split(detector, csv_path):
+    from sklearn.model_selection import train_test_split
+
+    df = pd.read_csv(csv_path)
+    X = detector.scale(df[detector.feature_names].values)
+    y = (df["LABEL"].values == detector.label_classes[1]).astype(int)
+    _, X_test, _, y_test = train_test_split(X, y, test_size=0.2, random_state=SEED)
+    return X_test, y_test
+
+
+def time_single_row(detector, rows, calls):
+    timings = np.empty(calls)
+    for i in range(calls):
+        row = rows[i % len(rows)][None, :]
+        start = time.perf_counter()
+        detector.model.predict(row)
+        timings[i] = time.perf_counter() - start
+    return timings * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--artifact", default=DEFAULT_ARTIFACT_DIR)
+    parser.add_argument("--csv", default=DEFAULT_DATASET_PATH)
+    parser.add_argument("--calls", type=int, default=2000)
+    args = parser.parse_args()
+
+    backends = {name: DeepfakeDetector.load(args.artifact, backend=name) for name in ("keras", "numpy")}
+    X_test, y_test = held_out_split(backends["numpy"], args.csv)
+
+    keras_scores = backends["keras"].model.predict(X_test)
+    numpy_scores = backends["numpy"].model.predict(X_test)
+    max_abs_diff = float(np.max(np.abs(keras_scores - numpy_scores)))
+    for name, scores in (("keras", keras_scores), ("numpy", numpy_scores)):
+        accuracy = np.mean((scores[:, 0] >= 0.5).astype(int) == y_test)
+        print(f"{name:>6} accuracy on X_test ({len(X_test)} rows): {accuracy:.4f}")
+    print(f"max |keras - numpy| on X_test: {max_abs_diff:.2e} (tolerance {NUMPY_PARITY_TOLERANCE:.0e})")
+
+    print(f"\nsingle-row predict latency over {args.calls} calls (µs):")
+    print(f"{'backend':>8} {'mean':>10} {'p50':>10} {'p99':>10}")
+    for name, detector in backends.items():
+        time_single_row(detector, X_test, min(50, args.calls))  # warm-up
+        timings = time_single_row(detector, X_test, args.calls)
+        print(f"{name:>8} {timings.mean():>10.1f} {np.percentile(timings, 50):>10.1f} "
+              f"{np.percentile(timings, 99):>10.1f}")
+
+    if max_abs_diff > NUMPY_PARITY_TOLERANCE:
+        sys.exit("NumPy backend is out of tolerance against Keras.")
+
+
+if __name__ == "__main__":
+    main()
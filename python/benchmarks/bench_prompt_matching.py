@@ -0,0 +1,108 @@
+"""Retry rate of each prompt-matching policy on simulated transcripts.
+
+Every prompt in app.SENTENCES is turned into transcripts the way a speech-to-text
+service tends to mangle them (casing, punctuation, one misheard word, a dropped
+or doubled word, swapped words) and into impostor transcripts (a different
+prompt, the prompt truncated to its first half). For each policy we report:
+
+- retry rate: genuine readings that were rejected, i.e. the user has to re-record
+- false accept rate: impostor transcripts that were accepted
+- read-sentence accuracy: how often `best_match` names the prompt actually read
+
+Usage (from python/):
+    python benchmarks/bench_prompt_matching.py [--threshold 0.9] [--seed 42]
+"""
+import argparse
+import ast
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from prompt_matching import POLICIES, SentenceIndex  # noqa: E402
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_sentences():
+    """SENTENCES from app.py, read without importing the app (and its models)."""
+    with open(os.path.join(BASE_DIR, "app.py"), encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(getattr(t, "id", None) == "SENTENCES" for t in node.targets):
+            return ast.literal_eval(node.value)
+    raise RuntimeError("SENTENCES not found in app.py")
+
+
+def misspell(word, rng):
+    if len(word) < 4:
+        return word + word[-1]
+    i = rng.randrange(1, len(word) - 1)
+    return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+
+
+def genuine_variants(sentence, rng):
+    """Transcripts a service could return for a correct reading of `sentence`."""
+    lowered = sentence.strip().lower()
+    words = lowered.rstrip(".").split()
+    i = rng.randrange(len(words))
+    misheard = words[:i] + [misspell(words[i], rng)] + words[i + 1:]
+    doubled = words[:i + 1] + [words[i]] + words[i + 1:]
+    j = rng.randrange(len(words) - 1)
+    swapped = words[:j] + [words[j + 1], words[j]] + words[j + 2:]
+    return {
+        "verbatim": lowered,
+        "no punctuation": " ".join(words),
+        "capitalized": sentence,
+        "extra spaces": "  ".join(words) + " .",
+        "misheard word": " ".join(misheard) + ".",
+        "doubled word": " ".join(doubled) + ".",
+        "swapped words": " ".join(swapped) + ".",
+    }
+
+
+def impostor_variants(sentence, others, rng):
+    """Transcripts that must not count as a reading of `sentence`."""
+    words = sentence.strip().lower().rstrip(".").split()
+    return {
+        "other prompt": rng.choice(others).lower(),
+        "first half only": " ".join(words[:len(words) // 2]) + ".",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threshold", type=float, default=0.9)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    sentences = load_sentences()
+    genuine, impostor = [], []
+    for sentence in sentences:
+        others = [s for s in sentences if s != sentence]
+        genuine += [(kind, text, sentence) for kind, text in genuine_variants(sentence, rng).items()]
+        impostor += [(kind, text, sentence) for kind, text in impostor_variants(sentence, others, rng).items()]
+
+    print(f"{len(sentences)} prompts, {len(genuine)} genuine and {len(impostor)} impostor transcripts, "
+          f"threshold {args.threshold}\n")
+    print(f"{'policy':>10} {'retry %':>8} {'false accept %':>15} {'read-sentence %':>16} {'us/match':>9}")
+    for policy in POLICIES:
+        index = SentenceIndex(sentences, policy=policy, threshold=args.threshold)
+        start = time.perf_counter()
+        rejected = [kind for kind, text, expected in genuine if not index.matches(text, expected.strip().lower())]
+        elapsed = time.perf_counter() - start
+        accepted = [kind for kind, text, expected in impostor if index.matches(text, expected.strip().lower())]
+        identified = sum(index.best_match(text)[0] == expected for _, text, expected in genuine)
+        print(f"{policy:>10} {100 * len(rejected) / len(genuine):>8.1f} "
+              f"{100 * len(accepted) / len(impostor):>15.1f} {100 * identified / len(genuine):>16.1f} "
+              f"{1e6 * elapsed / len(genuine):>9.1f}")
+        retried_kinds = sorted(set(rejected))
+        if retried_kinds:
+            print(f"{'':>10} retries on: {', '.join(retried_kinds)}")
+
+
+if __name__ == "__main__":
+    main()
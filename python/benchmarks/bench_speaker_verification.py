@@ -0,0 +1,147 @@
+"""Speaker verification latency: embedding extraction per embedder, then scoring.
+
+Embedding: each available embedder (ECAPA needs speechbrain/torch and downloads
+the model on first use) embeds test_audio.wav from a fresh RequestAudio, as a
+request would.
+
+Trimming: each embedder embeds the clip and copies of it with added leading
+and/or trailing room noise, with and without the server's SpeechTrimmer. It
+reports each copy's cosine score against the clip embedded the same way. The
+check fails (exit status 1) if any trimmed score is below the verification
+threshold, or more than --tolerance below the untrimmed score. It also times the
+one-time re-embedding of a user's 3 enrollment recordings after VAD changes the
+embedding kind; downloads are not included.
+
+Scoring: a probe against 3 references plus a synthetic impostor cohort of
+growing size, comparing the old per-reference loop (np.dot / norm, no cohort)
+with SpeakerVerifier's single matrix-vector product over references + cohort.
+
+Usage (from python/):
+    python benchmarks/bench_speaker_verification.py [--embedders mfcc_mean ecapa] [--repeat 10] [--tolerance 0.02]
+"""
+import argparse
+import io
+import os
+import sys
+import time
+import wave
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_features import HOP_LENGTH  # noqa: E402
+from request_audio import RequestAudio  # noqa: E402
+from speaker_verification import DEFAULT_THRESHOLD, EMBEDDERS, SpeakerVerifier, l2_normalize  # noqa: E402
+from vad import SpeechTrimmer  # noqa: E402
+from voice_matching import MATCH_SR  # noqa: E402
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def timed(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return result, np.array(timings) * 1e3
+
+
+def wav_bytes(y, sr=MATCH_SR):
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sr)
+        f.writeframes((np.clip(y, -1, 1) * 32767).astype("<i2").tobytes())
+    return buffer.getvalue()
+
+
+def padded_copies(data, rng, noise=0.003):
+    """The clip with (leading, trailing) seconds of low room noise around it, as WAV bytes."""
+    y = RequestAudio(data).resampled(MATCH_SR)
+    copies = {}
+    for lead, trail in ((0.5, 0.5), (2.0, 0.0), (0.0, 2.0), (2.0, 2.0)):
+        padded = np.concatenate([noise * rng.standard_normal(int(lead * MATCH_SR)), y,
+                                 noise * rng.standard_normal(int(trail * MATCH_SR))])
+        copies[(lead, trail)] = wav_bytes(padded)
+    return copies
+
+
+def trimming_check(embedder, data, copies, tolerance, repeat):
+    """Print same-speaker scores with and without trimming; returns the number of failed checks."""
+    trimmer = SpeechTrimmer(align=HOP_LENGTH)  # As the server builds it
+    failures = 0
+    for (lead, trail), copy in copies.items():
+        scores = []
+        for t in (None, trimmer):
+            reference = l2_normalize(embedder.embed(RequestAudio(data, trimmer=t)))[0]
+            scores.append(float(reference @ l2_normalize(embedder.embed(RequestAudio(copy, trimmer=t)))[0]))
+        untrimmed, trimmed = scores
+        ok = trimmed >= DEFAULT_THRESHOLD and trimmed >= untrimmed - tolerance
+        failures += not ok
+        print(f"{embedder.name:>10} {lead:>5.1f}s {trail:>6.1f}s {untrimmed:>10.4f} {trimmed:>10.4f}  "
+              f"{'ok' if ok else 'FAIL'}")
+    _, rebuild_ms = timed(lambda: [embedder.embed(RequestAudio(data, trimmer=trimmer)) for _ in range(3)], repeat)
+    print(f"{embedder.name:>10} re-embedding 3 enrollment recordings: {rebuild_ms.mean():.1f} ms per user")
+    return failures
+
+
+def loop_scores(probe, references):
+    """What compare_with_previous_recordings used to do."""
+    return [np.dot(probe, ref) / (np.linalg.norm(probe) * np.linalg.norm(ref)) for ref in references]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--audio", default=os.path.join(BASE_DIR, "test_audio.wav"))
+    parser.add_argument("--embedders", nargs="+", default=list(EMBEDDERS), choices=list(EMBEDDERS))
+    parser.add_argument("--cohorts", nargs="+", type=int, default=[0, 100, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--tolerance", type=float, default=0.02,
+                        help="How far a trimmed score may fall below the untrimmed one")
+    args = parser.parse_args()
+
+    with open(args.audio, "rb") as f:
+        data = f.read()
+
+    print(f"{'embedder':>10} {'dim':>5} {'first ms':>10} {'mean ms':>10} {'min ms':>10}")
+    dims = {}
+    for name in args.embedders:
+        embedder = EMBEDDERS[name]()
+        try:
+            first, first_ms = timed(lambda: embedder.embed(RequestAudio(data)), 1)  # Includes model loading
+        except Exception as e:
+            print(f"{name:>10} unavailable: {e}")
+            continue
+        _, timings = timed(lambda: embedder.embed(RequestAudio(data)), args.repeat)
+        dims[name] = first.size
+        print(f"{name:>10} {first.size:>5} {first_ms[0]:>10.1f} {timings.mean():>10.1f} {timings.min():>10.1f}")
+
+    copies = padded_copies(data, np.random.default_rng(0))
+    print(f"\n{'embedder':>10} {'lead':>6} {'trail':>7} {'untrimmed':>10} {'trimmed':>10}")
+    failures = sum(trimming_check(EMBEDDERS[name](), data, copies, args.tolerance, args.repeat) for name in dims)
+
+    rng = np.random.default_rng(0)
+    print(f"\n{'embedder':>10} {'cohort':>7} {'loop us':>10} {'matvec us':>10}")
+    for name, dim in dims.items():
+        references = rng.standard_normal((3, dim)).astype(np.float32)
+        probe = references[0] + 0.1 * rng.standard_normal(dim).astype(np.float32)
+        for size in args.cohorts:
+            verifier = SpeakerVerifier(EMBEDDERS[name]())
+            if size:
+                verifier.load_cohort(rng.standard_normal((size, dim)).astype(np.float32),
+                                     [f"user{i}" for i in range(size)])
+            _, loop_ms = timed(lambda: loop_scores(probe, references), args.repeat * 10)
+            (raw, _), vec_ms = timed(lambda: verifier.score(probe, references, "probe"), args.repeat * 10)
+            assert np.allclose(raw, loop_scores(probe, references), atol=1e-5)
+            print(f"{name:>10} {size:>7} {1e3 * loop_ms.mean():>10.1f} {1e3 * vec_ms.mean():>10.1f}")
+
+    if failures:
+        print(f"\n❌ {failures} trimmed score(s) below the threshold or more than {args.tolerance} below untrimmed")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Serial vs concurrent object-storage I/O for the enrollment and verification flows.
+
+Runs both storage-bound parts of a request against LocalStorage with a simulated
+network round-trip per call:
+  - persist: encrypt test_audio.wav and upload the .enc blob and its key
+  - references: download and decrypt a user's three .enc/key pairs
+"serial" issues one call after another, as app.py used to; "concurrent" uses
+put_many/get_many. "vpr" is the single-object format app.py stores now
+(recording_format.py): one compressed, encrypted object per recording, whose
+reference embedding is read from its metadata without decoding the audio.
+
+Usage (from python/):
+    python benchmarks/bench_storage.py [--latency 0.08] [--iterations 20]
+"""
+import argparse
+import base64
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from cryptography.fernet import Fernet
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from recording_format import MasterKeyring, generate_master_key, read_metadata, seal_recording  # noqa: E402
+from request_audio import RequestAudio  # noqa: E402
+from storage import LocalStorage  # noqa: E402
+from voice_matching import mfcc_mean  # noqa: E402
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+USERNAME = "bench_user"
+
+
+def encrypt(data):
+    key = Fernet.generate_key()
+    return Fernet(key).encrypt(data), key
+
+
+def persist_serial(storage, audio, i):
+    encrypted, key = encrypt(audio)
+    storage.put(f"{USERNAME}_{i}.enc", encrypted)
+    storage.put(f"{USERNAME}_key{i}.txt", key)
+
+
+def persist_concurrent(storage, audio, i):
+    encrypted, key = encrypt(audio)
+    storage.put_many({f"{USERNAME}_{i}.enc": encrypted, f"{USERNAME}_key{i}.txt": key})
+
+
+def reference_names():
+    return [name for i in range(1, 4) for name in (f"{USERNAME}_{i}.enc", f"{USERNAME}_key{i}.txt")]
+
+
+def decrypt_all(objects):
+    return [Fernet(objects[f"{USERNAME}_key{i}.txt"]).decrypt(objects[f"{USERNAME}_{i}.enc"]) for i in range(1, 4)]
+
+
+def references_serial(storage):
+    return decrypt_all({name: storage.get(name) for name in reference_names()})
+
+
+def references_concurrent(storage):
+    return decrypt_all(storage.get_many(reference_names()))
+
+
+def persist_vpr(storage, keyring, audio, i):
+    clip = RequestAudio(audio)
+    storage.put(f"{USERNAME}_{i}.vpr", seal_recording(clip, keyring, embeddings={"mfcc_mean": mfcc_mean(clip)}))
+
+
+def references_vpr(storage, keyring):
+    objects = storage.get_many([f"{USERNAME}_{i}.vpr" for i in range(1, 4)])
+    return [read_metadata(blob, keyring)["embeddings"]["mfcc_mean"] for blob in objects.values()]
+
+
+def measure(fn, iterations):
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return np.array(timings) * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency", type=float, default=0.08, help="Simulated seconds per storage call.")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--audio", default=os.path.join(BASE_DIR, "test_audio.wav"))
+    args = parser.parse_args()
+
+    with open(args.audio, "rb") as f:
+        audio = f.read()
+
+    with tempfile.TemporaryDirectory() as root:
+        storage = LocalStorage(root, latency=args.latency)
+        keyring = MasterKeyring([base64.urlsafe_b64decode(generate_master_key())])
+        for i in range(1, 4):
+            persist_concurrent(storage, audio, i)
+            persist_vpr(storage, keyring, audio, i)
+        pair_bytes = os.path.getsize(os.path.join(root, f"{USERNAME}_1.enc")) + \
+            os.path.getsize(os.path.join(root, f"{USERNAME}_key1.txt"))
+        vpr_bytes = os.path.getsize(os.path.join(root, f"{USERNAME}_1.vpr"))
+        print(f"stored per recording: {pair_bytes} bytes in 2 objects (pair), {vpr_bytes} bytes in 1 object (vpr)")
+
+        cases = [
+            ("persist", "serial", lambda: persist_serial(storage, audio, 1)),
+            ("persist", "concurrent", lambda: persist_concurrent(storage, audio, 1)),
+            ("references", "serial", lambda: references_serial(storage)),
+            ("references", "concurrent", lambda: references_concurrent(storage)),
+            ("persist", "vpr", lambda: persist_vpr(storage, keyring, audio, 1)),
+            ("references", "vpr", lambda: references_vpr(storage, keyring)),
+        ]
+        print(f"simulated latency {args.latency * 1e3:.0f} ms/call, {args.iterations} iterations (ms)")
+        print(f"{'stage':>10} {'mode':>10} {'mean':>8} {'p50':>8} {'p95':>8}")
+        for stage, mode, fn in cases:
+            timings = measure(fn, args.iterations)
+            print(f"{stage:>10} {mode:>10} {timings.mean():>8.1f} {np.percentile(timings, 50):>8.1f} "
+                  f"{np.percentile(timings, 95):>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
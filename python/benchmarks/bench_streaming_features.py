@@ -0,0 +1,101 @@
+"""Tolerance check and timing of streamed feature extraction (streaming_audio.py).
+
+Feeds each WAV file to StreamingUpload in chunks of several sizes (odd sizes
+split the header and individual samples) and compares the 26 features with
+audio_features.extract_features on the whole file. Fails if any feature
+differs by more than the tolerance.
+
+Also reports the time spent per chunk while the upload arrives and the time
+from the last chunk to the finished feature row, next to batch extraction.
+The speech-region features (`features(bounds)`) are checked the same way
+against extraction on the trimmed signal, with the hop-aligned trimmer the app
+uses; tests/test_streaming_audio.py runs the same checks under pytest.
+
+Usage (from python/):
+    python benchmarks/bench_streaming_features.py [audio.wav ...] [--chunk-sizes 1021 4096 65536]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import librosa
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_features import HOP_LENGTH, REQUIRED_FEATURES, extract_features  # noqa: E402
+from streaming_audio import StreamingUpload  # noqa: E402
+from vad import SpeechTrimmer  # noqa: E402
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_AUDIO = os.path.join(BASE_DIR, "test_audio.wav")
+
+# The same librosa kernels run on the same frames; only float rounding should differ.
+RTOL = 1e-4
+ATOL = 1e-5
+
+
+def stream(data, chunk_size):
+    """Feed `data` in chunks; returns (upload, mean ms per chunk, ms from the last chunk to the features)."""
+    upload = StreamingUpload()
+    chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+    start = time.perf_counter()
+    for chunk in chunks:
+        upload.feed(chunk)
+    feed_ms = (time.perf_counter() - start) * 1e3 / len(chunks)
+    start = time.perf_counter()
+    upload.finish()
+    upload.features()
+    return upload, feed_ms, (time.perf_counter() - start) * 1e3
+
+
+def max_rel_diff(actual, expected):
+    return float(np.max(np.abs(actual - expected) / (np.abs(expected) + ATOL)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("audio", nargs="*", default=[DEFAULT_AUDIO])
+    parser.add_argument("--chunk-sizes", type=int, nargs="+", default=[1021, 4096, 65536])
+    args = parser.parse_args()
+
+    trimmer = SpeechTrimmer(align=HOP_LENGTH)
+    failed = False
+    for path in args.audio:
+        with open(path, "rb") as f:
+            data = f.read()
+        y, sr = librosa.load(path, sr=None)
+        start = time.perf_counter()
+        expected = extract_features(y, sr)
+        batch_ms = (time.perf_counter() - start) * 1e3
+        print(f"{os.path.basename(path)} ({len(y) / sr:.2f}s @ {sr} Hz): batch extraction {batch_ms:.1f} ms")
+
+        for chunk_size in args.chunk_sizes:
+            upload, feed_ms, finish_ms = stream(data, chunk_size)
+            actual = upload.features()
+            mismatched = ~np.isclose(actual, expected, rtol=RTOL, atol=ATOL)
+            for i in np.flatnonzero(mismatched):
+                print(f"  {REQUIRED_FEATURES[i]}: expected {expected[i]:.6f}, got {actual[i]:.6f}")
+            failed |= bool(mismatched.any())
+            print(f"  {chunk_size:>6} B chunks: max rel diff {max_rel_diff(actual, expected):.2e}, "
+                  f"{feed_ms:.2f} ms per chunk, {finish_ms:.1f} ms after the last chunk")
+
+        trimmed, bounds = trimmer.trim(y, sr)
+        start = time.perf_counter()
+        streamed = upload.features(bounds)
+        region_ms = (time.perf_counter() - start) * 1e3
+        exact = extract_features(trimmed, sr)
+        mismatched = ~np.isclose(streamed, exact, rtol=RTOL, atol=ATOL)
+        for i in np.flatnonzero(mismatched):
+            print(f"  speech region {REQUIRED_FEATURES[i]}: expected {exact[i]:.6f}, got {streamed[i]:.6f}")
+        failed |= bool(mismatched.any())
+        print(f"  speech region {bounds[0] / sr:.2f}-{bounds[1] / sr:.2f}s: "
+              f"max rel diff {max_rel_diff(streamed, exact):.2e}, {region_ms:.1f} ms")
+
+    if failed:
+        sys.exit(f"Streamed features are outside rtol={RTOL}, atol={ATOL} of batch extraction.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Per-backend transcription latency on the bundled test_audio.wav.
+
+Runs every available backend (AssemblyAI needs network access and a key, Vosk
+needs the `vosk` package and VOICEPAY_VOSK_MODEL) against the same clip with the
+same expected prompt and reports the transcript and latency of each.
+
+Usage (from python/):
+    python benchmarks/bench_transcription.py [--backends assemblyai vosk] [--repeat 5]
+        [--expected "Technology is evolving every single day."]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from request_audio import RequestAudio  # noqa: E402
+from transcription import AssemblyAITranscriber, VoskPromptTranscriber  # noqa: E402
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKENDS = {
+    "assemblyai": AssemblyAITranscriber,
+    "vosk": VoskPromptTranscriber,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--audio", default=os.path.join(BASE_DIR, "test_audio.wav"))
+    parser.add_argument("--expected", default="Technology is evolving every single day.")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=list(BACKENDS))
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with open(args.audio, "rb") as f:
+        data = f.read()
+
+    print(f"{'backend':>11} {'mean ms':>10} {'min ms':>10}  transcript")
+    for name in args.backends:
+        try:
+            transcriber = BACKENDS[name]()
+        except Exception as e:
+            print(f"{name:>11} unavailable: {e}")
+            continue
+        timings = []
+        for _ in range(args.repeat):
+            audio = RequestAudio(data)  # Fresh per call, as in a real request
+            start = time.perf_counter()
+            transcript = transcriber.transcribe(audio, args.expected)
+            timings.append(time.perf_counter() - start)
+        timings = np.array(timings) * 1e3
+        print(f"{name:>11} {timings.mean():>10.1f} {timings.min():>10.1f}  {transcript!r}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Accuracy and cost of speech trimming (vad.py) on a labeled audio corpus.
+
+Scores every file twice with the current model artifact: on the whole clip (what
+the detector did before) and on the SpeechTrimmer output (what the server does
+now). Reports accuracy of both against the ground-truth labels, how often the
+two verdicts agree, how much audio was trimmed away and the feature extraction
+time saved.
+
+Stated tolerance: trimming may cost at most 1 percentage point of accuracy
+(ACCURACY_TOLERANCE) and must agree with the untrimmed verdict on at least 97%
+of files (MIN_AGREEMENT). The script exits non-zero if either is violated.
+Until it has passed on a labeled corpus, trimming stays off by default
+(VOICEPAY_VAD=1 turns it on).
+
+The training CSV only holds features, so this needs the labeled recordings:
+either a manifest with `path,label` columns, or a directory whose REAL/ and FAKE/
+subdirectories hold the audio. Unlabeled files only count towards agreement.
+
+Usage (from python/):
+    python benchmarks/eval_vad.py --input-dir corpus/ [--max-seconds 6] [--pad-ms 200]
+    python benchmarks/eval_vad.py --manifest labeled.csv
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_features import extract_features, load_audio  # noqa: E402
+from deepfake_proper import DEFAULT_ARTIFACT_DIR, DeepfakeDetector  # noqa: E402
+from score_corpus import iter_directory, iter_manifest  # noqa: E402
+from vad import SpeechTrimmer  # noqa: E402
+
+ACCURACY_TOLERANCE = 0.01
+MIN_AGREEMENT = 0.97
+
+
+def label_from_path(path):
+    """REAL/FAKE from the nearest parent directory named like a label, else None."""
+    for part in reversed(os.path.normpath(os.path.dirname(path)).split(os.sep)):
+        if part.upper() in ("REAL", "FAKE"):
+            return part.upper()
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--input-dir")
+    source.add_argument("--manifest")
+    parser.add_argument("--artifact", default=DEFAULT_ARTIFACT_DIR)
+    parser.add_argument("--max-seconds", type=float, default=6.0)
+    parser.add_argument("--pad-ms", type=float, default=200)
+    args = parser.parse_args()
+
+    detector = DeepfakeDetector.load(args.artifact)
+    trimmer = SpeechTrimmer(max_seconds=args.max_seconds, pad_ms=args.pad_ms)
+    if args.input_dir:
+        items = [(path, label_from_path(path)) for path, _ in iter_directory(args.input_dir)]
+    else:
+        items = [(path, label.upper() if label else None) for path, label in iter_manifest(args.manifest)]
+
+    labels, full_features, trimmed_features = [], [], []
+    kept_fraction, full_seconds, trimmed_seconds = [], 0.0, 0.0
+    for path, label in items:
+        try:
+            y, sr = load_audio(path)
+        except Exception as e:
+            print(f"⚠ Skipping {path}: {e}")
+            continue
+        start = time.perf_counter()
+        full = extract_features(y, sr)
+        full_seconds += time.perf_counter() - start
+
+        start = time.perf_counter()
+        trimmed_y, _ = trimmer.trim(y, sr)
+        trimmed = extract_features(trimmed_y, sr)
+        trimmed_seconds += time.perf_counter() - start
+
+        labels.append(label)
+        full_features.append(full)
+        trimmed_features.append(trimmed)
+        kept_fraction.append(len(trimmed_y) / max(len(y), 1))
+
+    if not labels:
+        sys.exit("No readable audio files found.")
+
+    full_scores = detector.score_batch(detector.scale(np.stack(full_features)))
+    trimmed_scores = detector.score_batch(detector.scale(np.stack(trimmed_features)))
+    positive = detector.label_classes[1]
+    full_pred = np.where(full_scores >= 0.5, positive, detector.label_classes[0])
+    trimmed_pred = np.where(trimmed_scores >= 0.5, positive, detector.label_classes[0])
+    agreement = float(np.mean(full_pred == trimmed_pred))
+
+    print(f"{len(labels)} files, model {detector.model_version}")
+    print(f"audio kept after trimming: {np.mean(kept_fraction):.1%} on average")
+    print(f"feature extraction: {1e3 * full_seconds / len(labels):.1f} ms/file whole clip, "
+          f"{1e3 * trimmed_seconds / len(labels):.1f} ms/file trimmed (incl. VAD)")
+    print(f"verdict agreement trimmed vs whole clip: {agreement:.2%} (minimum {MIN_AGREEMENT:.0%})")
+
+    failed = agreement < MIN_AGREEMENT
+    labeled = np.array([label is not None for label in labels])
+    if labeled.any():
+        truth = np.array(labels)[labeled]
+        full_accuracy = float(np.mean(full_pred[labeled] == truth))
+        trimmed_accuracy = float(np.mean(trimmed_pred[labeled] == truth))
+        print(f"accuracy on {labeled.sum()} labeled files: whole clip {full_accuracy:.2%}, "
+              f"trimmed {trimmed_accuracy:.2%} (tolerance -{ACCURACY_TOLERANCE:.0%})")
+        failed |= trimmed_accuracy < full_accuracy - ACCURACY_TOLERANCE
+    else:
+        print("No labels found; only agreement was checked.")
+
+    print("❌ Trimming is outside the stated tolerance." if failed else "✅ Within tolerance.")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,125 +1,234 @@
-import pandas as pd
-import numpy as np
-import librosa
-import os
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import StandardScaler, LabelEncoder
-import tensorflow as tf
-from tensorflow import keras
-from tensorflow.keras import layers
-from tensorflow.keras.models import Sequential
-from tensorflow.keras.callbacks import EarlyStopping, ModelCheckpoint, ReduceLROnPlateau
-
-
-class DeepfakeDetector:
-    def __init__(self, csv_path):
-        # Enable TensorFlow JIT optimization
-        tf.config.optimizer.set_jit(True)
-        os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
-
-        # =========================
-        # Data Loading
-        # =========================
-        self.df = pd.read_csv("python/dataset/shuffled_file.csv")
-
-        # =========================
-        # Data Preprocessing
-        # =========================
-        self.scaler = StandardScaler()
-        X = self.df.drop('LABEL', axis=1)
-        X = self.scaler.fit_transform(X)
-        y = self.df['LABEL'].values
-
-        # Encode labels
-        label_encoder = LabelEncoder()
-        y = label_encoder.fit_transform(y)
-
-        # Handle data imbalance using class weights
-        from sklearn.utils.class_weight import compute_class_weight
-        self.class_weights = dict(enumerate(compute_class_weight('balanced', classes=np.unique(y), y=y)))
-
-        # Split dataset
-        self.X_train, self.X_test, self.y_train, self.y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-
-        # =========================
-        # Model Architecture
-        # =========================
-        self.model = Sequential([
-            layers.Input(shape=(self.X_train.shape[1],)),
-            layers.Dense(1024, activation='relu'),
-            layers.BatchNormalization(),
-            layers.Dropout(0.4),
-            layers.Dense(512, activation='relu'),
-            layers.BatchNormalization(),
-            layers.Dropout(0.3),
-            layers.Dense(128, activation='relu'),
-            layers.BatchNormalization(),
-            layers.Dense(1, activation='sigmoid')
-        ])
-
-        self.model.compile(optimizer=keras.optimizers.Adam(learning_rate=0.0001),
-                           loss='binary_crossentropy',
-                           metrics=['accuracy'])
-
-        # Callbacks
-        early_stopping = EarlyStopping(monitor='val_loss', patience=5, restore_best_weights=True)
-        model_checkpoint = ModelCheckpoint("best_deepfake_model.keras", save_best_only=True)
-        reduce_lr = ReduceLROnPlateau(monitor='val_loss', factor=0.5, patience=3, min_lr=1e-6)
-
-        # Model training
-        self.model.fit(self.X_train, self.y_train,
-                       epochs=25,
-                       batch_size=32,
-                       validation_split=0.2,
-                       class_weight=self.class_weights,
-                       callbacks=[early_stopping, model_checkpoint, reduce_lr])
-
-    # =========================
-    # Enhanced Audio Feature Extraction
-    # =========================
-    def extract_features_from_audio(self, file_path):
-        try:
-            y, sr = librosa.load(file_path, sr=None)
-            features = {
-                'chroma_stft': np.mean(librosa.feature.chroma_stft(y=y, sr=sr)),
-                'rms': np.mean(librosa.feature.rms(y=y)),
-                'spectral_centroid': np.mean(librosa.feature.spectral_centroid(y=y, sr=sr)),
-                'spectral_bandwidth': np.mean(librosa.feature.spectral_bandwidth(y=y, sr=sr)),
-                'rolloff': np.mean(librosa.feature.spectral_rolloff(y=y, sr=sr)),
-                'zero_crossing_rate': np.mean(librosa.feature.zero_crossing_rate(y))
-            }
-
-            # MFCCs (corrected naming)
-            mfccs = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=20)
-            for i in range(20):
-                features[f'mfcc{i + 1}'] = np.mean(mfccs[i])  # Correctly matches your dataset
-
-            # Ensure feature consistency
-            required_features = [
-                                    'chroma_stft', 'rms', 'spectral_centroid', 'spectral_bandwidth',
-                                    'rolloff', 'zero_crossing_rate'
-                                ] + [f'mfcc{i + 1}' for i in range(20)]
-
-            features_df = pd.DataFrame([features])[required_features]
-            features_scaled = self.scaler.transform(features_df)
-            return features_scaled
-        except Exception as e:
-            print(f"Error extracting features: {e}")
-            return None
-
-    def predict_audio_deepfake(self, file_path):
-        features = self.extract_features_from_audio(file_path)
-        if features is not None:
-            prediction = self.model.predict(features)[0][0]
-            result = "REAL(Human Voice)" if prediction < 0.5 else "FAKE(AI Voice)"
-            confidence = prediction if result == "FAKE" else 1 - prediction
-            print(f"Prediction for {os.path.basename(file_path)}: {result} with {confidence:.2f}% confidence.")
-            return result
-        else:
-            print("Failed to extract features. Please check the audio file.")
-            return "error"
-
-# Example usage
-#detector = DeepfakeDetector("python/test_audio.wav")
-#detector.predict_audio_deepfake("python/test_audio.wav")
-
+import hashlib
+import json
+import logging
+import os
+
+import numpy as np
+
+from audio_features import REQUIRED_FEATURES, extract_features, load_audio
+from instrumentation import increment, span
+from mlp_inference import NUMPY_MODEL_FILE, KerasMLP, NumpyMLP
+from request_audio import RequestAudio
+from result_cache import content_hash
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATASET_PATH = os.path.join(BASE_DIR, "dataset", "shuffled_file.csv")
+DEFAULT_ARTIFACT_DIR = os.environ.get("VOICEPAY_MODEL_DIR", os.path.join(BASE_DIR, "models", "deepfake"))
+
+# Bump whenever the on-disk layout of a model artifact changes.
+ARTIFACT_FORMAT_VERSION = 2
+METADATA_FILE = "metadata.json"
+KERAS_MODEL_FILE = "model.keras"
+
+logger = logging.getLogger("voicepay.deepfake")
+
+LABEL_DISPLAY = {
+    "REAL": "REAL(Human Voice)",
+    "FAKE": "FAKE(AI Voice)",
+}
+
+
+def dataset_hash(csv_path, segments=None):
+    """Return a sha256 digest of the training CSV, used to decide whether a retrain is needed.
+
+    `segments` are the byte offsets the CSV ended at after training and after each append
+    (the artifact's dataset_segments). Each appended segment is chained onto the digest
+    before it, so appending rows updates the digest without reading the rest of the CSV.
+    """
+    segments = list(segments or [])
+    first = segments[0] if segments else None
+    digest = hashlib.sha256()
+    with open(csv_path, "rb") as f:
+        while first is None or f.tell() < first:
+            block = f.read(1 << 20 if first is None else min(1 << 20, first - f.tell()))
+            if not block:
+                break
+            digest.update(block)
+        result = "sha256:" + digest.hexdigest()
+        for end in segments[1:]:
+            result = chain_hash(result, f.read(end - f.tell()))
+        rest = f.read()
+        if rest:  # Rows appended after the artifact was written
+            result = chain_hash(result, rest)
+    return result
+
+
+def chain_hash(digest, appended):
+    """The dataset_hash of a CSV with digest `digest` once the bytes `appended` are added to it."""
+    return "sha256:" + hashlib.sha256(digest.encode() + appended).hexdigest()
+
+
+def read_artifact_metadata(artifact_dir):
+    """Return the metadata of the artifact in `artifact_dir`, or None if there is no usable artifact."""
+    metadata_path = os.path.join(artifact_dir, METADATA_FILE)
+    if not os.path.exists(metadata_path):
+        return None
+    with open(metadata_path) as f:
+        metadata = json.load(f)
+    if metadata.get("format_version") != ARTIFACT_FORMAT_VERSION:
+        return None
+    return metadata
+
+
+class DeepfakeDetector:
+    """Serves a trained deepfake model artifact.
+
+    Build one with `DeepfakeDetector.load(path)`; artifacts are produced offline by `train_deepfake.py`
+    and fine-tuned on newly labeled rows by `update_deepfake.py`.
+    """
+
+    def __init__(self, model, scaler_mean, scaler_scale, feature_names, label_classes, metadata=None):
+        if list(feature_names) != REQUIRED_FEATURES:
+            raise ValueError("Model artifact was trained on a different feature order.")
+        self.model = model  # NumpyMLP or KerasMLP
+        self.scaler_mean = np.asarray(scaler_mean, dtype=np.float64)
+        self.scaler_scale = np.asarray(scaler_scale, dtype=np.float64)
+        self.feature_names = list(feature_names)
+        # The sigmoid output is the probability of label_classes[1] (LabelEncoder order).
+        self.label_classes = list(label_classes)
+        self.metadata = metadata or {}
+        self.model_version = self.metadata.get("model_version", "unversioned")
+        self.batcher = None  # MicroBatcher when enable_batching() was called
+        self.result_cache = None  # ResultCache when enable_result_cache() was called
+
+    @classmethod
+    def load(cls, path=DEFAULT_ARTIFACT_DIR, backend="numpy"):
+        """Load a detector from a model artifact directory without retraining.
+
+        backend="numpy" (the default) scores with the folded NumPy MLP and never imports
+        TensorFlow; backend="keras" loads the original Keras model.
+        """
+        metadata = read_artifact_metadata(path)
+        if metadata is None:
+            raise FileNotFoundError(
+                f"No deepfake model artifact (format v{ARTIFACT_FORMAT_VERSION}) in {path}. "
+                "Run `python train_deepfake.py` first."
+            )
+
+        if backend == "numpy":
+            model = NumpyMLP.load(os.path.join(path, NUMPY_MODEL_FILE))
+        elif backend == "keras":
+            os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+            from tensorflow import keras
+
+            model = KerasMLP(keras.models.load_model(os.path.join(path, KERAS_MODEL_FILE), compile=False))
+        else:
+            raise ValueError(f"Unknown inference backend: {backend}")
+
+        return cls(model,
+                   metadata["scaler"]["mean"],
+                   metadata["scaler"]["scale"],
+                   metadata["feature_names"],
+                   metadata["label_classes"],
+                   metadata)
+
+    @classmethod
+    def from_csv(cls, csv_path=DEFAULT_DATASET_PATH, artifact_dir=DEFAULT_ARTIFACT_DIR, backend="numpy"):
+        """Load the artifact for `csv_path`, training it first only if the dataset hash changed."""
+        metadata = read_artifact_metadata(artifact_dir) or {}
+        if metadata.get("dataset_hash") != dataset_hash(csv_path, metadata.get("dataset_segments")):
+            from train_deepfake import train
+
+            train(csv_path, artifact_dir)
+        return cls.load(artifact_dir, backend=backend)
+
+    def scale(self, features):
+        """Apply the StandardScaler fitted at training time."""
+        return (features - self.scaler_mean) / self.scaler_scale
+
+    # =========================
+    # Enhanced Audio Feature Extraction
+    # =========================
+    def extract_features_from_audio(self, audio, sr=None):
+        """Return the scaled feature row (shape (1, 26)), or None on failure.
+
+        `audio` is a RequestAudio, a file path, the raw bytes of an upload, or an
+        already decoded signal (in which case `sr` is required).
+        """
+        try:
+            if isinstance(audio, RequestAudio):
+                return self.scale(audio.deepfake_features())[None, :]
+            if isinstance(audio, np.ndarray):
+                if sr is None:
+                    raise ValueError("sr is required when passing a decoded signal")
+                y = audio
+            else:
+                y, sr = load_audio(audio)
+            return self.scale(extract_features(y, sr))[None, :]
+        except Exception as e:
+            logger.warning("Error extracting features: %s", e)
+            return None
+
+    # =========================
+    # Inference
+    # =========================
+    def score_batch(self, features):
+        """Probability of label_classes[1] for each scaled feature row, in one forward pass."""
+        return self.model.predict(np.atleast_2d(features))[:, 0]
+
+    def label_for(self, score):
+        """Map a model score to its display label and the confidence in that label."""
+        label = self.label_classes[1] if score >= 0.5 else self.label_classes[0]
+        confidence = score if label == self.label_classes[1] else 1 - score
+        return LABEL_DISPLAY[label], confidence
+
+    def predict_batch(self, features):
+        """Classify an (n, 26) array of scaled feature rows; returns n display labels."""
+        return [self.label_for(score)[0] for score in self.score_batch(features)]
+
+    def enable_batching(self, max_batch_size=32, max_wait_ms=2.0):
+        """Route single-row predictions from concurrent requests through a shared micro-batcher."""
+        from batching import MicroBatcher
+
+        self.batcher = MicroBatcher(self.score_batch, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+
+    def enable_result_cache(self, cache):
+        """Reuse features and scores of byte-identical uploads; clears `cache` if it held another model's results."""
+        cache.set_model_version(self.model_version)
+        self.result_cache = cache
+
+    def _cache_key(self, audio):
+        if self.result_cache is None:
+            return None
+        if isinstance(audio, RequestAudio) and audio.data is not None:
+            return audio.content_hash()
+        if isinstance(audio, (bytes, bytearray)):
+            return content_hash(audio)
+        return None  # Paths and decoded signals are not content-addressed
+
+    def predict_audio_deepfake(self, audio, sr=None):
+        digest = self._cache_key(audio)
+        cached = self.result_cache.get(digest, self.model_version) if digest else None
+        if cached is not None:
+            prediction = cached["score"]
+        else:
+            with span("features"):
+                features = self.extract_features_from_audio(audio, sr)
+            if features is None:
+                logger.warning("Failed to extract features. Please check the audio file.")
+                increment("deepfake_verdicts_total", verdict="error")
+                return "error"
+            with span("inference"):
+                if self.batcher is not None:
+                    prediction = self.batcher.score(features[0])
+                else:
+                    prediction = float(self.score_batch(features)[0])
+            if digest:
+                self.result_cache.put(digest, self.model_version,
+                                      {"features": features[0],  # Scaled, as fed to the model
+                                       "score": prediction})
+
+        result, confidence = self.label_for(prediction)
+        increment("deepfake_verdicts_total", verdict=result.split("(")[0])
+        if logger.isEnabledFor(logging.INFO):
+            if isinstance(audio, str):
+                source = os.path.basename(audio)
+            else:
+                source = getattr(audio, "filename", None) or "uploaded audio"
+            logger.info("Prediction for %s: %s with %.2f%% confidence%s.", source, result, 100 * confidence,
+                        " (cached)" if cached is not None else "")
+        return result
+
+# Example usage
+#detector = DeepfakeDetector.load()
+#detector.predict_audio_deepfake("python/test_audio.wav")
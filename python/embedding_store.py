@@ -0,0 +1,103 @@
+"""Local store of enrollment voice embeddings, keyed by username.
+
+`verify_speech` computes one embedding per verified enrollment sentence and
+writes the set here when enrollment completes, so voice verification is a single
+lookup plus a vector comparison instead of re-downloading and re-decrypting the
+reference recordings. SQLite (in WAL mode) lets several server workers share it.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_STORE_PATH = os.environ.get("VOICEPAY_EMBEDDING_DB", os.path.join(BASE_DIR, "data", "embeddings.sqlite3"))
+DEFAULT_KIND = "mfcc_mean"
+
+
+class EmbeddingStore:
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS enrollment_embeddings (
+                    username   TEXT    NOT NULL,
+                    kind       TEXT    NOT NULL,
+                    slot       INTEGER NOT NULL,
+                    dim        INTEGER NOT NULL,
+                    vector     BLOB    NOT NULL,
+                    created_at REAL    NOT NULL,
+                    PRIMARY KEY (username, kind, slot)
+                )
+            """)
+            # Bumped by every write, so each worker can tell when its copy of the cohort is stale
+            conn.execute("CREATE TABLE IF NOT EXISTS store_version (id INTEGER PRIMARY KEY CHECK (id = 0), "
+                         "version INTEGER NOT NULL)")
+            conn.execute("INSERT OR IGNORE INTO store_version VALUES (0, 0)")
+
+    def _connection(self):
+        # sqlite3 connections must not be shared across threads; keep one per thread.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            if self.path != ":memory:":
+                conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, username, kind=DEFAULT_KIND):
+        """Return the user's reference embeddings as a (n, dim) float32 matrix, or None if not enrolled."""
+        rows = self._connection().execute(
+            "SELECT dim, vector FROM enrollment_embeddings WHERE username = ? AND kind = ? ORDER BY slot",
+            (username, kind),
+        ).fetchall()
+        if not rows:
+            return None
+        return np.stack([np.frombuffer(vector, dtype=np.float32, count=dim) for dim, vector in rows])
+
+    def all(self, kind=DEFAULT_KIND):
+        """Return (usernames, (n, dim) float32 matrix) of every stored embedding of `kind`, one row each."""
+        rows = self._connection().execute(
+            "SELECT username, dim, vector FROM enrollment_embeddings WHERE kind = ? ORDER BY username, slot",
+            (kind,),
+        ).fetchall()
+        if not rows:
+            return [], None
+        return ([username for username, _, _ in rows],
+                np.stack([np.frombuffer(vector, dtype=np.float32, count=dim) for _, dim, vector in rows]))
+
+    def version(self):
+        """A number that changes whenever any process writes to the store."""
+        return self._connection().execute("SELECT version FROM store_version").fetchone()[0]
+
+    def usernames(self):
+        """Every username with stored embeddings of any kind."""
+        rows = self._connection().execute(
+            "SELECT DISTINCT username FROM enrollment_embeddings ORDER BY username").fetchall()
+        return [username for (username,) in rows]
+
+    def replace(self, username, embeddings, kind=DEFAULT_KIND):
+        """Atomically replace all of the user's embeddings of `kind` (used when a user (re-)enrolls)."""
+        now = time.time()
+        rows = []
+        for slot, embedding in enumerate(embeddings):
+            vector = np.ascontiguousarray(embedding, dtype=np.float32).ravel()
+            rows.append((username, kind, slot, vector.size, vector.tobytes(), now))
+        with self._connection() as conn:
+            conn.execute("DELETE FROM enrollment_embeddings WHERE username = ? AND kind = ?", (username, kind))
+            conn.executemany("INSERT INTO enrollment_embeddings VALUES (?, ?, ?, ?, ?, ?)", rows)
+            conn.execute("UPDATE store_version SET version = version + 1")
+
+    def invalidate(self, username, kind=None):
+        """Drop the user's stored embeddings (all kinds unless `kind` is given)."""
+        with self._connection() as conn:
+            if kind is None:
+                conn.execute("DELETE FROM enrollment_embeddings WHERE username = ?", (username,))
+            else:
+                conn.execute("DELETE FROM enrollment_embeddings WHERE username = ? AND kind = ?", (username, kind))
+            conn.execute("UPDATE store_version SET version = version + 1")
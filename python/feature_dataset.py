@@ -0,0 +1,104 @@
+"""Binary cache of the labeled feature dataset used for training.
+
+Parsing dataset/shuffled_file.csv with pandas and refitting the scaler dominated
+short training runs. `load_feature_dataset` does that once per dataset version
+and stores the result under a directory named after the CSV's sha256:
+
+    <cache_dir>/<hash prefix>/
+        features.npy   scaled feature rows, float32, (n, 26), REQUIRED_FEATURES order
+        labels.npy     encoded labels, uint8, (n,)
+        meta.json      dataset hash, scaler mean/scale, label classes, shapes
+
+Later runs memory-map the .npy files instead of reparsing the CSV. A CSV with a
+different hash gets a new entry, so a stale cache is never used.
+"""
+import json
+import logging
+import os
+import shutil
+from collections import namedtuple
+
+import numpy as np
+
+from audio_features import REQUIRED_FEATURES
+from deepfake_proper import BASE_DIR, dataset_hash
+
+DEFAULT_CACHE_DIR = os.environ.get("VOICEPAY_DATASET_CACHE", os.path.join(BASE_DIR, "data", "dataset_cache"))
+CACHE_FORMAT_VERSION = 1
+FEATURES_FILE = "features.npy"
+LABELS_FILE = "labels.npy"
+META_FILE = "meta.json"
+
+logger = logging.getLogger("voicepay.dataset")
+
+FeatureDataset = namedtuple(
+    "FeatureDataset", ["X", "y", "scaler_mean", "scaler_scale", "label_classes", "dataset_hash", "path"])
+
+
+def _read_meta(entry_dir):
+    meta_path = os.path.join(entry_dir, META_FILE)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        meta = json.load(f)
+    if meta.get("format_version") != CACHE_FORMAT_VERSION or meta.get("feature_names") != REQUIRED_FEATURES:
+        return None
+    return meta
+
+
+def _build(csv_path, digest, entry_dir):
+    """Parse and scale the CSV once and write the cache entry atomically."""
+    import pandas as pd
+    from sklearn.preprocessing import LabelEncoder, StandardScaler
+
+    logger.info("🔹 Caching feature dataset %s -> %s", csv_path, entry_dir)
+    df = pd.read_csv(csv_path, usecols=REQUIRED_FEATURES + ["LABEL"])
+    scaler = StandardScaler()
+    X = scaler.fit_transform(df[REQUIRED_FEATURES].values).astype(np.float32)
+    label_encoder = LabelEncoder()
+    y = label_encoder.fit_transform(df["LABEL"].values).astype(np.uint8)
+
+    staging_dir = f"{entry_dir}.tmp-{os.getpid()}"
+    if os.path.exists(staging_dir):
+        shutil.rmtree(staging_dir)
+    os.makedirs(staging_dir)
+    np.save(os.path.join(staging_dir, FEATURES_FILE), X)
+    np.save(os.path.join(staging_dir, LABELS_FILE), y)
+    with open(os.path.join(staging_dir, META_FILE), "w") as f:
+        json.dump({
+            "format_version": CACHE_FORMAT_VERSION,
+            "dataset_hash": digest,
+            "source": os.path.abspath(csv_path),
+            "rows": int(len(y)),
+            "feature_names": REQUIRED_FEATURES,
+            "scaler": {"mean": scaler.mean_.tolist(), "scale": scaler.scale_.tolist()},
+            "label_classes": label_encoder.classes_.tolist(),
+        }, f, indent=2)
+
+    if os.path.exists(entry_dir):
+        shutil.rmtree(entry_dir)
+    os.replace(staging_dir, entry_dir)
+
+
+def load_feature_dataset(csv_path, cache_dir=DEFAULT_CACHE_DIR, rebuild=False, digest=None):
+    """Return the scaled dataset for `csv_path` as a FeatureDataset of memory-mapped arrays.
+
+    Builds the cache entry first if there is none for this version of the CSV (or `rebuild` is set).
+    """
+    digest = digest or dataset_hash(csv_path)
+    entry_dir = os.path.join(cache_dir, digest.split(":")[1][:16])
+    meta = None if rebuild else _read_meta(entry_dir)
+    if meta is None or meta["dataset_hash"] != digest:
+        _build(csv_path, digest, entry_dir)
+        meta = _read_meta(entry_dir)
+
+    X = np.load(os.path.join(entry_dir, FEATURES_FILE), mmap_mode="r")
+    y = np.load(os.path.join(entry_dir, LABELS_FILE), mmap_mode="r")
+    if X.shape != (meta["rows"], len(REQUIRED_FEATURES)) or y.shape != (meta["rows"],):
+        raise ValueError(f"Feature dataset cache {entry_dir} is corrupt; rebuild it.")
+    return FeatureDataset(X, y,
+                          np.asarray(meta["scaler"]["mean"]),
+                          np.asarray(meta["scaler"]["scale"]),
+                          meta["label_classes"],
+                          digest,
+                          entry_dir)
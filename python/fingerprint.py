@@ -0,0 +1,445 @@
+"""Spectral-peak fingerprints of accepted recordings, for replay detection.
+
+The deepfake detector only rejects synthetic voices. A genuine recording that
+was accepted once passes it again when it is replayed, whichever account it is
+submitted for. So every accepted recording is fingerprinted and indexed, and
+each new upload is looked up before any model runs.
+
+Fingerprint (landmark hashing, as in Wang's Shazam paper): the signal is
+resampled to 8 kHz, the strongest local maxima of its spectrogram are kept, and
+each peak is combined with pairs of the peaks that follow it within a second.
+Such a triplet packs into 39 bits (three frequency bins and two frame gaps),
+which are spread over a 64-bit hash and stored with the frame of its first peak. Pairs of peaks alone are too common
+in speech: at millions of recordings every lookup would read long posting
+lists. Peaks survive gain changes, moderate noise and re-encoding, and the
+hashes do not depend on where the clip starts.
+
+Lookup: the postings of each query hash vote for (recording, time offset). A
+recording whose best offset collects enough votes is a near-duplicate. Postings
+are sorted by hash, and a table indexed by the top bits of the hash points at
+each bucket of a few postings, so finding a hash's postings takes two memory
+reads instead of a binary search over the whole index. The cost depends on how
+common the query's hashes are, not on how many recordings are indexed. Buckets
+(and pending hashes) with more than MAX_POSTINGS_PER_HASH postings say little
+and are skipped. With a million recordings indexed (447M postings) a lookup
+takes 0.3 ms at p50 and 0.6 ms at p99 (benchmarks/bench_fingerprint.py).
+
+Storage, under VOICEPAY_FINGERPRINT_DIR (data/fingerprints by default):
+
+    recordings.sqlite3     recording id -> username, slot, created_at
+    postings.bin           append-only log of (hash u64, recording id u32, frame u16)
+    snapshot-<n>/          the first n log records sorted by hash (hash.npy,
+                           recording.npy, frame.npy, buckets.npy), memory-mapped at start-up
+
+Each process searches the memory-mapped snapshot, which it never modifies,
+plus a few small sorted delta segments (the same arrays and bucket table) of the
+postings logged since. New postings wait in a dict until MERGE_POSTINGS have
+piled up and are then sorted into a delta; deltas of similar size are merged
+with each other, so there are only a handful and each posting is re-sorted a
+logarithmic number of times. Once the deltas hold SNAPSHOT_EVERY postings, a
+background thread writes a new snapshot and swaps it in, so requests never
+re-sort the whole index. A recording's postings are appended to the log in one
+O_APPEND write. What other workers appended is read by a background thread
+every VOICEPAY_FINGERPRINT_REFRESH_MS (100 by default), so a lookup never
+touches the log: it searches the segments and pending postings as they are.
+A replay submitted to two workers within that interval can be missed.
+"""
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+import librosa
+import numpy as np
+from scipy.ndimage import maximum_filter
+
+from instrumentation import span
+
+logger = logging.getLogger("voicepay.fingerprint")
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_INDEX_DIR = os.environ.get("VOICEPAY_FINGERPRINT_DIR", os.path.join(BASE_DIR, "data", "fingerprints"))
+
+FP_SR = 8000
+N_FFT = 1024
+HOP_LENGTH = 128  # 16 ms frames
+FREQ_BINS = N_FFT // 2  # The Nyquist bin is dropped so a bin fits in 9 bits
+PEAK_NEIGHBORHOOD = (15, 9)  # (bins, frames) a peak must be the maximum of
+PEAK_RANGE_DB = 60  # Peaks further below the clip's loudest bin are noise
+PEAKS_PER_SECOND = 30
+FAN_OUT = 5  # Following peaks each anchor is combined with (FAN_OUT - 1 triplets)
+MAX_DT = 63  # Frames from the anchor to the other peaks (~1 s), 6 bits
+
+MAX_POSTINGS_PER_HASH = 200
+MERGE_POSTINGS = 1 << 16  # Pending postings that are sorted into a new delta segment
+SNAPSHOT_EVERY = 1 << 22  # Postings in delta segments that trigger writing a new snapshot
+DEFAULT_REFRESH_SECONDS = 0.1
+
+# Multiplying by an odd constant is a bijection on 64-bit integers that carries every bit into the top ones
+HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+BUCKET_POSTINGS = 4  # Mean postings per bucket of the lookup table
+
+POSTING = np.dtype([("hash", "<u8"), ("recording", "<u4"), ("frame", "<u2")])
+POSTINGS_FILE = "postings.bin"
+RECORDINGS_DB = "recordings.sqlite3"
+SNAPSHOT_PREFIX = "snapshot-"
+_COLUMNS = ("hash", "recording", "frame")
+BUCKETS_FILE = "buckets.npy"
+
+FingerprintMatch = namedtuple("FingerprintMatch", ["recording_id", "username", "slot", "votes", "ratio"])
+# Postings sorted by hash ({column: array}) and their bucket table
+Segment = namedtuple("Segment", ["columns", "bucket_bits", "buckets"])
+
+
+def landmarks(y, sr):
+    """(packed peak triplets, anchor frames uint16) of a mono signal."""
+    if sr != FP_SR:
+        y = librosa.resample(y, orig_sr=sr, target_sr=FP_SR, res_type="soxr_qq")
+    S = np.abs(librosa.stft(y, n_fft=N_FFT, hop_length=HOP_LENGTH))[:FREQ_BINS]
+    if not S.size or S.max() <= 0:
+        return np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.uint16)
+    S_db = librosa.amplitude_to_db(S, ref=np.max, top_db=None)
+    is_peak = (S_db == maximum_filter(S_db, size=PEAK_NEIGHBORHOOD, mode="constant", cval=-np.inf)) \
+        & (S_db > -PEAK_RANGE_DB)
+    bins, frames = np.nonzero(is_peak)
+    limit = max(1, int(PEAKS_PER_SECOND * len(y) / FP_SR))
+    if len(bins) > limit:
+        strongest = np.argpartition(-S_db[bins, frames], limit)[:limit]
+        bins, frames = bins[strongest], frames[strongest]
+    order = np.lexsort((bins, frames))
+    bins, frames = bins[order].astype(np.int64), frames[order].astype(np.int64)
+
+    # Anchor i with peaks i + k and i + k + 1: both later than the anchor, and within MAX_DT of it
+    hashes, anchors = [], []
+    for k in range(1, FAN_OUT):
+        n = len(bins) - k - 1
+        if n <= 0:
+            break
+        anchor, dt1, dt2 = frames[:n], frames[k:k + n] - frames[:n], frames[k + 1:k + 1 + n] - frames[:n]
+        valid = (dt1 >= 1) & (dt2 <= MAX_DT)
+        hashes.append((bins[:n][valid] << 30) | (bins[k:k + n][valid] << 21) | (bins[k + 1:k + 1 + n][valid] << 12)
+                      | (dt1[valid] << 6) | dt2[valid])
+        anchors.append(anchor[valid])
+    if not hashes:
+        return np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.uint16)
+    return (np.concatenate(hashes).astype(np.uint64),
+            np.minimum(np.concatenate(anchors), np.iinfo(np.uint16).max).astype(np.uint16))
+
+
+def spread(codes):
+    """64-bit hashes of packed landmarks, with well-mixed top bits for the bucket table."""
+    return np.asarray(codes, dtype=np.uint64) * HASH_MULTIPLIER
+
+
+def fingerprint(y, sr):
+    """(hashes uint64, anchor frames uint16) of a mono signal."""
+    codes, frames = landmarks(y, sr)
+    return spread(codes), frames
+
+
+def audio_fingerprint(audio):
+    """Fingerprint of a RequestAudio's untrimmed signal, computed once per request."""
+    def compute():
+        y, sr = audio.raw_signal, audio.sr
+        with span("fingerprint"):
+            return fingerprint(y, sr)
+
+    return audio.cached("fingerprint", compute)
+
+
+def _bucket_table(sorted_hashes):
+    """(bits, starts): the postings whose hash has top bits b are rows starts[b] to starts[b + 1]."""
+    bits = max(1, (len(sorted_hashes) // BUCKET_POSTINGS).bit_length())
+    counts = np.bincount((sorted_hashes >> np.uint64(64 - bits)).astype(np.int64), minlength=1 << bits)
+    return bits, np.concatenate([[0], np.cumsum(counts)])
+
+
+def _sorted_segment(blocks):
+    """A Segment of the postings of every block ({column: array} or POSTING records), sorted by hash."""
+    columns = {name: np.concatenate([block[name] for block in blocks]) for name in _COLUMNS}
+    # Stable sort finds sorted runs (e.g. merged segments) and merges them in linear time
+    order = np.argsort(columns["hash"], kind="stable")
+    columns = {name: column[order] for name, column in columns.items()}
+    return Segment(columns, *_bucket_table(columns["hash"]))
+
+
+def _map_snapshot(directory):
+    """The Segment saved in a snapshot directory, memory-mapped."""
+    columns = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r") for name in _COLUMNS}
+    buckets = np.load(os.path.join(directory, BUCKETS_FILE), mmap_mode="r")
+    return Segment(columns, (len(buckets) - 1).bit_length() - 1, buckets)
+
+
+def _segment_hits(segment, hashes, frames):
+    """(recording ids, time offsets) of the postings in `segment` that share a query hash."""
+    # Every posting in the query hashes' buckets, then the ones with the same hash
+    buckets = (hashes >> np.uint64(64 - segment.bucket_bits)).astype(np.int64)
+    lo = segment.buckets[buckets]
+    counts = segment.buckets[buckets + 1] - lo
+    counts[counts > MAX_POSTINGS_PER_HASH] = 0
+    rows = np.repeat(lo - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+    query = np.repeat(np.arange(len(hashes)), counts)
+    same = segment.columns["hash"][rows] == hashes[query]
+    rows, query = rows[same], query[same]
+    return (segment.columns["recording"][rows].astype(np.int64),
+            segment.columns["frame"][rows].astype(np.int64) - frames[query])
+
+
+class FingerprintIndex:
+    def __init__(self, path=DEFAULT_INDEX_DIR, min_matches=20, min_ratio=0.1, refresh_seconds=DEFAULT_REFRESH_SECONDS):
+        """A recording is a near-duplicate when its best-aligned match shares `min_matches` hashes and at
+        least `min_ratio` of the query's hashes. Other processes' appends are read every `refresh_seconds`
+        (never if 0; call refresh() instead)."""
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.min_matches = min_matches
+        self.min_ratio = min_ratio
+        self._log_path = os.path.join(path, POSTINGS_FILE)
+        self._local = threading.local()
+        self._lock = threading.RLock()
+        self._refresh_lock = threading.Lock()  # One reader of the log at a time
+        self._compact_lock = threading.Lock()  # One snapshot written at a time
+        with self._connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS recordings (
+                    id         INTEGER PRIMARY KEY AUTOINCREMENT,
+                    username   TEXT    NOT NULL,
+                    slot       TEXT    NOT NULL,
+                    created_at REAL    NOT NULL
+                )
+            """)
+
+        self._snapshot = _sorted_segment([np.empty(0, dtype=POSTING)])  # Memory-mapped once loaded; read only
+        self._deltas = []  # Sorted segments of the postings logged after the snapshot, oldest first
+        self._compacting = 0  # Leading deltas a running compaction is folding into the next snapshot
+        self._compactor = None
+        self._pending = {}  # hash -> [(recording, frame), ...] not in a delta yet
+        self._pending_count = 0
+        self._position = 0  # Log records read so far
+        self._load_snapshot()
+        self.refresh()
+        if self._delta_postings() >= SNAPSHOT_EVERY:
+            self.save_snapshot()
+        self._closed = threading.Event()
+        self._follower = None
+        if refresh_seconds > 0:
+            self._follower = threading.Thread(target=self._follow_log, args=(refresh_seconds,),
+                                              name="fingerprint-refresh", daemon=True)
+            self._follower.start()
+
+    @classmethod
+    def from_env(cls):
+        """The index configured by VOICEPAY_FINGERPRINT (on unless "0") and VOICEPAY_FINGERPRINT_*, or None."""
+        if os.environ.get("VOICEPAY_FINGERPRINT", "1") == "0":
+            return None
+        return cls(min_matches=int(os.environ.get("VOICEPAY_FINGERPRINT_MIN_MATCHES", "20")),
+                   min_ratio=float(os.environ.get("VOICEPAY_FINGERPRINT_MIN_RATIO", "0.1")),
+                   refresh_seconds=float(os.environ.get("VOICEPAY_FINGERPRINT_REFRESH_MS", "100")) / 1e3)
+
+    def close(self):
+        """Stop reading other processes' appends."""
+        self._closed.set()
+        if self._follower is not None:
+            self._follower.join()
+
+    def _follow_log(self, interval):
+        while not self._closed.wait(interval):
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("❌ Reading the fingerprint log failed")
+
+    def _connection(self):
+        # sqlite3 connections must not be shared across threads; keep one per thread.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(os.path.join(self.path, RECORDINGS_DB), timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _snapshots(self):
+        """(rows, directory) of every complete snapshot, newest last."""
+        snapshots = []
+        for name in os.listdir(self.path):
+            if name.startswith(SNAPSHOT_PREFIX) and name[len(SNAPSHOT_PREFIX):].isdigit():
+                snapshots.append((int(name[len(SNAPSHOT_PREFIX):]), os.path.join(self.path, name)))
+        return sorted(snapshots)
+
+    def _load_snapshot(self):
+        """Map the newest snapshot that can still be read; returns its rows."""
+        for rows, directory in reversed(self._snapshots()):
+            try:
+                self._snapshot = _map_snapshot(directory)
+            except FileNotFoundError:  # Removed by a worker that wrote a newer one meanwhile
+                continue
+            self._position = rows
+            return rows
+        return 0
+
+    def _delta_postings(self):
+        return sum(len(delta.columns["hash"]) for delta in self._deltas)
+
+    def save_snapshot(self):
+        """Fold the delta segments into a new snapshot, written to disk and memory-mapped in their place.
+
+        Sorting the whole index runs without the lock, so lookups go on meanwhile.
+        """
+        with self._compact_lock:
+            self._compact()
+
+    def _compact(self):
+        with self._lock:
+            self._flush_pending()
+            if not self._deltas:
+                return
+            snapshot, deltas, rows = self._snapshot, list(self._deltas), self._position
+            self._compacting = len(deltas)
+        try:
+            directory = os.path.join(self.path, f"{SNAPSHOT_PREFIX}{rows:012d}")
+            if not os.path.exists(directory):
+                self._write_snapshot(directory, _sorted_segment([snapshot.columns] + [d.columns for d in deltas]))
+            mapped = _map_snapshot(directory)
+            with self._lock:
+                self._snapshot = mapped
+                self._deltas = self._deltas[len(deltas):]
+        finally:
+            with self._lock:
+                self._compacting = 0
+        for older_rows, older in self._snapshots():
+            if older_rows < rows:
+                shutil.rmtree(older, ignore_errors=True)  # Processes that mapped it keep their mapping
+
+    def _write_snapshot(self, directory, segment):
+        staging_dir = f"{directory}.tmp-{os.getpid()}-{threading.get_ident()}"
+        os.makedirs(staging_dir, exist_ok=True)
+        for name in _COLUMNS:
+            np.save(os.path.join(staging_dir, f"{name}.npy"), segment.columns[name])
+        np.save(os.path.join(staging_dir, BUCKETS_FILE), segment.buckets)
+        try:
+            os.rename(staging_dir, directory)
+        except OSError:  # Another worker wrote the same snapshot first
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            return
+        logger.info("✅ Wrote fingerprint snapshot of %d postings", len(segment.columns["hash"]))
+
+    def _compact_in_background(self):
+        """Start writing a snapshot on a daemon thread, unless one is being written already."""
+        if self._compactor is not None and self._compactor.is_alive():
+            return
+
+        def compact():
+            try:
+                self.save_snapshot()
+            except Exception:
+                logger.exception("❌ Fingerprint snapshot failed")
+
+        self._compactor = threading.Thread(target=compact, name="fingerprint-compaction", daemon=True)
+        self._compactor.start()
+
+    def refresh(self):
+        """Read the postings appended to the log since the last call, by this or any other process.
+
+        The log is read and large catch-ups are sorted without the index lock, so lookups go on meanwhile.
+        """
+        with self._refresh_lock:
+            position = self._position
+            try:
+                records = os.path.getsize(self._log_path) // POSTING.itemsize
+            except FileNotFoundError:
+                return
+            if records <= position:
+                return
+            with open(self._log_path, "rb") as f:
+                f.seek(position * POSTING.itemsize)
+                postings = np.fromfile(f, dtype=POSTING, count=records - position)
+            if len(postings) >= MERGE_POSTINGS:  # Catching up at start-up
+                delta = _sorted_segment([postings])
+                with self._lock:
+                    self._position += len(postings)
+                    self._add_delta(delta)
+                return
+            with self._lock:
+                self._position += len(postings)
+                for h, recording, frame in postings.tolist():
+                    self._pending.setdefault(h, []).append((recording, frame))
+                self._pending_count += len(postings)
+                if self._pending_count >= MERGE_POSTINGS:
+                    self._flush_pending()
+
+    def _flush_pending(self):
+        """Sort the pending postings into a delta segment."""
+        if not self._pending:
+            return
+        pending = np.empty(self._pending_count, dtype=POSTING)
+        keys = np.fromiter(self._pending, dtype=np.uint64, count=len(self._pending))  # Not via float64
+        pending["hash"] = np.repeat(keys, [len(entries) for entries in self._pending.values()])
+        entries = [entry for entries in self._pending.values() for entry in entries]
+        pending["recording"], pending["frame"] = np.asarray(entries, dtype=np.int64).T
+        self._pending, self._pending_count = {}, 0
+        self._add_delta(_sorted_segment([pending]))
+
+    def _add_delta(self, delta):
+        """Append a delta, merging it with the newest ones while they are not larger than it."""
+        while len(self._deltas) > self._compacting \
+                and len(self._deltas[-1].columns["hash"]) <= len(delta.columns["hash"]):
+            delta = _sorted_segment([self._deltas.pop().columns, delta.columns])
+        self._deltas.append(delta)
+        if self._delta_postings() >= SNAPSHOT_EVERY:
+            self._compact_in_background()
+
+    def add(self, username, slot, hashes, frames):
+        """Index an accepted recording; returns its id (None if it has no fingerprint)."""
+        if not len(hashes):
+            return None
+        with self._connection() as conn:
+            recording_id = conn.execute("INSERT INTO recordings (username, slot, created_at) VALUES (?, ?, ?)",
+                                        (username, str(slot), time.time())).lastrowid
+        postings = np.empty(len(hashes), dtype=POSTING)
+        postings["hash"], postings["recording"], postings["frame"] = hashes, recording_id, frames
+        fd = os.open(self._log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        try:
+            os.write(fd, postings.tobytes())  # One append, so concurrent writers never interleave records
+        finally:
+            os.close(fd)
+        self.refresh()
+        return recording_id
+
+    def find_duplicate(self, hashes, frames):
+        """The indexed recording the fingerprint near-duplicates, as a FingerprintMatch, or None."""
+        if not len(hashes):
+            return None
+        with self._lock:  # Segments are never modified, and the pending dict is replaced, not cleared, by a flush
+            segments, pending = [self._snapshot] + self._deltas, self._pending
+        hits = [_segment_hits(segment, hashes, frames) for segment in segments]
+        if pending:
+            extra = [(recording, frame - query_frame)
+                     for h, query_frame in zip(hashes.tolist(), frames.tolist())
+                     for entries in [pending.get(h, ())] if len(entries) <= MAX_POSTINGS_PER_HASH
+                     for recording, frame in entries]
+            if extra:
+                extra = np.asarray(extra, dtype=np.int64)
+                hits.append((extra[:, 0], extra[:, 1]))
+        recordings = np.concatenate([recording_ids for recording_ids, _ in hits])
+        offsets = np.concatenate([offsets for _, offsets in hits])
+
+        if not len(recordings):
+            return None
+        # Votes per (recording, time offset); a replay lines up at one offset
+        keys, votes = np.unique((recordings << 17) | (offsets + (1 << 16)), return_counts=True)
+        best = int(np.argmax(votes))
+        ratio = votes[best] / len(hashes)
+        if votes[best] < self.min_matches or ratio < self.min_ratio:
+            return None
+        recording_id = int(keys[best] >> 17)
+        row = self._connection().execute("SELECT username, slot FROM recordings WHERE id = ?",
+                                         (recording_id,)).fetchone()
+        username, slot = row if row else (None, None)
+        return FingerprintMatch(recording_id, username, slot, int(votes[best]), float(ratio))
+
+    def stats(self):
+        with self._lock:
+            return {"postings": self._position, "pending": self._pending_count, "deltas": len(self._deltas)}
@@ -0,0 +1,53 @@
+"""Production server settings: `gunicorn -c gunicorn.conf.py app:app` (from python/).
+
+One worker process per core by default, each with a few request threads (the
+gthread worker) that mostly wait on the network. Each worker gets an equal share
+of the cores for numpy/TensorFlow/torch and for its CPU stage pool, and loads
+every model right after it starts, before it accepts requests.
+
+Environment:
+    VOICEPAY_BIND            address to listen on (default 0.0.0.0:5002)
+    VOICEPAY_WORKERS         worker processes (default: one per core)
+    VOICEPAY_THREADS         request threads per worker (default 4)
+    VOICEPAY_CPU_THREADS     CPU stage and numeric library threads per worker (default: cores / workers)
+    VOICEPAY_TIMEOUT         seconds before a stuck worker is restarted (default 120)
+
+The app itself also reads (see the modules for the rest):
+    VOICEPAY_MASTER_KEY      required with shared (Cloudinary) storage: comma-separated urlsafe-base64
+                             32-byte keys that wrap every recording's data key, the first for new ones
+                             (recording_format.py). Use the same value on every host. Without it the
+                             server refuses to start unless VOICEPAY_STORAGE=local:<dir>.
+    VOICEPAY_STORAGE         "cloudinary" (default) or local:<dir>
+"""
+import os
+
+from serving import configure_threads, cpu_count, threads_per_worker
+
+bind = os.environ.get("VOICEPAY_BIND", "0.0.0.0:5002")
+workers = int(os.environ.get("VOICEPAY_WORKERS", "0")) or cpu_count()
+worker_class = "gthread"
+threads = int(os.environ.get("VOICEPAY_THREADS", "4"))
+timeout = int(os.environ.get("VOICEPAY_TIMEOUT", "120"))
+graceful_timeout = 30
+# The app is imported by each worker, never by the master: the thread limits
+# below must be in the environment before numpy or TensorFlow are first imported.
+preload_app = False
+
+cpu_threads = int(os.environ.get("VOICEPAY_CPU_THREADS", "0")) or threads_per_worker(workers)
+os.environ["VOICEPAY_CPU_THREADS"] = str(cpu_threads)  # Sizes app.cpu_executor in every worker
+configure_threads(cpu_threads)
+
+# Enrollment sessions must be visible to every worker, not just the one that created them
+if workers > 1 and "VOICEPAY_SESSION_STORE" not in os.environ:
+    data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+    os.makedirs(data_dir, exist_ok=True)
+    os.environ["VOICEPAY_SESSION_STORE"] = f"sqlite:{os.path.join(data_dir, 'sessions.sqlite3')}"
+
+
+def post_worker_init(worker):
+    # The app module is loaded by now; build its models before the first request arrives
+    import app
+
+    status = app.warm_up()
+    worker.log.info("Worker %s ready: %s", worker.pid,
+                    ", ".join(f"{name} {model['load_seconds'] or 0:.1f}s" for name, model in status.items()))
@@ -0,0 +1,268 @@
+"""Lightweight hot-path instrumentation: stage spans, counters and sampled profiling.
+
+Wrap a stage in `with span("features"):` and its wall-clock duration is added
+to a process-wide window of recent samples per stage name. Spans record
+exclusive time: a span opened inside another (e.g. "decode" when feature
+extraction is what first decodes the upload) is subtracted from the outer one,
+so stage times never count the same work twice. That includes spans opened by
+work handed to a StageExecutor with `run()`, which carries the caller's span
+over to the pool thread (`propagate`). `snapshot()` returns count, mean and
+p50/p95/p99 per stage, which the API benchmark reports next to end-to-end
+latency. Recording costs two perf_counter calls and a deque append;
+percentiles are only computed when someone reads them.
+
+`increment("deepfake_verdicts_total", verdict="REAL")` bumps a labeled counter.
+`prometheus_text()` renders spans (as summaries) and counters in the Prometheus
+text exposition format for the server's /metrics route. Every process keeps its
+own numbers, so under gunicorn each series carries a `pid` label and a scrape
+only sees the worker that answered it; aggregate with e.g.
+`sum without (pid) (...)` over the workers' series.
+
+`profiler` runs cProfile on a random sample of requests. The sample rate can be
+changed at runtime and defaults to 0, i.e. off.
+
+Stage names used by the server: decode, fingerprint, replay_lookup, vad, features,
+inference, transcribe, match, embed, voice_match, encrypt, upload, persist.
+"""
+import cProfile
+import collections
+import io
+import pstats
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+DEFAULT_WINDOW = 4096
+METRIC_PREFIX = "voicepay_"
+
+
+class SpanRecorder:
+    def __init__(self, window=DEFAULT_WINDOW):
+        self.window = window
+        self.enabled = True
+        self._samples = {}  # name -> deque of durations in ms
+        self._counts = collections.Counter()
+        self._totals = collections.Counter()  # name -> total ms
+        self._counters = collections.Counter()  # (name, ((label, value), ...)) -> count
+        self._lock = threading.Lock()
+        self._open = threading.local()  # Per thread: the open spans, and the span of a thread waiting on this one
+
+    def record(self, name, duration_ms):
+        with self._lock:
+            samples = self._samples.get(name)
+            if samples is None:
+                samples = self._samples[name] = collections.deque(maxlen=self.window)
+            samples.append(duration_ms)
+            self._counts[name] += 1
+            self._totals[name] += duration_ms
+
+    @contextmanager
+    def span(self, name):
+        if not self.enabled:
+            yield
+            return
+        stack = getattr(self._open, "stack", None)
+        if stack is None:
+            stack = self._open.stack = []
+        nested = [0.0]  # ms spent in spans nested in this one, on this thread or on threads it waits for
+        stack.append(nested)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - start) * 1e3
+            stack.pop()
+            self.record(name, elapsed - nested[0])
+            parent = stack[-1] if stack else getattr(self._open, "parent", None)
+            if parent is not None:
+                with self._lock:  # A parent on another thread may have several children finishing at once
+                    parent[0] += elapsed
+
+    def propagate(self, fn):
+        """Wrap `fn` so spans it opens on another thread count as nested in the span open here.
+
+        Only for work the caller waits for: the outer span's time then covers the child's.
+        """
+        stack = getattr(self._open, "stack", None)
+        parent = stack[-1] if stack else getattr(self._open, "parent", None)
+        if parent is None:
+            return fn
+
+        def run(*args, **kwargs):
+            previous = getattr(self._open, "parent", None)
+            self._open.parent = parent
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self._open.parent = previous
+
+        return run
+
+    def increment(self, name, value=1, **labels):
+        with self._lock:
+            self._counters[(name, tuple(sorted(labels.items())))] += value
+
+    def counters(self):
+        with self._lock:
+            return dict(self._counters)
+
+    def snapshot(self):
+        """Per-stage count and total over the process lifetime, percentiles over the recent window (ms)."""
+        with self._lock:
+            samples = {name: np.array(values) for name, values in self._samples.items()}
+            counts = dict(self._counts)
+            totals = dict(self._totals)
+        stats = {}
+        for name, values in sorted(samples.items()):
+            if not len(values):
+                continue
+            p50, p95, p99 = np.percentile(values, [50, 95, 99])
+            stats[name] = {
+                "count": counts[name],
+                "total_ms": float(totals[name]),
+                "mean_ms": float(values.mean()),
+                "p50_ms": float(p50),
+                "p95_ms": float(p95),
+                "p99_ms": float(p99),
+                "max_ms": float(values.max()),
+            }
+        return stats
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+            self._counts.clear()
+            self._totals.clear()
+            self._counters.clear()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+def _summary_lines(name, series, labels):
+    """Lines of a summary from [(series labels, {quantile: seconds}, sum seconds, count), ...]."""
+    lines = [f"# TYPE {name} summary"]
+    for series_labels, quantiles, total, count in series:
+        series_labels = labels + list(series_labels)
+        for quantile, value in quantiles.items():
+            lines.append(f"{name}{_labels(series_labels + [('quantile', quantile)])} {value:.6f}")
+        lines.append(f"{name}_sum{_labels(series_labels)} {total:.6f}")
+        lines.append(f"{name}_count{_labels(series_labels)} {count}")
+    return lines
+
+
+def prometheus_text(recorder, gauges=None, labels=(), counters=None, summaries=None):
+    """Render spans, counters and extra `gauges` ({name: value or {labels tuple: value}}) as Prometheus text.
+
+    `counters` (same shape as `gauges`) are totals kept outside the recorder, e.g. a cache's hit count.
+    `summaries` ({name: [(labels tuple, {quantile: seconds}, sum seconds, count), ...]}) are latency
+    distributions kept outside the recorder. `labels` ((name, value) pairs) are added to every series,
+    e.g. the worker's pid.
+    """
+    lines = []
+    labels = list(labels)
+    stages = recorder.snapshot()
+    if stages:
+        name = METRIC_PREFIX + "stage_duration_seconds"
+        lines.append(f"# HELP {name} Wall-clock time per request stage (quantiles over the recent window).")
+        quantiles = (("0.5", "p50_ms"), ("0.95", "p95_ms"), ("0.99", "p99_ms"))
+        lines += _summary_lines(name, [
+            ((("stage", stage),), {quantile: stats[key] / 1e3 for quantile, key in quantiles},
+             stats["total_ms"] / 1e3, stats["count"])
+            for stage, stats in stages.items()], labels)
+    for summary, series in sorted((summaries or {}).items()):
+        lines += _summary_lines(METRIC_PREFIX + summary, series, labels)
+
+    by_name = collections.defaultdict(list)
+    for (counter, series_labels), value in recorder.counters().items():
+        by_name[counter].append((series_labels, value))
+    for counter, value in (counters or {}).items():
+        by_name[counter] += value.items() if isinstance(value, dict) else [((), value)]
+    for counter, series in sorted(by_name.items()):
+        name = METRIC_PREFIX + counter
+        lines.append(f"# TYPE {name} counter")
+        lines += [f"{name}{_labels(labels + list(series_labels))} {value}" for series_labels, value in sorted(series)]
+
+    for gauge, value in sorted((gauges or {}).items()):
+        name = METRIC_PREFIX + gauge
+        lines.append(f"# TYPE {name} gauge")
+        series = value.items() if isinstance(value, dict) else [((), value)]
+        lines += [f"{name}{_labels(labels + list(series_labels))} {float(v):g}"
+                  for series_labels, v in series if v is not None]
+    return "\n".join(lines) + "\n"
+
+
+class SampledProfiler:
+    """cProfile a random fraction of requests and aggregate the results.
+
+    At most one request is profiled at a time (cProfile cannot run in several
+    threads at once on every Python version), so concurrent requests are skipped.
+    """
+
+    def __init__(self, sample_rate=0.0):
+        self.sample_rate = sample_rate
+        self._active = threading.Lock()
+        self._stats = None
+        self._samples = 0
+        self._stats_lock = threading.Lock()
+
+    def start(self):
+        """Return a running cProfile.Profile if this request was sampled, else None."""
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return None
+        if not self._active.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:  # Another profiler is active in this interpreter
+            self._active.release()
+            return None
+        return profile
+
+    def stop(self, profile):
+        if profile is None:
+            return
+        profile.disable()
+        self._active.release()
+        with self._stats_lock:
+            if self._stats is None:
+                self._stats = pstats.Stats(profile)
+            else:
+                self._stats.add(profile)
+            self._samples += 1
+
+    def report(self, limit=30, sort="cumulative"):
+        """Top functions over every sampled request so far, as pstats text."""
+        with self._stats_lock:
+            if self._stats is None:
+                return "No requests profiled yet.\n"
+            out = io.StringIO()
+            self._stats.stream = out
+            out.write(f"{self._samples} sampled requests\n")
+            self._stats.sort_stats(sort).print_stats(limit)
+            return out.getvalue()
+
+    def reset(self):
+        with self._stats_lock:
+            self._stats = None
+            self._samples = 0
+
+
+recorder = SpanRecorder()
+span = recorder.span
+propagate = recorder.propagate
+increment = recorder.increment
+snapshot = recorder.snapshot
+reset = recorder.reset
+profiler = SampledProfiler()
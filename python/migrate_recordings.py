@@ -0,0 +1,141 @@
+"""Convert stored .enc/.txt recording pairs to single `.vpr` objects.
+
+For every user and slot (enrollment recordings 1-3 and the voice signature),
+downloads the legacy Fernet-encrypted recording and its key, decrypts it and
+writes one `.vpr` object (recording_format.py). The new object holds the
+compressed audio and the embedding of the configured speaker embedder
+(VOICEPAY_SPEAKER_EMBEDDING, trimmed if VOICEPAY_VAD=1). Its data key is
+wrapped under VOICEPAY_MASTER_KEY.
+
+Every migrated recording, and every `.vpr` object that already existed, is
+also added to the replay fingerprint index (fingerprint.py, off with
+VOICEPAY_FINGERPRINT=0), so replays of recordings stored before replay
+detection are rejected too. Recordings the index already holds for the same
+user and slot are not added twice.
+
+Object storage cannot be listed, so usernames come from the command line, a
+file with one per line, or the embedding store. Slots that already have a
+`.vpr` object are skipped unless --force is given. Each new object is read back
+before the legacy pair is deleted, and pairs are only deleted with
+--delete-legacy. Re-running is safe.
+
+Usage:
+    python migrate_recordings.py alice bob [--delete-legacy]
+    python migrate_recordings.py --users-file users.txt [--codec original] [--dry-run]
+    python migrate_recordings.py --from-embedding-store
+"""
+import argparse
+import logging
+import sys
+
+from cryptography.fernet import Fernet
+
+from audio_features import HOP_LENGTH
+from embedding_store import EmbeddingStore
+from fingerprint import FingerprintIndex, audio_fingerprint
+from recording_format import (CODECS, SIGNATURE_SLOT, default_keyring, legacy_names, open_recording,
+                              recording_name, seal_recording)
+from request_audio import RequestAudio
+from speaker_verification import SpeakerVerifier, embedder_from_env
+from storage import storage_from_env
+from vad import SpeechTrimmer
+
+logger = logging.getLogger("voicepay.migrate")
+
+SLOTS = [1, 2, 3, SIGNATURE_SLOT]
+
+
+def index_recording(index, username, slot, audio):
+    """Add a recording's fingerprint to the replay index unless it is already there for this user and slot."""
+    hashes, frames = audio_fingerprint(audio)
+    match = index.find_duplicate(hashes, frames)
+    if match is not None and (match.username, match.slot) == (username, str(slot)):
+        return False
+    index.add(username, slot, hashes, frames)
+    return True
+
+
+def migrate_slot(storage, keyring, verifier, username, slot, codec, force=False, delete_legacy=False,
+                 dry_run=False, index=None):
+    """Migrate one recording and add it to the fingerprint `index`; returns (status, legacy bytes, new bytes)."""
+    name = recording_name(username, slot)
+    existing = None if force else storage.get(name)
+    if existing is not None:
+        if index is not None and not dry_run:
+            _, payload = open_recording(existing, keyring)
+            index_recording(index, username, slot, RequestAudio(payload))
+        return "exists", 0, 0
+    audio_name, key_name = legacy_names(username, slot)
+    objects = storage.get_many([audio_name, key_name])
+    if objects[audio_name] is None or objects[key_name] is None:
+        return "missing", 0, 0
+
+    data = Fernet(objects[key_name]).decrypt(objects[audio_name])
+    audio = RequestAudio(data, trimmer=verifier.trimmer)
+    blob = seal_recording(audio, keyring, codec, {verifier.kind: verifier.embed(audio)})
+    legacy_bytes = len(objects[audio_name]) + len(objects[key_name])
+    if dry_run:
+        return "dry-run", legacy_bytes, len(blob)
+
+    storage.put(name, blob)
+    if index is not None:
+        index_recording(index, username, slot, audio)
+    if delete_legacy:
+        open_recording(storage.get(name), keyring)  # Fails loudly before anything is deleted
+        storage.delete(audio_name)
+        storage.delete(key_name)
+    return "migrated", legacy_bytes, len(blob)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert .enc/.txt recording pairs to single .vpr objects.")
+    parser.add_argument("usernames", nargs="*")
+    parser.add_argument("--users-file", help="File with one username per line.")
+    parser.add_argument("--from-embedding-store", action="store_true",
+                        help="Migrate every user that has stored enrollment embeddings.")
+    parser.add_argument("--codec", choices=CODECS, default="flac")
+    parser.add_argument("--force", action="store_true", help="Rewrite slots that already have a .vpr object.")
+    parser.add_argument("--delete-legacy", action="store_true", help="Delete each pair once its .vpr is stored.")
+    parser.add_argument("--dry-run", action="store_true", help="Convert in memory only and report sizes.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(name)s: %(message)s")
+
+    usernames = list(args.usernames)
+    if args.users_file:
+        with open(args.users_file) as f:
+            usernames += [line.strip() for line in f if line.strip()]
+    if args.from_embedding_store:
+        usernames += EmbeddingStore().usernames()
+    usernames = list(dict.fromkeys(usernames))
+    if not usernames:
+        parser.error("No usernames given")
+
+    storage = storage_from_env()
+    keyring = default_keyring()
+    verifier = SpeakerVerifier(embedder_from_env(), trimmer=SpeechTrimmer.from_env(align=HOP_LENGTH))
+    index = FingerprintIndex.from_env()
+    counts = {}
+    legacy_total = new_total = 0
+    for username in usernames:
+        for slot in SLOTS:
+            try:
+                status, legacy_bytes, new_bytes = migrate_slot(storage, keyring, verifier, username, slot,
+                                                               args.codec, args.force, args.delete_legacy,
+                                                               args.dry_run, index)
+            except Exception as e:
+                status, legacy_bytes, new_bytes = "failed", 0, 0
+                logger.warning("❌ %s: %s", recording_name(username, slot), e)
+            counts[status] = counts.get(status, 0) + 1
+            legacy_total += legacy_bytes
+            new_total += new_bytes
+            if status in ("migrated", "dry-run"):
+                logger.info("✅ %s: %d -> %d bytes", recording_name(username, slot), legacy_bytes, new_bytes)
+
+    print(f"{len(usernames)} users: " + ", ".join(f"{count} {status}" for status, count in sorted(counts.items())))
+    if legacy_total:
+        print(f"{legacy_total} bytes in legacy pairs -> {new_total} bytes ({new_total / legacy_total:.1%})")
+    sys.exit(1 if counts.get("failed") else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""NumPy-only inference for the deepfake MLP.
+
+The Keras model is a stack of Dense(relu) -> BatchNormalization -> Dropout blocks.
+At inference time dropout is the identity and each BatchNormalization is a fixed
+per-unit affine map, so it can be folded into the weights of the Dense layer that
+follows it. What is left is a handful of matmuls that NumPy runs without TensorFlow.
+"""
+import numpy as np
+
+NUMPY_MODEL_FILE = "mlp.npz"
+
+
+def _relu(x):
+    return np.maximum(x, 0.0, out=x)
+
+
+def _sigmoid(x):
+    # Numerically stable for large |x|.
+    return np.exp(-np.logaddexp(0.0, -x))
+
+
+def _linear(x):
+    return x
+
+
+ACTIVATIONS = {
+    "relu": _relu,
+    "sigmoid": _sigmoid,
+    "linear": _linear,
+}
+
+
+def fold_keras_model(model):
+    """Return [(kernel, bias, activation), ...] with BatchNorm folded in and Dropout removed."""
+    folded = []
+    pending = None  # (scale, shift) of BatchNorm layers waiting for the next Dense
+    for layer in model.layers:
+        kind = type(layer).__name__
+        if kind == "Dense":
+            kernel, bias = (w.astype(np.float64) for w in layer.get_weights())
+            if pending is not None:
+                scale, shift = pending
+                bias = shift @ kernel + bias
+                kernel = scale[:, None] * kernel
+                pending = None
+            activation = layer.activation.__name__
+            if activation not in ACTIVATIONS:
+                raise ValueError(f"Unsupported activation for NumPy inference: {activation}")
+            folded.append((kernel, bias, activation))
+        elif kind == "BatchNormalization":
+            units = layer.moving_mean.shape[-1]
+            gamma = layer.gamma.numpy() if layer.scale else np.ones(units)
+            beta = layer.beta.numpy() if layer.center else np.zeros(units)
+            scale = gamma / np.sqrt(layer.moving_variance.numpy() + layer.epsilon)
+            shift = beta - layer.moving_mean.numpy() * scale
+            if pending is not None:
+                scale, shift = pending[0] * scale, pending[1] * scale + shift
+            pending = (scale.astype(np.float64), shift.astype(np.float64))
+        elif kind in ("Dropout", "InputLayer"):
+            continue
+        else:
+            raise ValueError(f"Unsupported layer for NumPy inference: {kind}")
+
+    if pending is not None:
+        raise ValueError("A trailing BatchNormalization layer cannot be folded into a Dense layer.")
+    return folded
+
+
+class NumpyMLP:
+    """Evaluates a folded Dense stack with NumPy; mirrors `keras.Model.predict` output shape."""
+
+    def __init__(self, layers):
+        self.layers = [
+            (np.ascontiguousarray(kernel, dtype=np.float32), np.asarray(bias, dtype=np.float32), activation)
+            for kernel, bias, activation in layers
+        ]
+        self._activations = [ACTIVATIONS[activation] for _, _, activation in self.layers]
+
+    @classmethod
+    def from_keras(cls, model):
+        return cls(fold_keras_model(model))
+
+    def save(self, path):
+        arrays = {}
+        for i, (kernel, bias, activation) in enumerate(self.layers):
+            arrays[f"kernel_{i}"] = kernel
+            arrays[f"bias_{i}"] = bias
+            arrays[f"activation_{i}"] = np.array(activation)
+        np.savez(path, n_layers=np.array(len(self.layers)), **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls([
+                (data[f"kernel_{i}"], data[f"bias_{i}"], str(data[f"activation_{i}"]))
+                for i in range(int(data["n_layers"]))
+            ])
+
+    def predict(self, x):
+        h = np.asarray(x, dtype=np.float32)
+        if h.ndim == 1:
+            h = h[None, :]
+        for (kernel, bias, _), activation in zip(self.layers, self._activations):
+            h = activation(h @ kernel + bias)
+        return h
+
+
+class KerasMLP:
+    """Adapter giving a Keras model the same `predict` signature as `NumpyMLP`."""
+
+    def __init__(self, model):
+        self.model = model
+
+    def predict(self, x):
+        return self.model.predict(np.atleast_2d(x), verbose=0)
@@ -0,0 +1,63 @@
+"""Lazily initialized, process-wide model singletons.
+
+Models (the deepfake detector, the transcriber, the speaker embedder) are
+registered as factories and only built the first time something asks for them,
+so importing the server does not import TensorFlow, torch or speechbrain.
+
+`warm_up()` builds them ahead of time. Call it in each worker right after the
+fork (or in the master before forking, if the models are fork-safe) so the
+first request does not pay for loading.
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger("voicepay.models")
+
+
+class ModelRegistry:
+    def __init__(self):
+        self._factories = {}
+        self._instances = {}
+        self._load_seconds = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, factory):
+        """Register `factory()` as the builder of model `name`; replaces any loaded instance."""
+        with self._lock:
+            self._factories[name] = factory
+            self._locks[name] = threading.Lock()
+            self._instances.pop(name, None)
+            self._load_seconds.pop(name, None)
+
+    def get(self, name):
+        """Return model `name`, building it on first use (once, even under concurrent requests)."""
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        if name not in self._factories:
+            raise KeyError(f"No model registered as {name!r}")
+        with self._locks[name]:
+            instance = self._instances.get(name)
+            if instance is None:
+                logger.info("🔹 Loading model: %s", name)
+                start = time.perf_counter()
+                instance = self._factories[name]()
+                self._load_seconds[name] = time.perf_counter() - start
+                self._instances[name] = instance
+        return instance
+
+    def is_loaded(self, name):
+        return name in self._instances
+
+    def warm_up(self, names=None):
+        """Build the given models (all registered ones by default); returns their load times in seconds."""
+        for name in names or list(self._factories):
+            self.get(name)
+        return self.status()
+
+    def status(self):
+        """Which registered models are loaded, and how long each took to build."""
+        return {name: {"loaded": name in self._instances, "load_seconds": self._load_seconds.get(name)}
+                for name in self._factories}
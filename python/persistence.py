@@ -0,0 +1,133 @@
+"""Background persistence of verified recordings.
+
+`verify_speech` used to encrypt and upload each verified sentence before it
+answered the client. `PersistenceQueue` runs that work on a small pool of worker
+threads instead. The queue is bounded: when it is full `submit` waits up to
+`submit_timeout` seconds and then raises `queue.Full`, which the route turns into
+a 503 so clients back off instead of the server buffering without limit.
+
+Jobs are grouped by a session key so the final enrollment step can wait for
+every upload of its session with `wait_for`, and `discard` cancels the queued
+jobs of a session that was abandoned.
+"""
+import collections
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class PersistenceQueue:
+    def __init__(self, workers=4, capacity=64, submit_timeout=5.0, latency_window=1024):
+        self.submit_timeout = submit_timeout
+        self._queue = queue.Queue(maxsize=capacity)
+        self._lock = threading.Lock()
+        self._outstanding = collections.defaultdict(list)  # session key -> [Future, ...] in submit order
+        self._wait_ms = collections.deque(maxlen=latency_window)
+        self._run_ms = collections.deque(maxlen=latency_window)
+        self._wait_total_ms = 0.0  # Over every job run, for the Prometheus summaries' _sum
+        self._run_total_ms = 0.0
+        self._in_flight = 0
+        self._completed = 0
+        self._failed = 0
+        self._workers = [
+            threading.Thread(target=self._work, name=f"persistence-{i}", daemon=True) for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, session_key, fn, *args, **kwargs):
+        """Queue `fn(*args, **kwargs)` for the session; returns a Future with its result.
+
+        Cancelling the Future before a worker picks the job up skips it.
+        """
+        future = Future()
+        self._queue.put((future, time.perf_counter(), fn, args, kwargs), timeout=self.submit_timeout)
+        with self._lock:
+            self._outstanding[session_key].append(future)
+        return future
+
+    def wait_for(self, session_key, timeout=None):
+        """Block until every job of the session finished; returns their results in submit order.
+
+        Re-raises the first job failure.
+        """
+        with self._lock:
+            futures = self._outstanding.pop(session_key, [])
+        return [future.result(timeout=timeout) for future in futures if not future.cancelled()]
+
+    def discard(self, session_key):
+        """Cancel the jobs of an abandoned session that have not started and stop tracking the rest.
+
+        Jobs already running cannot be stopped; they have to check themselves that their session is still live.
+        """
+        with self._lock:
+            futures = self._outstanding.pop(session_key, [])
+        for future in futures:
+            future.cancel()
+
+    def join(self):
+        """Block until every job queued so far has run (used by benchmarks and shutdown)."""
+        self._queue.join()
+
+    def _work(self):
+        while True:
+            future, enqueued_at, fn, args, kwargs = self._queue.get()
+            if not future.set_running_or_notify_cancel():
+                self._queue.task_done()  # Cancelled before it started
+                continue
+            started_at = time.perf_counter()
+            with self._lock:
+                self._in_flight += 1
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                future.set_exception(e)
+                failed = True
+            else:
+                future.set_result(result)
+                failed = False
+            finished_at = time.perf_counter()
+            with self._lock:
+                self._in_flight -= 1
+                self._failed += failed
+                self._completed += not failed
+                self._wait_ms.append((started_at - enqueued_at) * 1e3)
+                self._run_ms.append((finished_at - started_at) * 1e3)
+                self._wait_total_ms += self._wait_ms[-1]
+                self._run_total_ms += self._run_ms[-1]
+            self._queue.task_done()
+
+    def metrics(self):
+        """Queue depth, job counters, total job time and latency percentiles over the recent window."""
+        with self._lock:
+            wait_ms = np.array(self._wait_ms)
+            run_ms = np.array(self._run_ms)
+            stats = {
+                "queue_depth": self._queue.qsize(),
+                "capacity": self._queue.maxsize,
+                "in_flight": self._in_flight,
+                "completed": self._completed,
+                "failed": self._failed,
+                "queue_wait_total_ms": self._wait_total_ms,
+                "job_run_total_ms": self._run_total_ms,
+            }
+
+        def summarize(values):
+            if not len(values):
+                return {"count": 0}
+            return {
+                "count": int(len(values)),
+                "mean": float(values.mean()),
+                "p50": float(np.percentile(values, 50)),
+                "p95": float(np.percentile(values, 95)),
+                "p99": float(np.percentile(values, 99)),
+                "max": float(values.max()),
+            }
+
+        stats["queue_wait_ms"] = summarize(wait_ms)
+        stats["job_run_ms"] = summarize(run_ms)
+        stats["job_latency_ms"] = summarize(wait_ms + run_ms)
+        return stats
@@ -0,0 +1,86 @@
+"""Tolerant matching of transcripts against the enrollment prompts.
+
+`is_exact_match` rejected a transcript over a missing full stop or a capital
+letter, and every false reject costs the user a full retry. `SentenceIndex`
+normalizes and tokenizes every prompt once at startup and scores transcripts
+with one of these policies:
+
+- "exact":      the old behaviour, transcript == sentence.lower()
+- "normalized": equal after lowercasing and stripping punctuation/extra spaces
+- "edit":       normalized Levenshtein similarity (fuzz.ratio) >= threshold
+- "token":      the same on sorted tokens, so word order slips are forgiven
+
+It also reports which prompt a transcript is closest to, i.e. which sentence the
+user actually read.
+"""
+import re
+
+from fuzzywuzzy import fuzz
+
+POLICIES = ("exact", "normalized", "edit", "token")
+
+
+def normalize(text):
+    """Lowercase, drop punctuation (keeping apostrophes) and collapse whitespace."""
+    return " ".join(re.sub(r"[^\w' ]+", " ", text.lower()).split())
+
+
+def _sorted_tokens(normalized):
+    return " ".join(sorted(normalized.split()))
+
+
+class SentenceIndex:
+    def __init__(self, sentences, policy="edit", threshold=0.9):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown match policy: {policy}")
+        self.policy = policy
+        self.threshold = threshold
+        self.sentences = list(sentences)
+        # Precomputed per prompt: lowercased, normalized and token-sorted forms
+        self._forms = {}
+        for sentence in self.sentences:
+            normalized = normalize(sentence)
+            self._forms[self._key(sentence)] = (sentence.lower(), normalized, _sorted_tokens(normalized))
+
+    @staticmethod
+    def _key(sentence):
+        return normalize(sentence)
+
+    def _forms_for(self, sentence):
+        forms = self._forms.get(self._key(sentence))
+        if forms is None:  # Not one of the indexed prompts; compute on the fly
+            normalized = normalize(sentence)
+            forms = (sentence.lower(), normalized, _sorted_tokens(normalized))
+        return forms
+
+    def score(self, transcript, sentence, policy=None):
+        """Similarity of `transcript` to `sentence` in [0, 1] under `policy`."""
+        policy = policy or self.policy
+        lowered, normalized, tokens = self._forms_for(sentence)
+        if policy == "exact":
+            return float(transcript == lowered)
+        transcript_normalized = normalize(transcript)
+        if policy == "normalized":
+            return float(transcript_normalized == normalized)
+        if policy == "edit":
+            return fuzz.ratio(transcript_normalized, normalized) / 100
+        if policy == "token":
+            return fuzz.ratio(_sorted_tokens(transcript_normalized), tokens) / 100
+        raise ValueError(f"Unknown match policy: {policy}")
+
+    def matches(self, transcript, expected, policy=None, threshold=None):
+        """Whether `transcript` counts as a reading of `expected`."""
+        if not transcript:
+            return False
+        threshold = self.threshold if threshold is None else threshold
+        return self.score(transcript, expected, policy) >= threshold
+
+    def best_match(self, transcript, policy=None):
+        """Return (sentence, score) of the indexed prompt closest to `transcript`."""
+        policy = policy or self.policy
+        if not transcript or not self.sentences:
+            return None, 0.0
+        if policy in ("exact", "normalized"):
+            policy = "edit"  # Binary policies cannot rank near misses
+        return max(((sentence, self.score(transcript, sentence, policy)) for sentence in self.sentences),
+                   key=lambda pair: pair[1])
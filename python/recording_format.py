@@ -0,0 +1,229 @@
+"""Single-object container for encrypted recordings (`.vpr`).
+
+Each verified recording used to be stored as two objects: the Fernet-encrypted
+upload (`{username}_{n}.enc`, an uncompressed WAV that base64 made a third
+larger) and its key in plain text (`{username}_key{n}.txt`). A `.vpr` object
+replaces the pair:
+
+    b"VPRC" | version (u8) | header length (u16) | header JSON {"codec", "key_id"}
+    | wrapped data key (60 bytes) | metadata length (u32) | encrypted metadata
+    | encrypted payload
+
+- The payload is the recording as 16 kHz mono FLAC ("flac", the rate every
+  voice-matching embedder works at), or the upload exactly as received
+  ("original"). The signal is stored before speech trimming.
+- Metadata and payload are encrypted with AES-256-GCM under a fresh data key per
+  recording. The data key is wrapped under the server master key named by
+  `key_id`. The header is authenticated as associated data of all three, so it
+  cannot be swapped between objects.
+- The metadata (duration, sample rates, precomputed speaker embeddings by kind)
+  is encrypted on its own. `read_metadata` costs one small decryption and never
+  touches the audio.
+
+Master keys come from VOICEPAY_MASTER_KEY: comma-separated urlsafe-base64
+32-byte keys. The first wraps new recordings; every listed key can open
+existing ones, which allows rotation. Without the variable, a key is generated
+once in data/master.key, which only works for a single host. That fallback is
+therefore limited to local storage (VOICEPAY_STORAGE=local:...): with shared
+storage the process refuses to start rather than seal recordings that no other
+host could open.
+
+`migrate_recordings.py` converts existing .enc/.txt pairs.
+"""
+import base64
+import hashlib
+import io
+import json
+import logging
+import os
+import struct
+import threading
+import time
+
+import librosa
+import numpy as np
+import soundfile as sf
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+logger = logging.getLogger("voicepay.recordings")
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_MASTER_KEY_PATH = os.path.join(BASE_DIR, "data", "master.key")
+
+MAGIC = b"VPRC"
+FORMAT_VERSION = 1
+CODECS = ("flac", "original")
+PAYLOAD_SR = 16000
+SIGNATURE_SLOT = "voiceSignature"  # Slot name of the recording behind a voice signature
+
+_PREFIX = struct.Struct("<4sBH")
+_NONCE_BYTES = 12
+_WRAPPED_KEY_BYTES = _NONCE_BYTES + 32 + 16  # nonce + 256-bit key + GCM tag
+
+
+def recording_name(username, slot):
+    """Object name of enrollment recording `slot` (1-3) or of the voice signature (SIGNATURE_SLOT)."""
+    return f"{username}_{slot}.vpr"
+
+
+def legacy_names(username, slot):
+    """(encrypted audio, key) object names of the pre-.vpr format."""
+    if slot == SIGNATURE_SLOT:
+        return f"{username}_voiceSignature.enc", f"{username}_keySignature.txt"
+    return f"{username}_{slot}.enc", f"{username}_key{slot}.txt"
+
+
+def generate_master_key():
+    return base64.urlsafe_b64encode(AESGCM.generate_key(bit_length=256))
+
+
+def key_id(key):
+    return hashlib.sha256(key).hexdigest()[:16]
+
+
+def _seal(aead, plaintext, aad):
+    nonce = os.urandom(_NONCE_BYTES)
+    return nonce + aead.encrypt(nonce, plaintext, aad)
+
+
+def _unseal(aead, sealed, aad):
+    return aead.decrypt(sealed[:_NONCE_BYTES], sealed[_NONCE_BYTES:], aad)
+
+
+class MasterKeyring:
+    def __init__(self, keys):
+        """`keys` are raw 32-byte master keys; the first one wraps new recordings."""
+        if not keys:
+            raise ValueError("At least one master key is required")
+        self._keys = {key_id(key): key for key in keys}
+        self.current_id = key_id(keys[0])
+
+    @classmethod
+    def from_env(cls, path=DEFAULT_MASTER_KEY_PATH):
+        spec = os.environ.get("VOICEPAY_MASTER_KEY")
+        if not spec:
+            if not os.environ.get("VOICEPAY_STORAGE", "cloudinary").startswith("local:"):
+                raise RuntimeError("VOICEPAY_MASTER_KEY must be set when recordings go to shared storage; "
+                                   "a generated local key only works with VOICEPAY_STORAGE=local:<dir>. "
+                                   "Generate one with `python -c \"from recording_format import "
+                                   "generate_master_key; print(generate_master_key().decode())\"`")
+            if not os.path.exists(path):
+                logger.warning("⚠ VOICEPAY_MASTER_KEY is not set; generating a local master key in %s", path)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.tmp-{os.getpid()}"
+                fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+                with os.fdopen(fd, "wb") as f:
+                    f.write(generate_master_key())
+                try:
+                    os.link(tmp_path, path)  # Atomic, and never replaces a key another worker created first
+                except FileExistsError:
+                    pass
+                finally:
+                    os.remove(tmp_path)
+            with open(path, "rb") as f:
+                spec = f.read().decode()
+        keys = [base64.urlsafe_b64decode(part.strip()) for part in spec.split(",") if part.strip()]
+        if any(len(key) != 32 for key in keys):
+            raise ValueError("Master keys must be urlsafe-base64 encoded 32-byte keys")
+        return cls(keys)
+
+    def wrap(self, data_key, aad):
+        return _seal(AESGCM(self._keys[self.current_id]), data_key, aad)
+
+    def unwrap(self, wrapped_id, wrapped, aad):
+        key = self._keys.get(wrapped_id)
+        if key is None:
+            raise ValueError(f"Recording is wrapped under unknown master key {wrapped_id}")
+        return _unseal(AESGCM(key), wrapped, aad)
+
+
+_default_keyring = None
+_default_keyring_lock = threading.Lock()
+
+
+def default_keyring():
+    """The process-wide keyring from VOICEPAY_MASTER_KEY, loaded on first use."""
+    global _default_keyring
+    with _default_keyring_lock:
+        if _default_keyring is None:
+            _default_keyring = MasterKeyring.from_env()
+        return _default_keyring
+
+
+def encode_payload(audio, codec="flac"):
+    """The audio payload of a RequestAudio and its sample rate."""
+    if codec == "original":
+        return audio.data, audio.sr
+    if codec != "flac":
+        raise ValueError(f"Unknown recording codec: {codec}")
+    y = audio.raw_signal  # Untrimmed: the stored recording is what the user said, not what one VAD kept
+    if audio.sr != PAYLOAD_SR:
+        y = librosa.resample(y, orig_sr=audio.sr, target_sr=PAYLOAD_SR)
+    buffer = io.BytesIO()
+    sf.write(buffer, np.clip(y, -1.0, 1.0), PAYLOAD_SR, format="FLAC", subtype="PCM_16")
+    return buffer.getvalue(), PAYLOAD_SR
+
+
+def seal_recording(audio, keyring=None, codec="flac", embeddings=None):
+    """Pack a RequestAudio into one encrypted `.vpr` object.
+
+    `embeddings` ({kind: vector}) are stored in the metadata so reference
+    embeddings can be read back without decoding the audio.
+    """
+    keyring = keyring or default_keyring()
+    payload, payload_sr = encode_payload(audio, codec)
+    metadata = {
+        "duration": len(audio.raw_signal) / audio.sr,
+        "sample_rate": audio.sr,
+        "payload_sample_rate": payload_sr,
+        "created_at": time.time(),
+        "embeddings": {kind: np.asarray(vector, dtype=np.float32).tolist()
+                       for kind, vector in (embeddings or {}).items()},
+    }
+    header = json.dumps({"codec": codec, "key_id": keyring.current_id}, separators=(",", ":")).encode()
+    prefix = _PREFIX.pack(MAGIC, FORMAT_VERSION, len(header)) + header
+
+    data_key = AESGCM.generate_key(bit_length=256)
+    aead = AESGCM(data_key)
+    sealed_metadata = _seal(aead, json.dumps(metadata, separators=(",", ":")).encode(), prefix)
+    return b"".join([prefix, keyring.wrap(data_key, prefix), struct.pack("<I", len(sealed_metadata)),
+                     sealed_metadata, _seal(aead, payload, prefix)])
+
+
+def is_recording(blob):
+    return blob is not None and blob[:len(MAGIC)] == MAGIC
+
+
+def _open(blob, keyring):
+    """Split a `.vpr` object; returns (header, AESGCM under its data key, prefix, sealed metadata, sealed payload)."""
+    if not is_recording(blob) or len(blob) < _PREFIX.size:
+        raise ValueError("Not a voicepay recording")
+    _, version, header_length = _PREFIX.unpack_from(blob)
+    if version > FORMAT_VERSION:
+        raise ValueError(f"Recording format version {version} is newer than this server ({FORMAT_VERSION})")
+    offset = _PREFIX.size + header_length
+    prefix = blob[:offset]
+    header = json.loads(blob[_PREFIX.size:offset])
+    data_key = (keyring or default_keyring()).unwrap(header["key_id"], blob[offset:offset + _WRAPPED_KEY_BYTES],
+                                                     prefix)
+    offset += _WRAPPED_KEY_BYTES
+    (metadata_length,) = struct.unpack_from("<I", blob, offset)
+    offset += 4
+    return (header, AESGCM(data_key), prefix,
+            blob[offset:offset + metadata_length], blob[offset + metadata_length:])
+
+
+def read_metadata(blob, keyring=None):
+    """The recording's metadata (duration, sample rates, codec, embeddings), without decrypting the audio."""
+    header, aead, prefix, sealed_metadata, _ = _open(blob, keyring)
+    metadata = json.loads(_unseal(aead, sealed_metadata, prefix))
+    metadata["codec"] = header["codec"]
+    return metadata
+
+
+def open_recording(blob, keyring=None):
+    """Decrypt a recording; returns (metadata, audio bytes in its codec, readable by audio_features.load_audio)."""
+    header, aead, prefix, sealed_metadata, sealed_payload = _open(blob, keyring)
+    metadata = json.loads(_unseal(aead, sealed_metadata, prefix))
+    metadata["codec"] = header["codec"]
+    return metadata, _unseal(aead, sealed_payload, prefix)
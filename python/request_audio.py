@@ -0,0 +1,108 @@
+"""Per-request audio shared by deepfake detection, transcription and voice matching.
+
+A single upload used to be decoded three times per request (native rate for the
+detector, 16 kHz for voice matching, raw bytes for transcription). `RequestAudio`
+decodes it once and caches every derived signal or spectrum the first time a
+consumer asks for it, so each transform runs at most once per request.
+
+With a `trimmer` (vad.SpeechTrimmer) the decoded signal is cut to its speech
+region right after decoding, and every consumer works on the trimmed signal.
+"""
+import io
+import threading
+
+import numpy as np
+import librosa
+
+from audio_features import features_from_spectrogram, load_audio, magnitude_spectrogram
+from instrumentation import span
+from result_cache import content_hash
+
+
+class RequestAudio:
+    def __init__(self, data, filename=None, trimmer=None):
+        self.data = data  # raw upload bytes, kept for transcription and persistence
+        self.filename = filename
+        self.trimmer = trimmer
+        self._cache = {}
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_signal(cls, y, sr, data=None, trimmer=None):
+        """Wrap an already decoded signal (e.g. from the CLI recorder)."""
+        audio = cls(data, trimmer=trimmer)
+        audio._cache["raw"] = (np.asarray(y, dtype=np.float32), sr)
+        return audio
+
+    def cached(self, key, compute):
+        """Return the value stored under `key`, computing it on first use."""
+        with self._lock:
+            if key not in self._cache:
+                self._cache[key] = compute()
+            return self._cache[key]
+
+    def content_hash(self):
+        """BLAKE2b digest of the raw upload, the key of content-addressed caches."""
+        return self.cached("content_hash", lambda: content_hash(self.data))
+
+    def _raw(self):
+        def decode():
+            with span("decode"):
+                return load_audio(self.data)
+
+        return self.cached("raw", decode)
+
+    def _decoded(self):
+        def trim():
+            y, sr = self._raw()
+            if self.trimmer is None:
+                return y, sr, (0, len(y))
+            with span("vad"):
+                trimmed, bounds = self.trimmer.trim(y, sr)
+            return trimmed, sr, bounds
+
+        return self.cached("decoded", trim)
+
+    @property
+    def signal(self):
+        """Mono float32 signal at the upload's native sample rate, trimmed to speech if a trimmer is set."""
+        return self._decoded()[0]
+
+    @property
+    def raw_signal(self):
+        """The decoded signal before trimming."""
+        return self._raw()[0]
+
+    @property
+    def speech_bounds(self):
+        """(start, end) sample indices of `signal` within `raw_signal`."""
+        return self._decoded()[2]
+
+    @property
+    def sr(self):
+        return self._decoded()[1]
+
+    @property
+    def duration(self):
+        return len(self.signal) / self.sr
+
+    def resampled(self, target_sr):
+        """The signal at `target_sr`; identical to librosa.load(..., sr=target_sr)."""
+        if target_sr == self.sr:
+            return self.signal
+        return self.cached(("resampled", target_sr),
+                           lambda: librosa.resample(self.signal, orig_sr=self.sr, target_sr=target_sr))
+
+    def magnitude_spectrogram(self):
+        """|STFT| of the native-rate signal with the deepfake feature parameters."""
+        return self.cached("magnitude_spectrogram", lambda: magnitude_spectrogram(self.signal))
+
+    def deepfake_features(self):
+        """The 26 unscaled deepfake features in REQUIRED_FEATURES order."""
+        return self.cached("deepfake_features",
+                           lambda: features_from_spectrogram(self.signal, self.sr, self.magnitude_spectrogram()))
+
+    def file_like(self):
+        """A fresh in-memory file over the raw upload, for APIs that want a stream."""
+        return io.BytesIO(self.data)
+
@@ -0,0 +1,92 @@
+"""Content-addressed cache of deepfake results.
+
+Clients retry after a wrong transcript or a network error, and usually resend
+the exact same bytes. `ResultCache` remembers the extracted features and the
+model score per upload, keyed by a BLAKE2b hash of the bytes together with the
+model version, so a resubmission skips decoding, feature extraction and
+inference.
+
+Entries expire `ttl` seconds after they were written and the least recently
+used ones are evicted beyond `max_entries`. Binding the cache to a new model
+version (`set_model_version`, done by `DeepfakeDetector.enable_result_cache`)
+drops every entry, so results of a previous artifact are never served.
+"""
+import collections
+import hashlib
+import threading
+import time
+
+
+def content_hash(data):
+    """Fast 128-bit BLAKE2b digest of raw upload bytes."""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, max_entries=4096, ttl=600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.model_version = None
+        self._entries = collections.OrderedDict()  # (content hash, model version) -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    def set_model_version(self, model_version):
+        """Bind the cache to `model_version`; a different version than before clears it."""
+        with self._lock:
+            if model_version != self.model_version:
+                if self._entries:
+                    self._invalidations += 1
+                self._entries.clear()
+                self.model_version = model_version
+
+    def get(self, digest, model_version):
+        """Return the cached value for this content and model version, or None."""
+        key = (digest, model_version)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                    self._evictions += 1
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[1]
+
+    def put(self, digest, model_version, value):
+        now = time.time()
+        with self._lock:
+            if model_version != self.model_version:
+                return  # Result of a model this cache is no longer bound to
+            key = (digest, model_version)
+            self._entries[key] = (now + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "model_version": self.model_version,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "evictions": self._evictions,
+                "invalidations": self._invalidations,
+            }
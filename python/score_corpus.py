@@ -0,0 +1,189 @@
+"""Offline batch scoring of audio corpora with the deepfake detector.
+
+Walks a directory (or reads a manifest), extracts the 26 dataset features on a
+process pool, scores them in large batches and streams one row per file to CSV
+or JSONL. The first columns are exactly those of dataset/shuffled_file.csv
+(features, then LABEL), so a scored corpus can be fed back into training; path,
+score, predicted_label and model_version follow.
+
+LABEL is the manifest's ground-truth label when it has a `label` column and is
+left empty otherwise: the model's own guess only goes in predicted_label, so it
+can never be fed back into training as ground truth. Re-running with the same output resumes: files already
+in the output are skipped and failed files are retried.
+
+Features come from the same audio the server scores: trimmed to its speech
+region when VOICEPAY_VAD=1 (vad.SpeechTrimmer.from_env), the whole clip otherwise.
+
+Usage:
+    python score_corpus.py --input-dir recordings/ --output scored.csv
+    python score_corpus.py --manifest files.csv --output scored.jsonl --workers 8
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from audio_features import HOP_LENGTH, REQUIRED_FEATURES, extract_features, load_audio
+from deepfake_proper import DEFAULT_ARTIFACT_DIR, DeepfakeDetector
+from vad import SpeechTrimmer
+
+AUDIO_EXTENSIONS = (".wav", ".flac", ".mp3", ".ogg", ".m4a")
+EXTRA_COLUMNS = ["path", "score", "predicted_label", "model_version"]
+COLUMNS = REQUIRED_FEATURES + ["LABEL"] + EXTRA_COLUMNS
+
+# Built like the app's, in every worker process
+speech_trimmer = SpeechTrimmer.from_env(align=HOP_LENGTH)
+
+
+def iter_directory(root):
+    for dirpath, _, filenames in os.walk(root):
+        for filename in sorted(filenames):
+            if filename.lower().endswith(AUDIO_EXTENSIONS):
+                yield os.path.join(dirpath, filename), None
+
+
+def iter_manifest(manifest_path):
+    """Yield (path, label) from a CSV with a `path` (and optional `label`) column, or one path per line."""
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    with open(manifest_path, newline="") as f:
+        first_line = f.readline()
+        f.seek(0)
+        if "path" in next(csv.reader([first_line]), []):
+            rows = ((row["path"], row.get("label") or None) for row in csv.DictReader(f))
+        else:
+            rows = ((line.strip(), None) for line in f)
+        for path, label in rows:
+            if path:
+                yield os.path.join(base_dir, path), label
+
+
+def _extract(path):
+    """Worker: return (path, features or None, error or None)."""
+    try:
+        y, sr = load_audio(path)
+        if speech_trimmer is not None:
+            y, _ = speech_trimmer.trim(y, sr)
+        return path, extract_features(y, sr), None
+    except Exception as e:
+        return path, None, str(e)
+
+
+def completed_paths(output_path, fmt):
+    """Paths already scored in `output_path`; drops a trailing partial line left by an interruption."""
+    if not os.path.exists(output_path):
+        return set()
+    with open(output_path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+            data = data[:data.rfind(b"\n") + 1]
+    lines = data.decode("utf-8").splitlines()
+    if fmt == "jsonl":
+        return {json.loads(line)["path"] for line in lines if line.strip()}
+    return {row["path"] for row in csv.DictReader(lines)}
+
+
+class ResultWriter:
+    def __init__(self, output_path, fmt):
+        self.fmt = fmt
+        is_new = not os.path.exists(output_path) or os.path.getsize(output_path) == 0
+        self.file = open(output_path, "a", newline="")
+        if fmt == "csv":
+            self.writer = csv.DictWriter(self.file, fieldnames=COLUMNS)
+            if is_new:
+                self.writer.writeheader()
+
+    def write(self, rows):
+        for row in rows:
+            if self.fmt == "jsonl":
+                self.file.write(json.dumps(row) + "\n")
+            else:
+                self.writer.writerow(row)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def score_corpus(items, output_path, fmt="csv", artifact_dir=DEFAULT_ARTIFACT_DIR, workers=None, batch_size=512):
+    detector = DeepfakeDetector.load(artifact_dir)
+    done = completed_paths(output_path, fmt)
+    todo = [(path, label) for path, label in items if path not in done]
+    labels = dict(todo)
+    print(f"🔹 {len(done)} files already scored, {len(todo)} to go.")
+
+    writer = ResultWriter(output_path, fmt)
+    scored = failed = 0
+    start = time.perf_counter()
+    pending_paths, pending_features = [], []
+
+    def flush():
+        nonlocal scored
+        if not pending_paths:
+            return
+        features = np.stack(pending_features)
+        scores = detector.score_batch(detector.scale(features))
+        rows = []
+        for path, row, score in zip(pending_paths, features, scores):
+            predicted = detector.label_classes[1] if score >= 0.5 else detector.label_classes[0]
+            record = dict(zip(REQUIRED_FEATURES, (float(v) for v in row)))
+            record.update({
+                "LABEL": labels[path] or "",
+                "path": path,
+                "score": float(score),
+                "predicted_label": predicted,
+                "model_version": detector.model_version,
+            })
+            rows.append(record)
+        writer.write(rows)
+        scored += len(rows)
+        pending_paths.clear()
+        pending_features.clear()
+        elapsed = time.perf_counter() - start
+        print(f"🔹 {scored}/{len(todo)} scored, {failed} failed, {scored / elapsed:.1f} files/s")
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for path, features, error in pool.map(_extract, [path for path, _ in todo], chunksize=8):
+                if error is not None:
+                    failed += 1
+                    print(f"❌ {path}: {error}", file=sys.stderr)
+                    continue
+                pending_paths.append(path)
+                pending_features.append(features)
+                if len(pending_paths) >= batch_size:
+                    flush()
+            flush()
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"✅ Scored {scored} files ({failed} failed) in {elapsed:.1f}s "
+          f"({scored / elapsed if elapsed else 0:.1f} files/s) -> {output_path}")
+    return scored, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score an audio corpus with the deepfake detector.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--input-dir", help="Directory to walk for audio files.")
+    source.add_argument("--manifest", help="CSV with a path (and optional label) column, or one path per line.")
+    parser.add_argument("--output", required=True, help="Output .csv or .jsonl file (appended to on resume).")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="Defaults to the output file extension.")
+    parser.add_argument("--artifact", default=DEFAULT_ARTIFACT_DIR)
+    parser.add_argument("--workers", type=int, default=None, help="Feature extraction processes (default: CPUs).")
+    parser.add_argument("--batch-size", type=int, default=512)
+    args = parser.parse_args()
+
+    fmt = args.format or ("jsonl" if args.output.endswith(".jsonl") else "csv")
+    items = iter_directory(args.input_dir) if args.input_dir else iter_manifest(args.manifest)
+    score_corpus(list(items), args.output, fmt, args.artifact, args.workers, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
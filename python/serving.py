@@ -0,0 +1,95 @@
+"""Process and thread sizing for serving the API in production.
+
+`gunicorn.conf.py` runs `app:app` in several worker processes, which is what
+makes throughput scale with cores. Every worker would otherwise start BLAS,
+OpenMP, TensorFlow and torch thread pools as wide as the machine, so N workers
+fight over N² threads. `configure_threads()` gives each worker its share of the
+cores instead. It only takes full effect before numpy/TensorFlow are imported,
+so the gunicorn config calls it in the master before any worker loads the app.
+
+Inside a worker, `StageExecutor`s separate the two kinds of request work:
+
+- CPU stages (decode, features, inference, embedding) run on a pool as wide as
+  the worker's core share, so concurrent requests queue for the CPU instead of
+  oversubscribing it;
+- I/O stages (transcription, storage downloads) run on a wider pool, so they
+  overlap with the CPU stages of the same request instead of following them.
+"""
+import logging
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from instrumentation import propagate
+
+logger = logging.getLogger("voicepay.serving")
+
+# Read once by numpy's BLAS, OpenMP, numba and TensorFlow when they initialize
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "NUMEXPR_NUM_THREADS",
+                   "NUMBA_NUM_THREADS", "TF_NUM_INTRAOP_THREADS")
+
+
+def cpu_count():
+    """Cores this process may run on (respects CPU affinity and container cpusets)."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def threads_per_worker(workers):
+    """Each worker's share of the cores, at least one."""
+    return max(1, cpu_count() // max(1, workers))
+
+
+def configure_threads(intra_op, inter_op=1):
+    """Cap the numeric libraries' thread pools of this process (and of processes forked from it)."""
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(intra_op)
+    os.environ["TF_NUM_INTEROP_THREADS"] = str(inter_op)
+
+    # Libraries that are already loaded have read the environment; set them directly
+    if "tensorflow" in sys.modules:
+        tf = sys.modules["tensorflow"]
+        try:
+            tf.config.threading.set_intra_op_parallelism_threads(intra_op)
+            tf.config.threading.set_inter_op_parallelism_threads(inter_op)
+        except RuntimeError as e:  # TensorFlow has already created its thread pools
+            logger.warning("⚠ Could not set TensorFlow thread counts: %s", e)
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(intra_op)
+    logger.info("🔹 Numeric libraries limited to %d threads (%d inter-op)", intra_op, inter_op)
+
+
+class StageExecutor:
+    """A bounded thread pool for one kind of request stage, with a count of jobs not yet finished."""
+
+    def __init__(self, max_workers, name):
+        self.max_workers = max_workers
+        self.name = name
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"voicepay-{name}")
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    def submit(self, fn, *args, **kwargs):
+        """Run `fn(*args, **kwargs)` on the pool; returns its Future."""
+        with self._lock:
+            self._pending += 1
+        future = self._pool.submit(fn, *args, **kwargs)
+        future.add_done_callback(self._done)
+        return future
+
+    def run(self, fn, *args, **kwargs):
+        """Run `fn` on the pool and wait for its result (re-raises its exception).
+
+        Spans `fn` opens count as nested in the caller's current span, since the caller waits for them.
+        """
+        return self.submit(propagate(fn), *args, **kwargs).result()
+
+    def _done(self, future):
+        with self._lock:
+            self._pending -= 1
+
+    def stats(self):
+        with self._lock:
+            return {"max_workers": self.max_workers, "pending": self._pending}
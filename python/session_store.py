@@ -0,0 +1,288 @@
+"""Enrollment session stores.
+
+A session is the JSON-serializable dict `get_sentences` creates for a user
+(session_id, sentences, index, embeddings). Stores expire sessions after
+`ttl` seconds without access and evict the least recently used ones beyond
+`max_sessions`, so abandoned enrollments no longer leak memory.
+
+`advance` is the only way to move a session forward: it applies the updates and
+increments `index` only if the index is still the one the caller read, so two
+concurrent requests for the same user cannot both advance it. `rewind` undoes an
+advance whose follow-up work could not be started.
+
+- `MemorySessionStore`: in-process, for a single worker.
+- `SQLiteSessionStore`: shared by every worker on the host through one SQLite file.
+
+`session_store_from_env()` picks one from VOICEPAY_SESSION_STORE ("memory" or "sqlite:<path>").
+"""
+import abc
+import collections
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_TTL = float(os.environ.get("VOICEPAY_SESSION_TTL", "1800"))
+DEFAULT_MAX_SESSIONS = int(os.environ.get("VOICEPAY_MAX_SESSIONS", "10000"))
+
+
+class SessionStore(abc.ABC):
+    def __init__(self, ttl=DEFAULT_TTL, max_sessions=DEFAULT_MAX_SESSIONS):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+
+    @abc.abstractmethod
+    def create(self, username, session):
+        """Start (or restart) the user's session; returns the previous session, if any."""
+
+    @abc.abstractmethod
+    def get(self, username):
+        """Return a copy of the user's live session, or None if there is none or it expired."""
+
+    @abc.abstractmethod
+    def advance(self, username, expected_index, updates=None):
+        """Apply `updates` and increment the index if it still equals `expected_index`.
+
+        Returns the updated session, or None if the session is gone or was advanced concurrently.
+        """
+
+    @abc.abstractmethod
+    def record(self, username, session_id, field, key, value):
+        """Set session[field][key] = value without touching the index (e.g. from a background job).
+
+        Only applies if the user's live session is still `session_id`; returns whether it did.
+        """
+
+    @abc.abstractmethod
+    def rewind(self, username, session_id, index, updates=None):
+        """Undo `advance(username, index, ...)`: set the index back to `index` and apply `updates`.
+
+        Only applies if the live session is still `session_id` at `index + 1`; returns whether it did.
+        """
+
+    @abc.abstractmethod
+    def delete(self, username):
+        """Drop the user's session."""
+
+
+class MemorySessionStore(SessionStore):
+    def __init__(self, ttl=DEFAULT_TTL, max_sessions=DEFAULT_MAX_SESSIONS):
+        super().__init__(ttl, max_sessions)
+        self._sessions = collections.OrderedDict()  # username -> (expires_at, session), LRU first
+        self._lock = threading.Lock()
+
+    def _live(self, username, now):
+        entry = self._sessions.get(username)
+        if entry is None:
+            return None
+        if entry[0] <= now:
+            del self._sessions[username]
+            return None
+        return entry[1]
+
+    def _touch(self, username, session, now):
+        self._sessions[username] = (now + self.ttl, session)
+        self._sessions.move_to_end(username)
+
+    def create(self, username, session):
+        now = time.time()
+        with self._lock:
+            previous = self._live(username, now)
+            self._touch(username, json.loads(json.dumps(session)), now)
+            # With a fixed TTL, LRU order is also expiry order, so this sweeps expired sessions too
+            while self._sessions:
+                oldest, (expires_at, _) = next(iter(self._sessions.items()))
+                if len(self._sessions) <= self.max_sessions and expires_at > now:
+                    break
+                del self._sessions[oldest]
+        return previous
+
+    def get(self, username):
+        now = time.time()
+        with self._lock:
+            session = self._live(username, now)
+            if session is None:
+                return None
+            self._touch(username, session, now)
+            return json.loads(json.dumps(session))
+
+    def advance(self, username, expected_index, updates=None):
+        now = time.time()
+        with self._lock:
+            session = self._live(username, now)
+            if session is None or session["index"] != expected_index:
+                return None
+            session = dict(session, **json.loads(json.dumps(updates or {})))
+            session["index"] = expected_index + 1
+            self._touch(username, session, now)
+            return json.loads(json.dumps(session))
+
+    def record(self, username, session_id, field, key, value):
+        now = time.time()
+        with self._lock:
+            session = self._live(username, now)
+            if session is None or session.get("session_id") != session_id:
+                return False
+            session = dict(session)
+            session[field] = dict(session.get(field) or {}, **{key: json.loads(json.dumps(value))})
+            self._sessions[username] = (self._sessions[username][0], session)
+            return True
+
+    def rewind(self, username, session_id, index, updates=None):
+        now = time.time()
+        with self._lock:
+            session = self._live(username, now)
+            if session is None or session.get("session_id") != session_id or session["index"] != index + 1:
+                return False
+            session = dict(session, **json.loads(json.dumps(updates or {})))
+            session["index"] = index
+            self._touch(username, session, now)
+            return True
+
+    def delete(self, username):
+        with self._lock:
+            self._sessions.pop(username, None)
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+class SQLiteSessionStore(SessionStore):
+    def __init__(self, path, ttl=DEFAULT_TTL, max_sessions=DEFAULT_MAX_SESSIONS):
+        super().__init__(ttl, max_sessions)
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    username    TEXT PRIMARY KEY,
+                    idx         INTEGER NOT NULL,
+                    data        TEXT    NOT NULL,
+                    expires_at  REAL    NOT NULL,
+                    last_access REAL    NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_last_access ON sessions (last_access)")
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None: transactions are opened explicitly with BEGIN IMMEDIATE
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        return conn
+
+    @staticmethod
+    def _decode(idx, data):
+        session = json.loads(data)
+        session["index"] = idx
+        return session
+
+    def create(self, username, session):
+        now = time.time()
+        conn = self._transaction()
+        try:
+            row = conn.execute("SELECT idx, data FROM sessions WHERE username = ? AND expires_at > ?",
+                               (username, now)).fetchone()
+            conn.execute("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?)",
+                         (username, session["index"], json.dumps(session), now + self.ttl, now))
+            conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,))
+            conn.execute("""
+                DELETE FROM sessions WHERE username IN (
+                    SELECT username FROM sessions ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_sessions,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return self._decode(*row) if row else None
+
+    def get(self, username):
+        now = time.time()
+        conn = self._transaction()
+        try:
+            row = conn.execute("SELECT idx, data FROM sessions WHERE username = ? AND expires_at > ?",
+                               (username, now)).fetchone()
+            if row:
+                conn.execute("UPDATE sessions SET expires_at = ?, last_access = ? WHERE username = ?",
+                             (now + self.ttl, now, username))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return self._decode(*row) if row else None
+
+    def advance(self, username, expected_index, updates=None):
+        now = time.time()
+        conn = self._transaction()
+        try:
+            row = conn.execute("SELECT idx, data FROM sessions WHERE username = ? AND idx = ? AND expires_at > ?",
+                               (username, expected_index, now)).fetchone()
+            session = None
+            if row:
+                session = dict(self._decode(*row), **(updates or {}))
+                session["index"] = expected_index + 1
+                conn.execute("""
+                    UPDATE sessions SET idx = ?, data = ?, expires_at = ?, last_access = ?
+                    WHERE username = ? AND idx = ?
+                """, (session["index"], json.dumps(session), now + self.ttl, now, username, expected_index))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return json.loads(json.dumps(session)) if session else None
+
+    def record(self, username, session_id, field, key, value):
+        conn = self._transaction()
+        try:
+            row = conn.execute("SELECT idx, data FROM sessions WHERE username = ? AND expires_at > ?",
+                               (username, time.time())).fetchone()
+            session = self._decode(*row) if row else None
+            recorded = session is not None and session.get("session_id") == session_id
+            if recorded:
+                session[field] = dict(session.get(field) or {}, **{key: value})
+                conn.execute("UPDATE sessions SET data = ? WHERE username = ?", (json.dumps(session), username))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return recorded
+
+    def rewind(self, username, session_id, index, updates=None):
+        conn = self._transaction()
+        try:
+            row = conn.execute("SELECT idx, data FROM sessions WHERE username = ? AND idx = ? AND expires_at > ?",
+                               (username, index + 1, time.time())).fetchone()
+            session = self._decode(*row) if row else None
+            rewound = session is not None and session.get("session_id") == session_id
+            if rewound:
+                session = dict(session, **(updates or {}))
+                session["index"] = index
+                conn.execute("UPDATE sessions SET idx = ?, data = ? WHERE username = ?",
+                             (index, json.dumps(session), username))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return rewound
+
+    def delete(self, username):
+        self._connection().execute("DELETE FROM sessions WHERE username = ?", (username,))
+
+
+def session_store_from_env():
+    spec = os.environ.get("VOICEPAY_SESSION_STORE", "memory")
+    if spec == "memory":
+        return MemorySessionStore()
+    if spec.startswith("sqlite:"):
+        return SQLiteSessionStore(spec[len("sqlite:"):])
+    raise ValueError(f"Unknown VOICEPAY_SESSION_STORE backend: {spec}")
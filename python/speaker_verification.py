@@ -0,0 +1,223 @@
+"""Speaker verification against enrolled reference embeddings.
+
+`SpeakerVerifier` scores a probe embedding against every reference of the user
+and, when an impostor cohort is loaded, against the whole cohort in a single
+matrix-vector product. All embeddings are L2-normalized and kept as contiguous
+float32 rows, so each score is a cosine similarity.
+
+With a cohort, the raw scores are z-normalized against the probe's top-k
+cohort scores (adaptive score normalization). That turns the fixed cosine
+threshold into "how much closer to the claimed user than to the closest
+strangers", which is much steadier across microphones and embedders.
+
+Embedders:
+- `MFCCMeanEmbedder` ("mfcc_mean"): mean MFCC at 16 kHz, the embedding the app has always used.
+- `ECAPAEmbedder` ("ecapa"): speechbrain's ECAPA-TDNN speaker model (spkrec-ecapa-voxceleb),
+  loaded on first use. Needs the optional `speechbrain` and `torch` packages.
+
+`embedder_from_env()` picks one from VOICEPAY_SPEAKER_EMBEDDING ("mfcc_mean" or "ecapa").
+
+Embeddings of speech-trimmed audio (see vad.py) are stored under their own kind
+("mfcc_mean+vad"), since silence shifts a mean-MFCC vector. When a user has no
+embeddings of the current kind, they are rebuilt from the stored enrollment
+recordings with the same embedder and trimming.
+
+Switching VAD on (or changing the embedder) therefore costs every enrolled user
+one rebuild, on the request thread of their next verification. The rebuild
+downloads and decrypts their 3 recordings and embeds them, which takes about
+30 ms of CPU with mfcc_mean on top of the downloads (measured by
+benchmarks/bench_speaker_verification.py). `.vpr` recordings that already hold
+an embedding of the new kind skip the decoding. Enrollment drops a user's rows
+of every kind, so rows of another kind never outlive the recordings they came
+from.
+"""
+import logging
+import os
+import threading
+
+import numpy as np
+
+from embedding_store import DEFAULT_KIND
+from request_audio import RequestAudio
+from voice_matching import _signal_at_match_rate, download_reference_embeddings, mfcc_mean
+
+DEFAULT_THRESHOLD = 0.85  # Cosine similarity a reference must exceed to count as a match
+DEFAULT_COHORT_THRESHOLD = 2.0  # Same, in cohort standard deviations once scores are normalized
+DEFAULT_COHORT_TOP_K = 50
+
+logger = logging.getLogger("voicepay.speaker_verification")
+
+
+def l2_normalize(embeddings):
+    """Return `embeddings` as a contiguous float32 (n, dim) matrix of unit-length rows."""
+    matrix = np.array(embeddings, dtype=np.float32, ndmin=2, order="C")
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+
+class MFCCMeanEmbedder:
+    name = DEFAULT_KIND
+
+    def embed(self, audio, sr=None):
+        return mfcc_mean(audio, sr)
+
+
+class ECAPAEmbedder:
+    name = "ecapa"
+    source = "speechbrain/spkrec-ecapa-voxceleb"
+
+    def __init__(self, savedir=None):
+        self.savedir = savedir or os.path.expanduser("~/.speechbrain_models/spkrec")
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        with self._lock:
+            if self._model is None:
+                try:
+                    from speechbrain.inference import SpeakerRecognition
+                except ImportError as e:
+                    raise ImportError("ECAPAEmbedder needs the optional `speechbrain` and `torch` packages.") from e
+                self._model = SpeakerRecognition.from_hparams(source=self.source, savedir=self.savedir)
+            return self._model
+
+    def embed(self, audio, sr=None):
+        def compute():
+            import torch
+
+            y = _signal_at_match_rate(audio, sr)  # The model was trained on 16 kHz audio
+            with torch.no_grad():
+                embedding = self.model.encode_batch(torch.from_numpy(np.ascontiguousarray(y, dtype=np.float32))[None])
+            return embedding.squeeze().cpu().numpy()
+
+        if isinstance(audio, RequestAudio):
+            return audio.cached("ecapa_embedding", compute)
+        return compute()
+
+
+EMBEDDERS = {
+    MFCCMeanEmbedder.name: MFCCMeanEmbedder,
+    ECAPAEmbedder.name: ECAPAEmbedder,
+}
+
+
+def embedder_from_env():
+    spec = os.environ.get("VOICEPAY_SPEAKER_EMBEDDING", DEFAULT_KIND)
+    if spec not in EMBEDDERS:
+        raise ValueError(f"Unknown VOICEPAY_SPEAKER_EMBEDDING: {spec}")
+    return EMBEDDERS[spec]()
+
+
+class SpeakerVerifier:
+    def __init__(self, embedder=None, store=None, storage=None, threshold=DEFAULT_THRESHOLD,
+                 cohort_threshold=DEFAULT_COHORT_THRESHOLD, cohort_top_k=DEFAULT_COHORT_TOP_K, trimmer=None):
+        self.embedder = embedder or MFCCMeanEmbedder()
+        self.trimmer = trimmer  # Must match the trimmer of the RequestAudio objects passed in
+        self.store = store
+        self.storage = storage
+        self.threshold = threshold
+        self.cohort_threshold = cohort_threshold
+        self.cohort_top_k = cohort_top_k
+        self._cohort = None  # (usernames, normalized matrix)
+        self._cohort_version = None  # Store version the cohort was read at, if it came from the store
+        self._reloader = None
+        self._reload_lock = threading.Lock()
+
+    @property
+    def kind(self):
+        return self.embedder.name + ("+vad" if self.trimmer is not None else "")
+
+    def embed(self, audio, sr=None):
+        return self.embedder.embed(audio, sr)
+
+    def load_cohort(self, embeddings=None, usernames=None):
+        """Use `embeddings` (or every enrolled embedding of this kind in the store) as the impostor cohort."""
+        version = None
+        if embeddings is None:
+            version = self.store.version()  # Read first: a concurrent write then triggers a reload
+            usernames, embeddings = self.store.all(self.kind)
+        cohort = None
+        if embeddings is not None and len(embeddings):
+            cohort = (np.asarray(usernames) if usernames is not None else None, l2_normalize(embeddings))
+        self._cohort, self._cohort_version = cohort, version  # Requests in flight keep the cohort they read
+        return len(cohort[1]) if cohort is not None else 0
+
+    def refresh_cohort(self):
+        """Reload a store-backed cohort on a background thread once the store has changed.
+
+        Returns True if a reload was started; verifications keep using the current cohort until it is done.
+        """
+        if self._cohort_version is None or self.store.version() == self._cohort_version:
+            return False
+        with self._reload_lock:
+            if self._reloader is not None and self._reloader.is_alive():
+                return False
+
+            def reload():
+                try:
+                    self.load_cohort()
+                except Exception:
+                    logger.exception("❌ Speaker cohort reload failed")
+
+            self._reloader = threading.Thread(target=reload, name="cohort-reload", daemon=True)
+            self._reloader.start()
+        return True
+
+    def references(self, username):
+        """The user's reference embeddings, backfilling the store from the recordings if needed."""
+        references = self.store.get(username, self.kind) if self.store is not None else None
+        if references is None and self.storage is not None:
+            references = download_reference_embeddings(
+                username, self.storage, lambda data: self.embed(RequestAudio(data, trimmer=self.trimmer)),
+                kind=self.kind)
+            if self.store is not None and references:
+                self.store.replace(username, references, self.kind)
+        return references
+
+    def score(self, probe, references, username=None):
+        """Cosine scores of `probe` against `references`, z-normalized by the cohort if one is loaded.
+
+        Returns (raw_scores, normalized_scores or None).
+        """
+        probe = l2_normalize(probe)[0]
+        raw = l2_normalize(references) @ probe
+        if self._cohort is None:
+            return raw, None
+
+        usernames, cohort = self._cohort
+        cohort_scores = cohort @ probe
+        if username is not None and usernames is not None:
+            cohort_scores = cohort_scores[usernames != username]  # The claimed user is not an impostor
+        if len(cohort_scores) < 2:
+            return raw, None
+        top = np.partition(cohort_scores, -min(self.cohort_top_k, len(cohort_scores)))[-self.cohort_top_k:]
+        return raw, (raw - top.mean()) / max(float(top.std()), 1e-6)
+
+    def verify(self, username, audio, sr=None):
+        """Score the probe audio against the user's references.
+
+        Returns a dict with `match`, the per-reference `scores` and, with a cohort, `normalized` scores.
+        A probe matches when at least 2 references (or the only one) score above the threshold;
+        users with no references are let through, as before.
+        """
+        references = self.references(username)
+        if references is None or not len(references):
+            return {"match": True, "scores": [], "normalized": None, "matches": 0}
+
+        self.refresh_cohort()
+
+        raw, normalized = self.score(self.embed(audio, sr), references, username)
+        if normalized is None:
+            matches = int(np.sum(raw > self.threshold))
+        else:
+            matches = int(np.sum(normalized > self.cohort_threshold))
+        required = 2 if len(raw) >= 2 else 1
+        return {
+            "match": matches >= required,
+            "scores": raw.tolist(),
+            "normalized": normalized.tolist() if normalized is not None else None,
+            "matches": matches,
+        }
+
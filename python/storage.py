@@ -0,0 +1,153 @@
+"""Object storage for encrypted recordings and their keys.
+
+Every backend exposes `put`/`get` for single objects and `put_many`/`get_many`,
+which run on a shared thread pool so an encrypted recording and its key travel in
+parallel instead of one after another.
+
+- `CloudinaryStorage` uploads through the Cloudinary SDK and downloads over a pooled
+  `requests.Session` with timeouts and retries.
+- `LocalStorage` keeps objects on the filesystem so the whole flow can be tested and
+  benchmarked offline; `latency` simulates a network round-trip per call.
+
+`storage_from_env()` picks the backend from VOICEPAY_STORAGE ("cloudinary" or "local:<dir>").
+"""
+import abc
+import io
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger("voicepay.storage")
+
+DEFAULT_TIMEOUT = float(os.environ.get("VOICEPAY_STORAGE_TIMEOUT", "10"))
+DEFAULT_RETRIES = int(os.environ.get("VOICEPAY_STORAGE_RETRIES", "3"))
+DEFAULT_MAX_WORKERS = int(os.environ.get("VOICEPAY_STORAGE_WORKERS", "8"))
+
+
+class ObjectStorage(abc.ABC):
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="storage")
+
+    @abc.abstractmethod
+    def put(self, name, data):
+        """Store `data` under `name`; returns the object's URL."""
+
+    @abc.abstractmethod
+    def get(self, name):
+        """Return the bytes stored under `name`, or None if there is no such object."""
+
+    @abc.abstractmethod
+    def delete(self, name):
+        """Remove the object `name` if it exists."""
+
+    def put_many(self, objects):
+        """Store every {name: data} pair concurrently; returns {name: url}."""
+        futures = {name: self._executor.submit(self.put, name, data) for name, data in objects.items()}
+        return {name: future.result() for name, future in futures.items()}
+
+    def get_many(self, names):
+        """Fetch every name concurrently; returns {name: bytes or None}."""
+        futures = {name: self._executor.submit(self.get, name) for name in names}
+        return {name: future.result() for name, future in futures.items()}
+
+
+class CloudinaryStorage(ObjectStorage):
+    def __init__(self, cloud_name, resource_type="raw", timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES,
+                 max_workers=DEFAULT_MAX_WORKERS):
+        super().__init__(max_workers)
+        self.cloud_name = cloud_name
+        self.resource_type = resource_type
+        self.timeout = timeout
+        self.retries = retries
+
+        retry = Retry(total=retries, backoff_factor=0.3, status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=frozenset(["GET"]))
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def url(self, name):
+        return f"https://res.cloudinary.com/{self.cloud_name}/{self.resource_type}/upload/{name}"
+
+    def put(self, name, data):
+        import cloudinary.uploader
+
+        for attempt in range(self.retries + 1):
+            try:
+                response = cloudinary.uploader.upload(io.BytesIO(data), resource_type=self.resource_type,
+                                                      public_id=name, overwrite=True, timeout=self.timeout)
+                return response["secure_url"]
+            except Exception as e:
+                if attempt == self.retries:
+                    raise
+                logger.warning("⚠ Upload of %s failed (%s). Retrying (%d/%d)...", name, e, attempt + 1, self.retries)
+                time.sleep(0.3 * 2 ** attempt)
+
+    def get(self, name):
+        response = self.session.get(self.url(name), timeout=self.timeout)
+        if response.status_code != 200:
+            return None
+        return response.content
+
+    def delete(self, name):
+        import cloudinary.uploader
+
+        cloudinary.uploader.destroy(name, resource_type=self.resource_type, invalidate=True)
+
+
+class LocalStorage(ObjectStorage):
+    def __init__(self, root, latency=0.0, max_workers=DEFAULT_MAX_WORKERS):
+        super().__init__(max_workers)
+        self.root = os.path.abspath(root)
+        self.latency = latency
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, name):
+        path = os.path.abspath(os.path.join(self.root, name))
+        if os.path.dirname(path) != self.root:
+            raise ValueError(f"Invalid object name: {name}")
+        return path
+
+    def url(self, name):
+        return "file://" + self._path(name)
+
+    def put(self, name, data):
+        if self.latency:
+            time.sleep(self.latency)
+        path = self._path(name)
+        tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return self.url(name)
+
+    def get(self, name):
+        if self.latency:
+            time.sleep(self.latency)
+        try:
+            with open(self._path(name), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def delete(self, name):
+        try:
+            os.remove(self._path(name))
+        except FileNotFoundError:
+            pass
+
+
+def storage_from_env(cloud_name="dge7bcso3"):
+    spec = os.environ.get("VOICEPAY_STORAGE", "cloudinary")
+    if spec.startswith("local:"):
+        return LocalStorage(spec[len("local:"):])
+    if spec == "cloudinary":
+        return CloudinaryStorage(cloud_name)
+    raise ValueError(f"Unknown VOICEPAY_STORAGE backend: {spec}")
@@ -0,0 +1,293 @@
+"""Incremental decoding and deepfake feature extraction for streamed uploads.
+
+Every deepfake feature is a mean over STFT frames, so most of the work can be
+done while the upload is still arriving. `StreamingFeatureExtractor` computes
+each frame's spectrum, RMS, spectral stats, zero-crossing rate, mel bands and
+pitch peaks as soon as that frame's samples are in. Once the stream ends,
+`features()` only has to finish the parts that depend on the whole clip:
+
+- MFCCs: power_to_db clips at 80 dB below the loudest mel bin of the clip, so
+  the mel frames are kept and converted at the end;
+- chroma: librosa estimates the tuning from the pitch peaks of every frame
+  before building its chroma filter, so the peaks and the power frames are kept
+  and the filter is applied once the tuning is known.
+
+The result equals `audio_features.extract_features` on the whole signal up to
+float rounding. This includes the centered STFT's zero padding and the edge
+padding of the zero-crossing rate.
+
+`features(bounds, y)` returns the features of the signal cut to a (start, end)
+sample range, e.g. the speech region found by vad.SpeechTrimmer, and matches
+`extract_features(y[start:end])` the same way. When `start` is a multiple of the
+hop (see SpeechTrimmer's `align`), the frames of the cut signal are frames of
+the whole clip, except for the two or three at each cut that reach into the
+padding: only those are recomputed from `y`. Otherwise every frame is.
+
+`WavStreamDecoder` turns the bytes of a 16-bit PCM WAV, split anywhere, into the
+same mono float32 samples librosa.load would return.
+"""
+import struct
+
+import numpy as np
+import librosa
+
+from audio_features import HOP_LENGTH, N_FFT, N_MFCC
+
+PAD = N_FFT // 2  # Centered frames reach this far before the first and after the last sample
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+class WavStreamDecoder:
+    def __init__(self):
+        self.sample_rate = None
+        self.channels = None
+        self._buffer = bytearray()
+        self._in_data = False
+        self._remaining = None  # Bytes left in the data chunk, if the header gave a real size
+
+    def feed(self, chunk):
+        """Decode `chunk`; returns the mono float32 samples it completed (possibly none)."""
+        self._buffer += chunk
+        if not self._in_data and not self._parse_header():
+            return np.empty(0, dtype=np.float32)
+
+        frame_bytes = 2 * self.channels
+        usable = len(self._buffer) - len(self._buffer) % frame_bytes
+        if self._remaining is not None:
+            usable = min(usable, self._remaining)
+            self._remaining -= usable
+        pcm = np.frombuffer(bytes(self._buffer[:usable]), dtype="<i2")
+        del self._buffer[:usable]
+        if self._remaining == 0:
+            self._buffer.clear()  # Chunks after the audio data (LIST, ...)
+        y = pcm.astype(np.float32) / 32768
+        if self.channels > 1:
+            y = y.reshape(-1, self.channels).mean(axis=1)  # Channel average, as librosa.load(mono=True)
+        return y
+
+    def _parse_header(self):
+        """Consume the RIFF header up to the data chunk; returns False while more bytes are needed."""
+        buffer = self._buffer
+        if len(buffer) < 12:
+            return False
+        if buffer[:4] != b"RIFF" or buffer[8:12] != b"WAVE":
+            raise ValueError("The stream is not a WAV file")
+        offset = 12
+        while len(buffer) >= offset + 8:
+            chunk_id = bytes(buffer[offset:offset + 4])
+            size = struct.unpack_from("<I", buffer, offset + 4)[0]
+            if chunk_id == b"data":
+                if self.channels is None:
+                    raise ValueError("WAV data chunk before its fmt chunk")
+                # Streaming writers leave the size at 0 or 0xFFFFFFFF; then everything that follows is audio
+                self._remaining = size if 0 < size < 0xFFFFFFFF else None
+                del buffer[:offset + 8]
+                self._in_data = True
+                return True
+            if len(buffer) < offset + 8 + size:
+                return False
+            if chunk_id == b"fmt ":
+                fmt, channels, rate, _, _, bits = struct.unpack_from("<HHIIHH", buffer, offset + 8)
+                if fmt == WAVE_FORMAT_EXTENSIBLE and size >= 26:
+                    fmt = struct.unpack_from("<H", buffer, offset + 32)[0]  # Sub-format GUID starts with the tag
+                if fmt != WAVE_FORMAT_PCM or bits != 16 or not channels:
+                    raise ValueError("Only 16-bit PCM WAV can be streamed")
+                self.channels, self.sample_rate = channels, rate
+            offset += 8 + size + size % 2  # Chunks are word aligned
+        return False
+
+
+class StreamingFeatureExtractor:
+    def __init__(self, sr):
+        self.sr = sr
+        self.n_samples = 0
+        self.n_frames = 0
+        self._first_sample = None
+        self._last_sample = None
+        self._tail = np.zeros(PAD, dtype=np.float32)  # Samples still needed by unfinished frames
+        self._tail_start = -PAD  # Sample index of _tail[0]; negative indices are the leading zero padding
+        self._stats = []  # Per block: (frames, 5) rms, centroid, bandwidth, rolloff, zero-crossing rate
+        self._mel = []
+        self._power = []
+        self._peaks = []  # Per block: (frame index, pitch, magnitude) of every piptrack peak
+        self.finished = False
+
+    def feed(self, y):
+        """Add samples and compute every frame they complete."""
+        if self.finished:
+            raise RuntimeError("The stream has already been finished")
+        y = np.asarray(y, dtype=np.float32)
+        if not len(y):
+            return
+        if self._first_sample is None:
+            self._first_sample = y[0]
+        self._tail = np.concatenate([self._tail, y])
+        self.n_samples += len(y)
+        # Frame t covers samples [t * hop - PAD, t * hop + PAD)
+        available = (self._tail_start + len(self._tail) - PAD) // HOP_LENGTH + 1
+        self._process(available)
+
+    def finish(self):
+        """Compute the last frames, which reach into the trailing padding."""
+        if self.finished:
+            return
+        if not self.n_samples:
+            raise ValueError("No audio samples were received")
+        self._last_sample = self._tail[-1]
+        self._tail = np.concatenate([self._tail, np.zeros(PAD, dtype=np.float32)])
+        self._process(1 + self.n_samples // HOP_LENGTH)  # The frame count of a centered librosa.stft
+        self.finished = True
+
+    def _process(self, until):
+        if until <= self.n_frames:
+            return
+        first = self.n_frames
+        start = first * HOP_LENGTH - PAD
+        stop = (until - 1) * HOP_LENGTH + PAD
+        segment = self._tail[start - self._tail_start:stop - self._tail_start]
+
+        # The zero-crossing rate pads with the edge samples instead of zeros
+        zcr_segment = segment
+        if start < 0 or stop > self.n_samples:
+            zcr_segment = segment.copy()
+            zcr_segment[:max(0, -start)] = self._first_sample
+            if stop > self.n_samples:  # Only once finish() added the trailing padding
+                zcr_segment[self.n_samples - start:] = self._last_sample
+
+        stats, mel, power, peaks = self._analyze(segment, zcr_segment, first)
+        self._stats.append(stats)
+        self._mel.append(mel)
+        self._power.append(power)
+        self._peaks.append(peaks)
+
+        self.n_frames = until
+        keep_from = until * HOP_LENGTH - PAD
+        self._tail = self._tail[keep_from - self._tail_start:]
+        self._tail_start = keep_from
+
+    def _analyze(self, segment, zcr_segment, first):
+        """Per-frame stats, mel bands, power and pitch peaks of the uncentered frames of `segment`.
+
+        `zcr_segment` is `segment` with the padding the zero-crossing rate uses; `first` numbers the frames.
+        """
+        S = np.abs(librosa.stft(segment, n_fft=N_FFT, hop_length=HOP_LENGTH, center=False))
+        power = S ** 2
+        centroid = librosa.feature.spectral_centroid(S=S, sr=self.sr, n_fft=N_FFT, hop_length=HOP_LENGTH)
+        stats = np.column_stack([
+            librosa.feature.rms(y=segment, frame_length=N_FFT, hop_length=HOP_LENGTH, center=False)[0],
+            centroid[0],
+            librosa.feature.spectral_bandwidth(S=S, sr=self.sr, centroid=centroid)[0],
+            librosa.feature.spectral_rolloff(S=S, sr=self.sr)[0],
+            librosa.feature.zero_crossing_rate(zcr_segment, frame_length=N_FFT, hop_length=HOP_LENGTH,
+                                               center=False)[0],
+        ])
+        mel = librosa.feature.melspectrogram(S=power, sr=self.sr)
+        # Pitch peaks for chroma's tuning estimate (piptrack looks at each frame on its own)
+        pitches, magnitudes = librosa.piptrack(S=power, sr=self.sr, n_fft=N_FFT)
+        bins, frames = np.nonzero(pitches > 0)
+        peaks = np.column_stack([frames + first, pitches[bins, frames], magnitudes[bins, frames]])
+        return stats, mel, power, peaks
+
+    def _frames(self, first, last):
+        """The stored (stats, mel, power, peaks) of frames [first, last) of the whole clip, renumbered from 0."""
+        peaks = np.concatenate(self._peaks)
+        peaks = peaks[(peaks[:, 0] >= first) & (peaks[:, 0] < last)]
+        peaks[:, 0] -= first
+        return (np.concatenate(self._stats)[first:last], np.concatenate(self._mel, axis=1)[:, first:last],
+                np.concatenate(self._power, axis=1)[:, first:last], peaks)
+
+    def _cut_frames(self, y, bounds):
+        """(stats, mel, power, peaks) of every frame of the centered STFT of y[start:end].
+
+        Frames that reach past either cut are recomputed with the padding extraction on the cut signal would
+        see; when `start` is on the hop grid, the others are the stored frames of the whole clip.
+        """
+        start, end = bounds
+        cut = np.asarray(y[start:end], dtype=np.float32)
+        n_frames = 1 + len(cut) // HOP_LENGTH
+        head = min(n_frames, -(-PAD // HOP_LENGTH))  # Frames reaching before the cut's first sample
+        tail = max(head, (len(cut) - PAD) // HOP_LENGTH + 1)  # First frame reaching past its last sample
+        if start % HOP_LENGTH:
+            head = tail = n_frames  # Off the hop grid: no stored frame is a frame of the cut signal
+
+        padded = np.concatenate([np.zeros(PAD, dtype=np.float32), cut, np.zeros(PAD, dtype=np.float32)])
+        edge_padded = np.concatenate([np.full(PAD, cut[0]), cut, np.full(PAD, cut[-1])]).astype(np.float32)
+
+        def recompute(first, last):
+            lo, hi = first * HOP_LENGTH, (last - 1) * HOP_LENGTH + N_FFT  # Offsets in the padded signal
+            return self._analyze(padded[lo:hi], edge_padded[lo:hi], first)
+
+        parts = []
+        if head:
+            parts.append(recompute(0, head))
+        if tail > head:
+            offset = start // HOP_LENGTH
+            parts.append(self._frames(offset + head, offset + tail))
+            parts[-1][3][:, 0] += head
+        if n_frames > tail:
+            parts.append(recompute(tail, n_frames))
+        return (np.concatenate([part[0] for part in parts]), np.concatenate([part[1] for part in parts], axis=1),
+                np.concatenate([part[2] for part in parts], axis=1), np.concatenate([part[3] for part in parts]))
+
+    def features(self, bounds=None, y=None):
+        """The 26 unscaled deepfake features in REQUIRED_FEATURES order, of the whole clip or of y[start:end].
+
+        `y` is the whole decoded signal; it is needed with `bounds` to recompute the frames at the cuts.
+        """
+        if not self.finished:
+            raise RuntimeError("finish() the stream before reading its features")
+        if bounds is None or tuple(bounds) == (0, self.n_samples):
+            stats, mel, power, peaks = self._frames(0, self.n_frames)
+        else:
+            if y is None or len(y) != self.n_samples:
+                raise ValueError("features(bounds) needs the whole decoded signal")
+            stats, mel, power, peaks = self._cut_frames(y, bounds)
+
+        # librosa.estimate_tuning over the selected frames
+        threshold = np.median(peaks[:, 2]) if len(peaks) else 0.0
+        tuning = librosa.pitch_tuning(peaks[peaks[:, 2] >= threshold, 1], resolution=0.01, bins_per_octave=12)
+        mfccs = librosa.feature.mfcc(S=librosa.power_to_db(mel), n_mfcc=N_MFCC)
+
+        features = np.empty(6 + N_MFCC)
+        features[0] = np.mean(librosa.feature.chroma_stft(S=power, sr=self.sr, tuning=tuning))
+        features[1:6] = stats.mean(axis=0)
+        features[6:] = np.mean(mfccs, axis=1)
+        return features
+
+
+class StreamingUpload:
+    """A WAV upload received in pieces: its bytes, its decoded signal and its running features."""
+
+    def __init__(self):
+        self.decoder = WavStreamDecoder()
+        self.extractor = None
+        self._data = bytearray()
+        self._signal = []
+        self.signal = None
+
+    @property
+    def size(self):
+        return len(self._data)
+
+    def feed(self, chunk):
+        self._data += chunk
+        y = self.decoder.feed(chunk)
+        if len(y):
+            if self.extractor is None:
+                self.extractor = StreamingFeatureExtractor(self.decoder.sample_rate)
+            self.extractor.feed(y)
+            self._signal.append(y)
+
+    def finish(self):
+        """Close the stream; returns (raw bytes, mono float32 signal, sample rate)."""
+        if self.extractor is None:
+            raise ValueError("The stream ended before any audio samples")
+        self.extractor.finish()
+        self.signal = np.concatenate(self._signal)
+        self._signal = [self.signal]
+        return bytes(self._data), self.signal, self.decoder.sample_rate
+
+    def features(self, bounds=None):
+        """Features of the finished upload, or of its samples in `bounds`."""
+        return self.extractor.features(bounds, self.signal)
@@ -0,0 +1,37 @@
+import os
+
+import numpy as np
+import pytest
+
+from audio_features import REQUIRED_FEATURES, extract_features, load_audio, reference_features
+from request_audio import RequestAudio
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Both extractors run the same librosa kernels, so only float rounding may differ (as in bench_features.py)
+RTOL = 1e-4
+ATOL = 1e-5
+
+
+def synthetic_voice(sr=22050, seconds=2.0):
+    t = np.arange(int(sr * seconds)) / sr
+    f0 = 140 * (1 + 0.03 * np.sin(2 * np.pi * 4 * t))
+    phase = 2 * np.pi * np.cumsum(f0) / sr
+    y = sum(np.sin(k * phase) / k for k in range(1, 6)) * (0.5 + 0.5 * np.sin(2 * np.pi * 3 * t))
+    return (0.3 * y / np.max(np.abs(y)) + 0.003 * np.random.default_rng(0).standard_normal(len(t))).astype(np.float32)
+
+
+@pytest.mark.parametrize("sr", [16000, 22050])
+def test_shared_stft_matches_the_original_extractor(sr):
+    y = synthetic_voice(sr)
+    features = extract_features(y, sr)
+    assert features.shape == (len(REQUIRED_FEATURES),)
+    np.testing.assert_allclose(features, reference_features(y, sr), rtol=RTOL, atol=ATOL)
+
+
+def test_bundled_recording_matches_the_original_extractor():
+    with open(os.path.join(BASE_DIR, "test_audio.wav"), "rb") as f:
+        data = f.read()
+    y, sr = load_audio(data)
+    np.testing.assert_allclose(RequestAudio(data).deepfake_features(), reference_features(y, sr),
+                               rtol=RTOL, atol=ATOL)
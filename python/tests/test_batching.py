@@ -0,0 +1,63 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from batching import MicroBatcher
+
+
+class GatedScorer:
+    """Sums each row; holds the first batch until released, so later rows pile up in the queue."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.batch_sizes = []
+
+    def __call__(self, X):
+        if not self.batch_sizes:
+            self.release.wait(5)
+        self.batch_sizes.append(len(X))
+        return X.sum(axis=1)
+
+
+def test_every_caller_gets_the_score_of_its_own_row():
+    scorer = GatedScorer()
+    batcher = MicroBatcher(scorer, max_batch_size=4, max_wait_ms=1)
+    futures = [batcher.submit(np.full(26, i, dtype=np.float32)) for i in range(10)]
+    scorer.release.set()
+
+    assert [future.result(5) for future in futures] == [26.0 * i for i in range(10)]
+    assert sum(scorer.batch_sizes) == 10 and max(scorer.batch_sizes) == 4
+    assert batcher.stats()["rows"] == 10
+
+
+def test_a_full_batch_is_flushed_without_waiting_for_the_deadline():
+    scorer = GatedScorer()
+    scorer.release.set()
+    batcher = MicroBatcher(scorer, max_batch_size=4, max_wait_ms=10_000)
+    start = time.perf_counter()
+    futures = [batcher.submit(np.ones(26)) for _ in range(4)]
+    assert [future.result(5) for future in futures] == [26.0] * 4
+    assert time.perf_counter() - start < 5
+
+
+def test_a_partial_batch_is_flushed_at_the_deadline():
+    scorer = GatedScorer()
+    scorer.release.set()
+    batcher = MicroBatcher(scorer, max_batch_size=32, max_wait_ms=100)
+    start = time.perf_counter()
+    assert batcher.score(np.ones(26), timeout=5) == 26.0
+    assert 0.09 <= time.perf_counter() - start < 2
+    assert scorer.batch_sizes == [1]
+
+
+def test_a_failed_batch_fails_each_of_its_callers():
+    def fail(X):
+        raise RuntimeError("model unavailable")
+
+    batcher = MicroBatcher(fail, max_batch_size=4, max_wait_ms=1)
+    with pytest.raises(RuntimeError):
+        batcher.score(np.ones(26), timeout=5)
+    batcher.score_fn = lambda X: X.sum(axis=1)
+    assert batcher.score(np.ones(26), timeout=5) == 26.0
@@ -0,0 +1,106 @@
+import time
+
+import numpy as np
+import pytest
+
+import fingerprint
+from fingerprint import MAX_POSTINGS_PER_HASH, FingerprintIndex, spread
+
+
+@pytest.fixture
+def make_index(tmp_path):
+    indexes = []
+
+    def make(**kwargs):
+        kwargs.setdefault("refresh_seconds", 0)
+        index = FingerprintIndex(str(tmp_path), **kwargs)
+        indexes.append(index)
+        return index
+
+    yield make
+    for index in indexes:
+        index.close()
+
+
+def recording(seed, n=100):
+    rng = np.random.default_rng(seed)
+    return spread(rng.integers(0, 1 << 39, n, dtype=np.uint64)), np.arange(n, dtype=np.uint16) * 3
+
+
+def test_finds_an_added_recording_at_any_offset(make_index):
+    index = make_index()
+    hashes, frames = recording(0)
+    recording_id = index.add("alice", 1, hashes, frames)
+
+    match = index.find_duplicate(hashes[20:80], frames[20:80] - 60)  # A cut replay starts later
+    assert (match.recording_id, match.username, match.slot, match.votes) == (recording_id, "alice", "1", 60)
+    assert index.find_duplicate(*recording(1)) is None
+
+
+def test_compaction_keeps_every_recording_findable(make_index):
+    index = make_index()
+    ids = [index.add("alice", slot, *recording(slot)) for slot in range(3)]
+    index.save_snapshot()
+    assert index.stats()["deltas"] == 0
+    ids.append(index.add("bob", 1, *recording(3)))
+
+    for seed, recording_id in enumerate(ids):
+        assert index.find_duplicate(*recording(seed)).recording_id == recording_id
+
+
+def test_reopened_index_maps_the_snapshot_and_reads_the_rest_of_the_log(make_index):
+    first = make_index()
+    first.add("alice", 1, *recording(0))
+    first.save_snapshot()
+    second_id = first.add("bob", 1, *recording(1))
+
+    reopened = make_index()
+    assert reopened.stats()["postings"] == 200
+    assert reopened.find_duplicate(*recording(1)).recording_id == second_id
+
+
+def test_lookups_see_other_processes_appends_once_refreshed(make_index):
+    reader, writer = make_index(), make_index()
+    hashes, frames = recording(0)
+    writer.add("alice", 1, hashes, frames)
+
+    assert reader.find_duplicate(hashes, frames) is None  # Lookups never read the log themselves
+    reader.refresh()
+    assert reader.find_duplicate(hashes, frames).username == "alice"
+
+
+def test_background_refresh_reads_the_log(make_index):
+    reader, writer = make_index(refresh_seconds=0.01), make_index()
+    hashes, frames = recording(0)
+    writer.add("alice", 1, hashes, frames)
+
+    deadline = time.monotonic() + 5
+    while reader.find_duplicate(hashes, frames) is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert reader.find_duplicate(hashes, frames).username == "alice"
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_common_hashes_are_skipped(make_index, compact):
+    index = make_index(min_matches=1, min_ratio=0)
+    common = spread(np.array([12345], dtype=np.uint64))
+    for slot in range(MAX_POSTINGS_PER_HASH):
+        index.add("alice", slot, common, np.zeros(1, dtype=np.uint16))
+    if compact:
+        index.save_snapshot()
+    assert index.find_duplicate(common, np.zeros(1, dtype=np.uint16)) is not None
+
+    index.add("alice", MAX_POSTINGS_PER_HASH, common, np.zeros(1, dtype=np.uint16))
+    if compact:
+        index.save_snapshot()
+    assert index.find_duplicate(common, np.zeros(1, dtype=np.uint16)) is None
+
+
+def test_pending_postings_are_sorted_into_deltas(make_index, monkeypatch):
+    monkeypatch.setattr(fingerprint, "MERGE_POSTINGS", 150)
+    index = make_index()
+    ids = [index.add("alice", slot, *recording(slot)) for slot in range(3)]
+    assert index.stats()["deltas"] == 1 and index.stats()["pending"] == 100
+
+    for seed, recording_id in enumerate(ids):
+        assert index.find_duplicate(*recording(seed)).recording_id == recording_id
@@ -0,0 +1,58 @@
+import time
+
+import instrumentation
+from instrumentation import SpanRecorder, prometheus_text
+
+
+def test_external_counters_render_as_totals_next_to_recorded_ones():
+    recorder = SpanRecorder()
+    recorder.increment("http_requests_total", endpoint="index", status=200)
+    text = prometheus_text(recorder, gauges={"result_cache_entries": 3}, labels=[("pid", 7)], counters={
+        "result_cache_hits_total": 5,
+        "persistence_jobs_total": {(("outcome", "failed"),): 1},
+    })
+    lines = text.splitlines()
+    assert "# TYPE voicepay_result_cache_hits_total counter" in lines
+    assert 'voicepay_result_cache_hits_total{pid="7"} 5' in lines
+    assert 'voicepay_persistence_jobs_total{pid="7",outcome="failed"} 1' in lines
+    assert 'voicepay_http_requests_total{pid="7",endpoint="index",status="200"} 1' in lines
+    assert "# TYPE voicepay_result_cache_entries gauge" in lines
+
+
+def test_nested_spans_are_not_counted_twice():
+    recorder = SpanRecorder()
+    with recorder.span("features"):
+        time.sleep(0.02)
+        with recorder.span("decode"):
+            time.sleep(0.05)
+    stages = recorder.snapshot()
+    assert stages["decode"]["total_ms"] >= 50
+    assert 20 <= stages["features"]["total_ms"] < 45
+
+
+def test_spans_on_a_stage_executor_thread_are_nested_in_the_callers_span():
+    from serving import StageExecutor
+
+    instrumentation.reset()
+    executor = StageExecutor(1, "test")
+
+    def embed():
+        with instrumentation.span("decode"):
+            time.sleep(0.05)
+
+    with instrumentation.span("embed"):
+        time.sleep(0.02)
+        executor.run(embed)
+    stages = instrumentation.snapshot()
+    assert stages["decode"]["total_ms"] >= 50
+    assert 20 <= stages["embed"]["total_ms"] < 45
+
+
+def test_summaries_render_quantiles_sum_and_count():
+    text = prometheus_text(SpanRecorder(), labels=[("pid", 7)], summaries={
+        "persistence_job_duration_seconds": [((("phase", "run"),), {"0.5": 0.25}, 1.5, 6)]})
+    lines = text.splitlines()
+    assert "# TYPE voicepay_persistence_job_duration_seconds summary" in lines
+    assert 'voicepay_persistence_job_duration_seconds{pid="7",phase="run",quantile="0.5"} 0.250000' in lines
+    assert 'voicepay_persistence_job_duration_seconds_sum{pid="7",phase="run"} 1.500000' in lines
+    assert 'voicepay_persistence_job_duration_seconds_count{pid="7",phase="run"} 6' in lines
@@ -0,0 +1,73 @@
+import os
+
+import numpy as np
+import pytest
+
+from mlp_inference import NumpyMLP
+from train_deepfake import NUMPY_PARITY_TOLERANCE
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def random_layers(rng, sizes=(26, 16, 8, 1)):
+    activations = ["relu"] * (len(sizes) - 2) + ["sigmoid"]
+    return [(rng.standard_normal((n_in, n_out)), rng.standard_normal(n_out), activation)
+            for n_in, n_out, activation in zip(sizes, sizes[1:], activations)]
+
+
+def test_save_and_load_give_the_same_predictions(tmp_path):
+    rng = np.random.default_rng(0)
+    model = NumpyMLP(random_layers(rng))
+    model.save(tmp_path / "mlp.npz")
+    X = rng.standard_normal((32, 26)).astype(np.float32)
+    np.testing.assert_array_equal(NumpyMLP.load(tmp_path / "mlp.npz").predict(X), model.predict(X))
+
+
+def test_single_row_predicts_like_keras_shape():
+    model = NumpyMLP(random_layers(np.random.default_rng(1)))
+    assert model.predict(np.zeros(26)).shape == (1, 1)
+
+
+def test_folded_export_matches_keras():
+    pytest.importorskip("tensorflow")
+    from train_deepfake import build_model
+
+    rng = np.random.default_rng(42)
+    model = build_model(26)
+    # Untrained BatchNorm layers are the identity; give them statistics so the folding is exercised
+    for layer in model.layers:
+        if type(layer).__name__ == "BatchNormalization":
+            units = layer.moving_mean.shape[-1]
+            layer.set_weights([rng.uniform(0.5, 1.5, units), rng.normal(0, 0.1, units),
+                               rng.normal(0, 0.5, units), rng.uniform(0.5, 2.0, units)])
+    X = rng.standard_normal((256, 26)).astype(np.float32)
+
+    expected = model.predict(X, verbose=0)
+    actual = NumpyMLP.from_keras(model).predict(X)
+
+    assert actual.shape == expected.shape
+    assert np.max(np.abs(actual - expected)) <= NUMPY_PARITY_TOLERANCE
+
+
+def test_folded_export_of_a_trained_model_matches_keras_on_held_out_rows():
+    pytest.importorskip("tensorflow")
+    import pandas as pd
+    import tensorflow as tf
+
+    from audio_features import REQUIRED_FEATURES
+    from train_deepfake import build_model, check_numpy_parity
+
+    tf.keras.utils.set_random_seed(0)
+    df = pd.read_csv(os.path.join(BASE_DIR, "dataset", "shuffled_file.csv"), nrows=2500)
+    X = df[REQUIRED_FEATURES].values
+    X = ((X - X[:2000].mean(axis=0)) / X[:2000].std(axis=0)).astype(np.float32)
+    y = (df["LABEL"].values == "REAL").astype(np.float32)
+    model = build_model(len(REQUIRED_FEATURES), learning_rate=1e-3)
+    model.fit(X[:2000], y[:2000], epochs=3, batch_size=64, verbose=0)
+
+    held_out = X[2000:]
+    accuracy = np.mean((model.predict(held_out, verbose=0)[:, 0] >= 0.5) == y[2000:])
+    assert accuracy > 0.8  # Trained weights and BatchNorm statistics, not initial ones
+    numpy_model = NumpyMLP.from_keras(model)
+    check_numpy_parity(model, numpy_model, held_out)
+    np.testing.assert_array_equal(numpy_model.predict(held_out) >= 0.5, model.predict(held_out, verbose=0) >= 0.5)
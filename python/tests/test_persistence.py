@@ -0,0 +1,71 @@
+import queue
+import threading
+
+import pytest
+
+from persistence import PersistenceQueue
+
+
+def blocked_queue(**kwargs):
+    """A queue whose single worker is held on a first job until the returned event is set."""
+    release = threading.Event()
+    started = threading.Event()
+    persistence = PersistenceQueue(workers=1, **kwargs)
+
+    def hold():
+        started.set()
+        release.wait(10)
+
+    persistence.submit("other-session", hold)
+    assert started.wait(10)
+    return persistence, release
+
+
+def test_wait_for_returns_results_in_submit_order():
+    persistence = PersistenceQueue(workers=3)
+    for i in range(5):
+        persistence.submit("session", lambda i=i: i * i)
+    assert persistence.wait_for("session", timeout=10) == [0, 1, 4, 9, 16]
+    assert persistence.wait_for("session", timeout=10) == []  # Already collected
+
+
+def test_wait_for_reraises_a_failed_job():
+    persistence = PersistenceQueue(workers=1)
+    persistence.submit("session", lambda: 1)
+    persistence.submit("session", lambda: 1 / 0)
+    with pytest.raises(ZeroDivisionError):
+        persistence.wait_for("session", timeout=10)
+    persistence.join()
+    assert persistence.metrics()["failed"] == 1
+
+
+def test_discard_skips_queued_jobs():
+    persistence, release = blocked_queue()
+    ran = []
+    persistence.submit("abandoned", ran.append, "upload")
+    persistence.discard("abandoned")
+    release.set()
+    persistence.join()
+    assert ran == []
+    assert persistence.wait_for("abandoned") == []
+
+
+def test_submit_fails_once_the_queue_is_full():
+    persistence, release = blocked_queue(capacity=2, submit_timeout=0.05)
+    persistence.submit("session", lambda: 1)
+    persistence.submit("session", lambda: 2)
+    with pytest.raises(queue.Full):
+        persistence.submit("session", lambda: 3)
+    release.set()
+    assert persistence.wait_for("session", timeout=10) == [1, 2]
+
+
+def test_metrics_count_jobs_and_their_time():
+    persistence = PersistenceQueue(workers=2)
+    for _ in range(4):
+        persistence.submit("session", lambda: None)
+    persistence.join()
+    stats = persistence.metrics()
+    assert stats["completed"] == 4 and stats["queue_depth"] == 0 and stats["in_flight"] == 0
+    assert stats["job_run_ms"]["count"] == 4
+    assert stats["job_run_total_ms"] >= 0 and "p99" in stats["queue_wait_ms"]
@@ -0,0 +1,46 @@
+import pytest
+
+from prompt_matching import SentenceIndex, normalize
+
+SENTENCES = [
+    "Technology is evolving every single day.",
+    "The weather today is quite unpredictable.",
+    "Music has the power to change your mood.",
+]
+
+
+def test_normalize_drops_case_punctuation_and_extra_spaces():
+    assert normalize("  Music has the POWER,  to change your mood! ") == "music has the power to change your mood"
+    assert normalize("It's fine.") == "it's fine"
+
+
+@pytest.mark.parametrize("policy, transcript, expected", [
+    ("exact", "technology is evolving every single day.", True),
+    ("exact", "technology is evolving every single day", False),
+    ("normalized", "Technology is evolving, every single day", True),
+    ("normalized", "technology is evolving every day", False),
+    ("edit", "technology is evolving every singel day", True),
+    ("edit", "the weather today is quite unpredictable", False),
+    ("token", "every single day technology is evolving", True),
+])
+def test_policies(policy, transcript, expected):
+    index = SentenceIndex(SENTENCES, policy=policy, threshold=0.9)
+    assert index.matches(transcript, SENTENCES[0]) is expected
+
+
+def test_empty_transcripts_never_match():
+    index = SentenceIndex(SENTENCES)
+    assert not index.matches("", SENTENCES[0])
+    assert not index.matches(None, SENTENCES[0])
+
+
+def test_best_match_names_the_prompt_that_was_read():
+    index = SentenceIndex(SENTENCES, policy="normalized")
+    sentence, score = index.best_match("the wether today is quite unpredictable")
+    assert sentence == SENTENCES[1]
+    assert 0.9 < score < 1
+
+
+def test_unknown_policy_is_rejected():
+    with pytest.raises(ValueError):
+        SentenceIndex(SENTENCES, policy="fuzzy")
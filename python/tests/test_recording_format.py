@@ -0,0 +1,118 @@
+import base64
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+from cryptography.exceptions import InvalidTag
+
+from recording_format import (
+    MasterKeyring,
+    _PREFIX,
+    is_recording,
+    open_recording,
+    read_metadata,
+    seal_recording,
+)
+from request_audio import RequestAudio
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope="module")
+def upload():
+    with open(os.path.join(BASE_DIR, "test_audio.wav"), "rb") as f:
+        return f.read()
+
+
+def keyring(*keys):
+    return MasterKeyring([key or os.urandom(32) for key in keys or [None]])
+
+
+def test_sealed_recording_round_trips(tmp_path, upload):
+    keys = keyring()
+    path = tmp_path / "alice_1.vpr"
+    path.write_bytes(seal_recording(RequestAudio(upload), keys, codec="original", embeddings={"mfcc_mean": [1, 2]}))
+
+    blob = path.read_bytes()
+    assert is_recording(blob)
+    metadata, payload = open_recording(blob, keys)
+    assert payload == upload
+    assert metadata["codec"] == "original" and metadata["embeddings"] == {"mfcc_mean": [1.0, 2.0]}
+    assert read_metadata(blob, keys) == metadata
+
+
+def test_flac_payload_decodes_at_16_khz(upload):
+    keys = keyring()
+    metadata, payload = open_recording(seal_recording(RequestAudio(upload), keys), keys)
+    decoded = RequestAudio(payload)
+    assert decoded.sr == metadata["payload_sample_rate"] == 16000
+    assert abs(len(decoded.raw_signal) / decoded.sr - metadata["duration"]) < 0.01
+
+
+def test_tampered_header_fails_authentication(upload):
+    keys = keyring()
+    blob = bytearray(seal_recording(RequestAudio(upload), keys, codec="original"))
+    header_at = _PREFIX.size + blob[_PREFIX.size:].index(b'"original"') + 1
+    blob[header_at:header_at + 8] = b"ORIGINAL"  # Still valid JSON, but not what was sealed
+    with pytest.raises(InvalidTag):
+        open_recording(bytes(blob), keys)
+
+
+@pytest.mark.parametrize("section", ["metadata", "payload"])
+def test_tampered_ciphertext_fails_authentication(upload, section):
+    keys = keyring()
+    blob = bytearray(seal_recording(RequestAudio(upload), keys, codec="original"))
+    blob[-1 if section == "payload" else -len(upload) - 40] ^= 1
+    with pytest.raises(InvalidTag):
+        (open_recording if section == "payload" else read_metadata)(bytes(blob), keys)
+
+
+def test_header_cannot_be_moved_to_another_recording(upload):
+    keys = keyring()
+    first = seal_recording(RequestAudio(upload), keys, codec="original")
+    second = seal_recording(RequestAudio(upload), keys, codec="original")
+    prefix_length = _PREFIX.size + _PREFIX.unpack_from(first)[2]
+    with pytest.raises(InvalidTag):
+        open_recording(first[:prefix_length + 60] + second[prefix_length + 60:], keys)
+
+
+def test_wrong_master_key_cannot_unwrap(upload):
+    key = os.urandom(32)
+    blob = seal_recording(RequestAudio(upload), keyring(key), codec="original")
+    with pytest.raises(ValueError):
+        open_recording(blob, keyring())  # Unknown key id
+
+    impostor = keyring()
+    impostor._keys = {keyring(key).current_id: os.urandom(32)}  # Same id, different key
+    with pytest.raises(InvalidTag):
+        open_recording(blob, impostor)
+
+
+def test_rotated_keyring_opens_recordings_of_the_previous_key(upload):
+    old, new = os.urandom(32), os.urandom(32)
+    blob = seal_recording(RequestAudio(upload), keyring(old), codec="original")
+    assert open_recording(blob, keyring(new, old))[1] == upload
+
+
+def test_master_key_is_required_with_shared_storage(monkeypatch):
+    monkeypatch.delenv("VOICEPAY_MASTER_KEY", raising=False)
+    monkeypatch.setenv("VOICEPAY_STORAGE", "cloudinary")
+    with pytest.raises(RuntimeError, match="VOICEPAY_MASTER_KEY"):
+        MasterKeyring.from_env()
+
+    key = os.urandom(32)
+    monkeypatch.setenv("VOICEPAY_MASTER_KEY", base64.urlsafe_b64encode(key).decode())
+    assert MasterKeyring.from_env().current_id == keyring(key).current_id
+
+
+def test_app_refuses_to_start_without_a_master_key(tmp_path):
+    env = {name: value for name, value in os.environ.items()
+           if name not in ("VOICEPAY_MASTER_KEY", "VOICEPAY_STORAGE")}
+    env["VOICEPAY_FINGERPRINT_DIR"] = str(tmp_path)
+    result = subprocess.run([sys.executable, "-c", "import app"], cwd=BASE_DIR, env=env,
+                            capture_output=True, text=True, timeout=120)
+    assert result.returncode == 4
+    assert "Cannot start: VOICEPAY_MASTER_KEY must be set" in result.stderr
+    assert "Traceback" not in result.stderr
@@ -0,0 +1,76 @@
+import os
+import time
+
+import numpy as np
+
+from audio_features import REQUIRED_FEATURES
+from deepfake_proper import DeepfakeDetector
+from result_cache import ResultCache, content_hash
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class CountingModel:
+    def __init__(self, score):
+        self.score = score
+        self.calls = 0
+
+    def predict(self, X):
+        self.calls += 1
+        return np.full((len(X), 1), self.score)
+
+
+def detector(model, version):
+    return DeepfakeDetector(model, np.zeros(len(REQUIRED_FEATURES)), np.ones(len(REQUIRED_FEATURES)),
+                            REQUIRED_FEATURES, ["FAKE", "REAL"], {"model_version": version})
+
+
+def test_entries_are_keyed_by_content_and_model_version():
+    cache = ResultCache()
+    cache.set_model_version("v1")
+    cache.put(content_hash(b"clip"), "v1", {"score": 0.9})
+    assert cache.get(content_hash(b"clip"), "v1") == {"score": 0.9}
+    assert cache.get(content_hash(b"clip!"), "v1") is None
+    assert cache.get(content_hash(b"clip"), "v2") is None
+
+
+def test_new_model_version_drops_every_entry():
+    cache = ResultCache()
+    cache.set_model_version("v1")
+    cache.put("a", "v1", 1)
+    cache.set_model_version("v1")
+    assert cache.get("a", "v1") == 1
+
+    cache.set_model_version("v2")
+    cache.put("b", "v1", 2)  # A request still scoring with the old model
+    assert cache.stats()["entries"] == 0 and cache.stats()["invalidations"] == 1
+    cache.set_model_version("v1")
+    assert cache.get("a", "v1") is None
+
+
+def test_entries_expire_and_the_least_recently_used_are_evicted():
+    cache = ResultCache(max_entries=2, ttl=0.2)
+    cache.set_model_version("v1")
+    cache.put("a", "v1", 1)
+    cache.put("b", "v1", 2)
+    cache.get("a", "v1")
+    cache.put("c", "v1", 3)
+    assert cache.get("b", "v1") is None and cache.get("a", "v1") == 1
+    time.sleep(0.3)
+    assert cache.get("a", "v1") is None
+    assert cache.stats()["evictions"] == 2
+
+
+def test_detector_skips_inference_for_a_resubmitted_upload():
+    with open(os.path.join(BASE_DIR, "test_audio.wav"), "rb") as f:
+        data = f.read()
+    cache = ResultCache()
+    old = detector(CountingModel(0.9), "v1")
+    old.enable_result_cache(cache)
+    assert old.predict_audio_deepfake(data) == old.predict_audio_deepfake(data) == "REAL(Human Voice)"
+    assert old.model.calls == 1
+
+    new = detector(CountingModel(0.1), "v2")
+    new.enable_result_cache(cache)
+    assert new.predict_audio_deepfake(data) == "FAKE(AI Voice)"
+    assert new.model.calls == 1
@@ -0,0 +1,102 @@
+import multiprocessing
+import time
+
+import pytest
+
+from session_store import MemorySessionStore, SQLiteSessionStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_store(request, tmp_path):
+    def make(**kwargs):
+        if request.param == "memory":
+            return MemorySessionStore(**kwargs)
+        return SQLiteSessionStore(str(tmp_path / "sessions.sqlite3"), **kwargs)
+
+    return make
+
+
+def new_session(session_id="s1"):
+    return {"session_id": session_id, "sentences": ["a", "b", "c"], "index": 0, "embeddings": []}
+
+
+def test_create_returns_the_previous_session(make_store):
+    store = make_store()
+    assert store.create("alice", new_session("s1")) is None
+    assert store.create("alice", new_session("s2"))["session_id"] == "s1"
+    assert store.get("alice")["session_id"] == "s2"
+    store.delete("alice")
+    assert store.get("alice") is None
+
+
+def test_advance_only_from_the_index_read(make_store):
+    store = make_store()
+    store.create("alice", new_session())
+    session = store.advance("alice", 0, {"embeddings": [[1.0, 2.0]]})
+    assert session["index"] == 1 and session["embeddings"] == [[1.0, 2.0]]
+    assert store.advance("alice", 0) is None  # A concurrent request read the same index
+    assert store.get("alice")["index"] == 1
+    assert store.advance("bob", 0) is None
+
+
+def test_rewind_undoes_an_advance_of_the_same_session(make_store):
+    store = make_store()
+    store.create("alice", new_session("s1"))
+    store.advance("alice", 0)
+    assert not store.rewind("alice", "other", 0)
+    assert not store.rewind("alice", "s1", 1)  # Not at index 2
+    assert store.rewind("alice", "s1", 0, {"embeddings": []})
+    assert store.get("alice")["index"] == 0
+
+
+def test_record_only_into_the_live_session(make_store):
+    store = make_store()
+    store.create("alice", new_session("s1"))
+    assert store.record("alice", "s1", "uploads", "1", "ok")
+    assert not store.record("alice", "s0", "uploads", "2", "ok")
+    session = store.get("alice")
+    assert session["uploads"] == {"1": "ok"} and session["index"] == 0
+
+
+def test_sessions_expire_after_the_ttl(make_store):
+    store = make_store(ttl=0.2)
+    store.create("alice", new_session())
+    time.sleep(0.3)
+    assert store.get("alice") is None
+    assert store.advance("alice", 0) is None
+    assert store.create("alice", new_session()) is None
+
+
+def test_least_recently_used_sessions_are_evicted(make_store):
+    store = make_store(max_sessions=2)
+    store.create("alice", new_session())
+    store.create("bob", new_session())
+    store.get("alice")
+    store.create("carol", new_session())
+    assert store.get("bob") is None
+    assert store.get("alice") is not None and store.get("carol") is not None
+
+
+def _advance_from_worker(path, start, results):
+    store = SQLiteSessionStore(path)
+    start.wait()
+    results.put(store.advance("alice", 0, {"winner": multiprocessing.current_process().name}) is not None)
+
+
+def test_only_one_worker_process_advances_a_session(tmp_path):
+    path = str(tmp_path / "sessions.sqlite3")
+    SQLiteSessionStore(path).create("alice", new_session())
+    context = multiprocessing.get_context("fork")
+    start, results = context.Event(), context.Queue()
+    workers = [context.Process(target=_advance_from_worker, args=(path, start, results), name=f"worker-{i}")
+               for i in range(6)]
+    for worker in workers:
+        worker.start()
+    start.set()
+    won = [results.get(timeout=30) for _ in workers]
+    for worker in workers:
+        worker.join()
+
+    assert won.count(True) == 1
+    session = SQLiteSessionStore(path).get("alice")
+    assert session["index"] == 1 and session["winner"].startswith("worker-")
@@ -0,0 +1,81 @@
+import base64
+
+import numpy as np
+import pytest
+
+import recording_format
+from embedding_store import EmbeddingStore
+from recording_format import MasterKeyring, generate_master_key, recording_name, seal_recording
+from request_audio import RequestAudio
+from speaker_verification import SpeakerVerifier, l2_normalize
+from storage import LocalStorage
+
+
+class FixedEmbedder:
+    """Stands in for a speaker model: every clip embeds to the same vector."""
+    name = "ecapa"
+
+    def __init__(self, vector):
+        self.vector = np.asarray(vector, dtype=np.float32)
+        self.calls = 0
+
+    def embed(self, audio, sr=None):
+        self.calls += 1
+        return self.vector
+
+
+@pytest.fixture
+def store(tmp_path):
+    return EmbeddingStore(str(tmp_path / "embeddings.sqlite3"))
+
+
+def test_cohort_scores_leave_out_the_claimed_user():
+    rng = np.random.default_rng(0)
+    cohort = rng.standard_normal((40, 8)).astype(np.float32)
+    usernames = [f"user{i % 20}" for i in range(40)]
+    references = rng.standard_normal((3, 8)).astype(np.float32)
+    probe = references[0] + 0.1 * rng.standard_normal(8).astype(np.float32)
+    verifier = SpeakerVerifier(FixedEmbedder(probe), cohort_top_k=10)
+    verifier.load_cohort(cohort, usernames)
+
+    raw, normalized = verifier.score(probe, references, "user3")
+
+    unit_probe = l2_normalize(probe)[0]
+    expected_raw = l2_normalize(references) @ unit_probe
+    impostors = l2_normalize(cohort[np.asarray(usernames) != "user3"]) @ unit_probe
+    top = np.sort(impostors)[-10:]
+    np.testing.assert_allclose(raw, expected_raw, rtol=1e-5)
+    np.testing.assert_allclose(normalized, (expected_raw - top.mean()) / top.std(), rtol=1e-4)
+
+
+def test_cohort_reloads_in_the_background_after_another_enrollment(store):
+    store.replace("alice", np.eye(4, dtype=np.float32)[:3], "ecapa")
+    verifier = SpeakerVerifier(FixedEmbedder(np.ones(4)), store=store)
+    assert verifier.load_cohort() == 3
+    assert not verifier.refresh_cohort()
+
+    store.replace("bob", np.eye(4, dtype=np.float32)[1:], "ecapa")  # E.g. written by another worker
+    assert verifier.refresh_cohort()
+    verifier._reloader.join(timeout=10)
+    assert len(verifier._cohort[1]) == 6
+    assert not verifier.refresh_cohort()
+
+
+def test_references_backfill_the_verifier_kind(store, tmp_path, monkeypatch):
+    keyring = MasterKeyring([base64.urlsafe_b64decode(generate_master_key())])
+    monkeypatch.setattr(recording_format, "_default_keyring", keyring)
+    storage = LocalStorage(str(tmp_path / "storage"))
+    stored = np.arange(4, dtype=np.float32)
+    for slot in (1, 2, 3):
+        audio = RequestAudio.from_signal(np.zeros(1600, dtype=np.float32), 16000, data=b"payload")
+        embeddings = {"ecapa": stored} if slot != 3 else {"mfcc_mean": np.zeros(20)}
+        storage.put(recording_name("alice", slot), seal_recording(audio, codec="original", embeddings=embeddings))
+    embedder = FixedEmbedder(np.ones(4))
+    verifier = SpeakerVerifier(embedder, store=store, storage=storage)
+
+    references = verifier.references("alice")
+
+    assert embedder.calls == 1  # Only the recording without an ecapa embedding is decoded
+    np.testing.assert_array_equal(references, [stored, stored, np.ones(4)])
+    np.testing.assert_array_equal(store.get("alice", "ecapa"), references)
+    assert store.get("alice", "mfcc_mean") is None
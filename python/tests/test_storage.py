@@ -0,0 +1,27 @@
+import pytest
+
+from storage import LocalStorage, ObjectStorage
+from voice_matching import compare_with_previous_recordings
+
+
+def test_backends_must_implement_every_operation():
+    class PutOnly(ObjectStorage):
+        def put(self, name, data):
+            return name
+
+    with pytest.raises(TypeError):
+        PutOnly()
+
+
+def test_local_storage_round_trip(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    storage.put_many({"a.vpr": b"first", "b.vpr": b"second"})
+    assert storage.get_many(["a.vpr", "b.vpr", "missing.vpr"]) == {
+        "a.vpr": b"first", "b.vpr": b"second", "missing.vpr": None}
+    storage.delete("a.vpr")
+    assert storage.get("a.vpr") is None
+
+
+def test_voice_comparison_does_not_build_its_own_storage():
+    with pytest.raises(ValueError):
+        compare_with_previous_recordings("alice", b"")
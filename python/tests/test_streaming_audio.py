@@ -0,0 +1,65 @@
+"""Streamed feature extraction (streaming_audio.py) against audio_features.extract_features."""
+import io
+import os
+import wave
+
+import numpy as np
+import librosa
+import pytest
+
+from audio_features import HOP_LENGTH, extract_features
+from streaming_audio import StreamingUpload
+from vad import SpeechTrimmer
+
+AUDIO = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test_audio.wav")
+
+# The same librosa kernels run on the same frames; only float rounding should differ.
+RTOL = 1e-4
+ATOL = 1e-5
+
+
+def wav_bytes(y, sr):
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sr)
+        f.writeframes((np.clip(y, -1, 1 - 1 / 32768) * 32768).astype("<i2").tobytes())
+    return buffer.getvalue()
+
+
+@pytest.fixture(scope="module")
+def upload():
+    with open(AUDIO, "rb") as f:
+        data = f.read()
+    upload = StreamingUpload()
+    for i in range(0, len(data), 1021):  # Odd chunks split the header and individual samples
+        upload.feed(data[i:i + 1021])
+    upload.finish()
+    return upload
+
+
+def test_whole_clip_matches_batch_extraction(upload):
+    y, sr = librosa.load(AUDIO, sr=None)
+    np.testing.assert_allclose(upload.features(), extract_features(y, sr), rtol=RTOL, atol=ATOL)
+
+
+@pytest.mark.parametrize("align", [HOP_LENGTH, 1])
+def test_speech_region_matches_extraction_on_trimmed_signal(upload, align):
+    y, sr = librosa.load(AUDIO, sr=None)
+    trimmed, bounds = SpeechTrimmer(align=align).trim(y, sr)
+    np.testing.assert_allclose(upload.features(bounds), extract_features(trimmed, sr), rtol=RTOL, atol=ATOL)
+
+
+@pytest.mark.parametrize("bounds", [(0, 3000), (512, 1500), (1024, 6000), (3 * HOP_LENGTH, None), (7, None)])
+def test_cuts_anywhere_match(bounds):
+    sr = 16000
+    rng = np.random.default_rng(0)
+    t = np.arange(sr) / sr
+    y = (0.3 * np.sin(2 * np.pi * 220 * t) + rng.normal(0, 0.05, sr)).astype(np.float32)
+    upload = StreamingUpload()
+    upload.feed(wav_bytes(y, sr))
+    _, decoded, _ = upload.finish()
+    start, end = bounds[0], bounds[1] or len(decoded)
+    np.testing.assert_allclose(upload.features((start, end)), extract_features(decoded[start:end], sr),
+                               rtol=RTOL, atol=ATOL)
@@ -0,0 +1,20 @@
+import numpy as np
+
+from train_deepfake import row_chunks
+
+
+def test_row_chunks_cover_rows_once_in_forward_order():
+    rows = np.random.default_rng(0).permutation(1000)[:700]
+    chunks = list(row_chunks(rows, 256))
+    assert [len(chunk) for chunk in chunks] == [256, 256, 188]
+    assert all(np.all(np.diff(chunk) > 0) for chunk in chunks)
+    np.testing.assert_array_equal(np.sort(np.concatenate(chunks)), np.sort(rows))
+
+
+def test_row_chunks_read_the_same_rows_from_a_memory_map(tmp_path):
+    X = np.arange(200, dtype=np.float32).reshape(100, 2)
+    np.save(tmp_path / "X.npy", X)
+    mapped = np.load(tmp_path / "X.npy", mmap_mode="r")
+    rows = np.array([90, 3, 41, 7, 66])
+    read = np.concatenate([mapped[chunk] for chunk in row_chunks(rows, 2)])
+    np.testing.assert_array_equal(read, X[np.concatenate([np.sort(rows[:2]), np.sort(rows[2:4]), rows[4:]])])
@@ -0,0 +1,38 @@
+import sys
+import types
+
+import pytest
+
+from request_audio import RequestAudio
+from transcription import AssemblyAITranscriber, Transcriber
+
+
+class FlakyService:
+    """Fails the first upload after reading part of it, then transcribes whatever it is sent."""
+
+    def __init__(self):
+        self.uploads = []
+
+    def transcribe(self, stream):
+        self.uploads.append(stream.read())
+        if len(self.uploads) == 1:
+            raise ConnectionError("connection reset")
+        return types.SimpleNamespace(status="completed", text=" Hello World ")
+
+
+def test_every_attempt_uploads_the_whole_recording(monkeypatch):
+    service = FlakyService()
+    fake_aai = types.SimpleNamespace(settings=types.SimpleNamespace(api_key=None), Transcriber=lambda: service)
+    monkeypatch.setitem(sys.modules, "assemblyai", fake_aai)
+    transcriber = AssemblyAITranscriber(api_key="key", retry_delay=0)
+
+    assert transcriber.transcribe(RequestAudio(b"RIFF-recording")) == "hello world"
+    assert service.uploads == [b"RIFF-recording", b"RIFF-recording"]
+
+
+def test_backends_must_implement_transcribe():
+    class Silent(Transcriber):
+        name = "silent"
+
+    with pytest.raises(TypeError):
+        Silent()
@@ -0,0 +1,25 @@
+import os
+
+import pandas as pd
+
+from deepfake_proper import dataset_hash
+from update_deepfake import append_rows
+
+
+def test_appended_rows_chain_onto_the_dataset_hash(tmp_path):
+    csv_path = str(tmp_path / "train.csv")
+    pd.DataFrame({"a": [1, 2], "LABEL": ["REAL", "FAKE"]}).to_csv(csv_path, index=False)
+    segments = [os.path.getsize(csv_path)]
+    digest = dataset_hash(csv_path)
+    assert dataset_hash(csv_path, segments) == digest
+
+    for rows in ([3], [4, 5]):
+        start, end, digest = append_rows(pd.DataFrame({"LABEL": ["REAL"] * len(rows), "a": rows}), csv_path, digest)
+        assert start == segments[-1]
+        segments.append(end)
+        assert dataset_hash(csv_path, segments) == digest  # What the server recomputes from the file
+
+    assert pd.read_csv(csv_path)["a"].tolist() == [1, 2, 3, 4, 5]
+    with open(csv_path, "ab") as f:
+        f.write(b"6,REAL\n")
+    assert dataset_hash(csv_path, segments) != digest
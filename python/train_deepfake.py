@@ -0,0 +1,325 @@
+"""Offline training entry point for the deepfake detector.
+
+Trains the MLP on the labeled feature CSV and writes a versioned model artifact
+that `DeepfakeDetector.load()` serves: the Keras model plus a BatchNorm-folded
+NumPy export (see mlp_inference.py) that is checked against Keras on X_test.
+Training is skipped when the artifact was already built from a dataset with the
+same hash.
+
+The parsed and scaled CSV is cached as memory-mapped .npy files (see
+feature_dataset.py) and streamed to Keras through a shuffled, batched and
+prefetched tf.data pipeline. The train/validation/test splits are row indices
+into the memory map; each batch reads its rows in sorted order, so no split is
+ever copied into memory whole. Wall-clock time per stage and peak memory are
+printed and recorded in the artifact metadata.
+
+The artifact also keeps a fixed sample of the held-out rows (holdout.npz) and a
+bounded replay sample of the training rows (replay.npz), both unscaled. They let
+`update_deepfake.py` fine-tune the model on newly labeled rows without
+revisiting the whole dataset.
+
+Usage:
+    python train_deepfake.py [--csv dataset/shuffled_file.csv] [--out models/deepfake] [--force]
+        [--cache-dir data/dataset_cache] [--checkpoint-dir DIR] [--batch-size 256]
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+
+from deepfake_proper import (
+    ARTIFACT_FORMAT_VERSION,
+    DEFAULT_ARTIFACT_DIR,
+    DEFAULT_DATASET_PATH,
+    KERAS_MODEL_FILE,
+    METADATA_FILE,
+    REQUIRED_FEATURES,
+    dataset_hash,
+    read_artifact_metadata,
+)
+from feature_dataset import DEFAULT_CACHE_DIR, load_feature_dataset
+from mlp_inference import NUMPY_MODEL_FILE, NumpyMLP
+
+SEED = 42
+# Max |keras - numpy| probability allowed on X_test before an export is rejected.
+NUMPY_PARITY_TOLERANCE = 1e-4
+DEFAULT_BATCH_SIZE = 256
+# Adam step size for DEFAULT_BATCH_SIZE: the original 1e-4 at batch 32, scaled by sqrt(256 / 32)
+DEFAULT_LEARNING_RATE = 3e-4
+HOLDOUT_FILE = "holdout.npz"
+REPLAY_FILE = "replay.npz"
+# Caps on the rows kept with an artifact; they bound the cost of every incremental update
+MAX_HOLDOUT_ROWS = 20000
+REPLAY_ROWS = 20000
+# Rows read from the memory-mapped dataset at a time when a split is scanned outside tf.data
+CHUNK_ROWS = 65536
+
+
+def peak_memory_mb():
+    """Peak resident set size of this process in MiB, or None where `resource` is unavailable."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / 1024  # bytes on macOS, KiB on Linux
+
+
+def row_chunks(rows, chunk_rows):
+    """Split an index array into consecutive chunks, each sorted so memory-mapped reads move forward."""
+    for start in range(0, len(rows), chunk_rows):
+        yield np.sort(rows[start:start + chunk_rows])
+
+
+def make_tf_dataset(X, y, batch_size, shuffle=False, rows=None):
+    """Batched, prefetched tf.data pipeline over (X, y); reshuffled every epoch when `shuffle` is set.
+
+    With `rows`, the pipeline covers only those row indices of X and y (typically a memory map) and
+    reads one batch at a time instead of copying them into the graph.
+    """
+    import tensorflow as tf
+
+    if rows is None:
+        dataset = tf.data.Dataset.from_tensor_slices((X, y))
+        if shuffle:
+            dataset = dataset.shuffle(len(X), seed=SEED, reshuffle_each_iteration=True)
+        return dataset.batch(batch_size).prefetch(tf.data.AUTOTUNE)
+
+    rng = np.random.default_rng(SEED)
+
+    def batches():
+        # Called once per epoch; a batch's gradient does not depend on the order of its rows
+        for batch in row_chunks(rng.permutation(rows) if shuffle else rows, batch_size):
+            yield X[batch], y[batch]
+
+    dataset = tf.data.Dataset.from_generator(batches, output_signature=(
+        tf.TensorSpec((None, X.shape[1]), tf.as_dtype(X.dtype)),
+        tf.TensorSpec((None,), tf.as_dtype(y.dtype))))
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
+
+def build_model(n_features, learning_rate=1e-4):
+    from tensorflow import keras
+    from tensorflow.keras import layers
+    from tensorflow.keras.models import Sequential
+
+    model = Sequential([
+        layers.Input(shape=(n_features,)),
+        layers.Dense(1024, activation='relu'),
+        layers.BatchNormalization(),
+        layers.Dropout(0.4),
+        layers.Dense(512, activation='relu'),
+        layers.BatchNormalization(),
+        layers.Dropout(0.3),
+        layers.Dense(128, activation='relu'),
+        layers.BatchNormalization(),
+        layers.Dense(1, activation='sigmoid')
+    ])
+
+    model.compile(optimizer=keras.optimizers.Adam(learning_rate=learning_rate),
+                  loss='binary_crossentropy',
+                  metrics=['accuracy'])
+    return model
+
+
+def check_numpy_parity(keras_model, numpy_model, X, tolerance=NUMPY_PARITY_TOLERANCE, rows=None):
+    """Compare both backends on X (or its `rows`, read in chunks); raise if the folded NumPy model drifts."""
+    chunks = [X] if rows is None else (X[chunk] for chunk in row_chunks(rows, CHUNK_ROWS))
+    max_abs_diff, agreeing, count = 0.0, 0, 0
+    for chunk in chunks:
+        expected = keras_model.predict(chunk, verbose=0)
+        actual = numpy_model.predict(chunk)
+        max_abs_diff = max(max_abs_diff, float(np.max(np.abs(expected - actual))))
+        agreeing += int(np.sum((expected >= 0.5) == (actual >= 0.5)))
+        count += len(chunk)
+    if max_abs_diff > tolerance:
+        raise RuntimeError(f"NumPy export disagrees with Keras on X_test (max abs diff {max_abs_diff:.2e}).")
+    print(f"✅ NumPy export matches Keras on {count} test rows "
+          f"(max abs diff {max_abs_diff:.2e}, label agreement {agreeing / count:.2%}).")
+    return max_abs_diff
+
+
+def save_rows(path, X, y):
+    """Store unscaled feature rows and their encoded labels next to an artifact."""
+    np.savez(path, X=np.asarray(X, dtype=np.float32), y=np.asarray(y, dtype=np.uint8))
+
+
+def load_rows(path):
+    with np.load(path) as data:
+        return data["X"], data["y"]
+
+
+def _publish(staging_dir, artifact_dir):
+    """Swap the freshly written artifact into place so readers never see a half-written one."""
+    previous_dir = artifact_dir + ".old"
+    if os.path.exists(previous_dir):
+        shutil.rmtree(previous_dir)
+    if os.path.exists(artifact_dir):
+        os.replace(artifact_dir, previous_dir)
+    os.replace(staging_dir, artifact_dir)
+    if os.path.exists(previous_dir):
+        shutil.rmtree(previous_dir)
+
+
+def train(csv_path=DEFAULT_DATASET_PATH, artifact_dir=DEFAULT_ARTIFACT_DIR, force=False, epochs=25,
+          batch_size=DEFAULT_BATCH_SIZE, learning_rate=DEFAULT_LEARNING_RATE, cache_dir=DEFAULT_CACHE_DIR,
+          checkpoint_dir=None):
+    """Train the detector and write its artifact; returns the artifact metadata.
+
+    The best epoch is checkpointed to `checkpoint_dir`, or to the artifact's staging directory by default.
+    """
+    existing = read_artifact_metadata(artifact_dir)
+    if not force and existing and \
+            existing.get("dataset_hash") == dataset_hash(csv_path, existing.get("dataset_segments")):
+        print(f"✅ Model artifact {existing['model_version']} is up to date with {csv_path}, skipping training.")
+        return existing
+    dataset_bytes = os.path.getsize(csv_path)
+    digest = dataset_hash(csv_path, [dataset_bytes])
+
+    timings = {}
+    started_at = time.perf_counter()
+
+    os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+    import tensorflow as tf
+    from sklearn.model_selection import train_test_split
+    from sklearn.utils.class_weight import compute_class_weight
+    from tensorflow.keras.callbacks import EarlyStopping, ModelCheckpoint, ReduceLROnPlateau
+
+    # Enable TensorFlow JIT optimization
+    tf.config.optimizer.set_jit(True)
+    tf.keras.utils.set_random_seed(SEED)
+    timings["import_seconds"] = time.perf_counter() - started_at
+
+    # =========================
+    # Data Loading & Preprocessing
+    # =========================
+    stage_start = time.perf_counter()
+    dataset = load_feature_dataset(csv_path, cache_dir, digest=digest)
+    y = np.asarray(dataset.y)
+
+    # Handle data imbalance using class weights
+    class_weights = dict(enumerate(compute_class_weight('balanced', classes=np.unique(y), y=y)))
+
+    # Same split as before: the seed fixes the permutation independently of the arrays' contents
+    train_idx, test_idx = train_test_split(np.arange(len(y)), test_size=0.2, random_state=SEED)
+    # Hold out the last 20% of the training rows for validation, as validation_split did
+    n_fit = len(train_idx) - int(len(train_idx) * 0.2)
+    train_data = make_tf_dataset(dataset.X, y, batch_size, shuffle=True, rows=train_idx[:n_fit])
+    val_data = make_tf_dataset(dataset.X, y, batch_size, rows=train_idx[n_fit:])
+    timings["data_seconds"] = time.perf_counter() - stage_start
+
+    # =========================
+    # Model Training
+    # =========================
+    staging_dir = f"{artifact_dir}.tmp-{os.getpid()}"
+    if os.path.exists(staging_dir):
+        shutil.rmtree(staging_dir)
+    os.makedirs(staging_dir)
+    if checkpoint_dir:
+        os.makedirs(checkpoint_dir, exist_ok=True)
+    checkpoint_path = os.path.join(checkpoint_dir or staging_dir, "checkpoint.keras")
+
+    stage_start = time.perf_counter()
+    model = build_model(dataset.X.shape[1], learning_rate)
+    early_stopping = EarlyStopping(monitor='val_loss', patience=5, restore_best_weights=True)
+    model_checkpoint = ModelCheckpoint(checkpoint_path, save_best_only=True)
+    reduce_lr = ReduceLROnPlateau(monitor='val_loss', factor=0.5, patience=3, min_lr=1e-6)
+
+    history = model.fit(train_data,
+                        epochs=epochs,
+                        validation_data=val_data,
+                        class_weight=class_weights,
+                        callbacks=[early_stopping, model_checkpoint, reduce_lr])
+    timings["fit_seconds"] = time.perf_counter() - stage_start
+
+    stage_start = time.perf_counter()
+    _, test_accuracy = model.evaluate(make_tf_dataset(dataset.X, y, batch_size, rows=test_idx), verbose=0)
+    if not checkpoint_dir:
+        os.remove(checkpoint_path)
+
+    # Export the BatchNorm-folded NumPy model served by default and check it against Keras.
+    numpy_model = NumpyMLP.from_keras(model)
+    parity = check_numpy_parity(model, numpy_model, dataset.X, rows=test_idx)
+
+    # Unscaled held-out and replay rows for update_deepfake.py; only these bounded samples are copied
+    rng = np.random.default_rng(SEED)
+    holdout_idx = np.sort(test_idx[rng.permutation(len(test_idx))[:MAX_HOLDOUT_ROWS]])
+    replay_idx = np.sort(train_idx[rng.permutation(len(train_idx))[:REPLAY_ROWS]])
+    save_rows(os.path.join(staging_dir, HOLDOUT_FILE),
+              dataset.X[holdout_idx] * dataset.scaler_scale + dataset.scaler_mean, y[holdout_idx])
+    save_rows(os.path.join(staging_dir, REPLAY_FILE),
+              dataset.X[replay_idx] * dataset.scaler_scale + dataset.scaler_mean, y[replay_idx])
+
+    # =========================
+    # Artifact
+    # =========================
+    created_at = datetime.datetime.now(datetime.timezone.utc)
+    metadata = {
+        "format_version": ARTIFACT_FORMAT_VERSION,
+        "model_version": f"{digest.split(':')[1][:12]}-{created_at.strftime('%Y%m%d%H%M%S')}",
+        "created_at": created_at.isoformat(),
+        "dataset_hash": digest,
+        "dataset_rows": int(len(y)),
+        "dataset_segments": [dataset_bytes],
+        "feature_names": REQUIRED_FEATURES,
+        "scaler": {
+            "mean": dataset.scaler_mean.tolist(),
+            "scale": dataset.scaler_scale.tolist(),
+            "count": int(len(y)),
+        },
+        "label_classes": list(dataset.label_classes),
+        "test_accuracy": float(test_accuracy),
+        "numpy_parity_max_abs_diff": parity,
+        "holdout": {"rows": int(len(holdout_idx)), "capacity": MAX_HOLDOUT_ROWS, "seen": int(len(test_idx))},
+        "replay": {"rows": int(len(replay_idx)), "capacity": REPLAY_ROWS, "seen": int(len(train_idx))},
+        "training": {
+            "seed": SEED,
+            "epochs_run": len(history.history["loss"]),
+            "batch_size": batch_size,
+            "learning_rate": learning_rate,
+        },
+    }
+    model.save(os.path.join(staging_dir, KERAS_MODEL_FILE))
+    numpy_model.save(os.path.join(staging_dir, NUMPY_MODEL_FILE))
+
+    timings["export_seconds"] = time.perf_counter() - stage_start
+    timings["wall_seconds"] = time.perf_counter() - started_at
+    metadata["training"].update({name: round(value, 3) for name, value in timings.items()})
+    metadata["training"]["peak_memory_mb"] = peak_memory_mb()
+    with open(os.path.join(staging_dir, METADATA_FILE), "w") as f:
+        json.dump(metadata, f, indent=2)
+
+    _publish(staging_dir, artifact_dir)
+    print(f"✅ Wrote model artifact {metadata['model_version']} to {artifact_dir} "
+          f"(test accuracy {test_accuracy:.4f}).")
+    peak = metadata["training"]["peak_memory_mb"]
+    print("⏱ " + ", ".join(f"{name.replace('_seconds', '')} {value:.1f}s" for name, value in timings.items())
+          + (f", peak memory {peak:.0f} MiB" if peak is not None else ""))
+    return metadata
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the deepfake detector and write a model artifact.")
+    parser.add_argument("--csv", default=DEFAULT_DATASET_PATH, help="Labeled feature CSV.")
+    parser.add_argument("--out", default=DEFAULT_ARTIFACT_DIR, help="Artifact directory to write.")
+    parser.add_argument("--force", action="store_true", help="Retrain even if the dataset hash is unchanged.")
+    parser.add_argument("--epochs", type=int, default=25)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--learning-rate", type=float, default=DEFAULT_LEARNING_RATE)
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="Where the parsed dataset is cached.")
+    parser.add_argument("--checkpoint-dir", default=None,
+                        help="Keep the best-epoch checkpoint here (default: discarded after training).")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(name)s: %(message)s")
+    train(args.csv, args.out, force=args.force, epochs=args.epochs, batch_size=args.batch_size,
+          learning_rate=args.learning_rate, cache_dir=args.cache_dir, checkpoint_dir=args.checkpoint_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""Pluggable speech-to-text backends for prompt verification.
+
+`verify_speech` only needs to know whether the user read a known prompt, so every
+backend takes the expected sentence as a hint:
+
+- `AssemblyAITranscriber`: the remote service `transcribe_audio` always used;
+  open transcription, ignores the hint.
+- `VoskPromptTranscriber`: offline Kaldi decoding with the search graph constrained
+  to the expected sentence (plus an out-of-vocabulary filler), which is far cheaper
+  than open transcription and does not leave the host. Needs the optional `vosk`
+  package and a model directory (VOICEPAY_VOSK_MODEL).
+
+`transcriber_from_env()` picks one from VOICEPAY_TRANSCRIBER ("assemblyai" or "vosk").
+"""
+import abc
+import json
+import logging
+import os
+import re
+import time
+
+import numpy as np
+
+from request_audio import RequestAudio
+
+logger = logging.getLogger("voicepay.transcription")
+
+# AssemblyAI API Key (Replace with a valid API key)
+ASSEMBLYAI_API_KEY = os.environ.get("ASSEMBLYAI_API_KEY", "d5a05d4271894a61ace9741605c8a7e8")
+VOSK_SAMPLE_RATE = 16000
+
+
+def prompt_words(text):
+    """Lowercase words of `text` without punctuation, as a constrained decoder sees them."""
+    return re.sub(r"[^a-z0-9' ]+", " ", text.lower()).split()
+
+
+class Transcriber(abc.ABC):
+    name = "base"
+
+    @abc.abstractmethod
+    def transcribe(self, audio, expected_text=None):
+        """Return the lowercased transcript of `audio` (RequestAudio, bytes or path), or None on failure."""
+
+
+class AssemblyAITranscriber(Transcriber):
+    name = "assemblyai"
+
+    def __init__(self, api_key=ASSEMBLYAI_API_KEY, max_retries=3, retry_delay=2.0):
+        import assemblyai as aai
+
+        self.aai = aai
+        self.api_key = api_key
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        aai.settings.api_key = api_key
+
+    def transcribe(self, audio, expected_text=None):
+        if not self.api_key:
+            logger.error("❌ Error: AssemblyAI API key is missing.")
+            return None
+
+        # Uploads arrive as a RequestAudio (or raw bytes); AssemblyAI wants a path or a binary stream.
+        if isinstance(audio, (bytes, bytearray)):
+            audio = RequestAudio(audio)
+
+        transcriber = self.aai.Transcriber()
+        for attempt in range(self.max_retries):
+            try:
+                logger.debug("\U0001F504 Uploading audio for verification...")
+                # Each attempt reads the upload from the start
+                transcript = transcriber.transcribe(audio.file_like() if isinstance(audio, RequestAudio) else audio)
+                if transcript.status == "completed":
+                    return transcript.text.strip().lower()
+                logger.warning("⚠ Transcription failed. Attempt %d/%d", attempt + 1, self.max_retries)
+            except Exception as e:
+                if "Unauthorized" in str(e):
+                    logger.error("❌ Invalid AssemblyAI API key. Check your environment variable.")
+                    return None  # No retries if API key is wrong
+                logger.warning("⚠ Error: %s. Retrying (%d/%d)...", e, attempt + 1, self.max_retries)
+                time.sleep(self.retry_delay)
+        return None
+
+
+class VoskPromptTranscriber(Transcriber):
+    name = "vosk"
+
+    def __init__(self, model_path=None, chunk_samples=8000):
+        try:
+            import vosk
+        except ImportError as e:
+            raise ImportError("VoskPromptTranscriber needs the optional `vosk` package (pip install vosk).") from e
+
+        model_path = model_path or os.environ.get("VOICEPAY_VOSK_MODEL")
+        if not model_path or not os.path.isdir(model_path):
+            raise FileNotFoundError("Set VOICEPAY_VOSK_MODEL to an unpacked Vosk model directory.")
+        vosk.SetLogLevel(-1)
+        self.vosk = vosk
+        self.model = vosk.Model(model_path)  # Shared, read-only across threads
+        self.chunk_samples = chunk_samples
+
+    def _pcm16(self, audio):
+        if not isinstance(audio, RequestAudio):
+            if not isinstance(audio, (bytes, bytearray)):
+                with open(audio, "rb") as f:
+                    audio = f.read()
+            audio = RequestAudio(audio)
+        y = audio.resampled(VOSK_SAMPLE_RATE)
+        return (np.clip(y, -1.0, 1.0) * 32767).astype("<i2")
+
+    def transcribe(self, audio, expected_text=None):
+        pcm = self._pcm16(audio)
+        if expected_text:
+            grammar = json.dumps([" ".join(prompt_words(expected_text)), "[unk]"])
+            recognizer = self.vosk.KaldiRecognizer(self.model, VOSK_SAMPLE_RATE, grammar)
+        else:
+            recognizer = self.vosk.KaldiRecognizer(self.model, VOSK_SAMPLE_RATE)
+
+        for start in range(0, len(pcm), self.chunk_samples):
+            recognizer.AcceptWaveform(pcm[start:start + self.chunk_samples].tobytes())
+        text = json.loads(recognizer.FinalResult()).get("text", "").strip()
+        if not text:
+            return None
+
+        # The decoder only knows the prompt's words; when it heard exactly the prompt,
+        # report it as written so callers comparing against the prompt see a match.
+        if expected_text and text.split() == prompt_words(expected_text):
+            return expected_text.strip().lower()
+        return text
+
+
+def transcriber_from_env():
+    spec = os.environ.get("VOICEPAY_TRANSCRIBER", "assemblyai")
+    if spec == "assemblyai":
+        return AssemblyAITranscriber()
+    if spec == "vosk":
+        return VoskPromptTranscriber()
+    raise ValueError(f"Unknown VOICEPAY_TRANSCRIBER backend: {spec}")
@@ -0,0 +1,389 @@
+"""Incremental update of the deepfake detector from newly labeled feature rows.
+
+`train_deepfake.py` refits the scaler and trains the MLP from scratch on the
+whole CSV. This script starts from the current artifact instead, and takes a CSV
+of new rows (REQUIRED_FEATURES + LABEL):
+
+- the rows are merged into the scaler's count, mean and variance with the
+  parallel-variance formula, without revisiting the old rows;
+- the first Dense layer is rewritten for the new scaler, so the warm-started
+  model gives the same outputs as before;
+- --holdout-fraction of the new rows is set aside and enters the artifact's
+  held-out sample, a fixed-size reservoir of rows no model was trained on, so
+  the comparison below also covers the kind of data the update is about;
+- the model is fine-tuned for at most --max-steps batches on the other new rows
+  mixed with rows from the artifact's replay sample, a fixed-size reservoir of
+  earlier training rows that those rows then enter;
+- old and new model are scored on the updated held-out sample, and the new
+  artifact is published only if accuracy does not drop by more than
+  --tolerance.
+
+The replay and held-out samples have a fixed size, so time and memory per update
+depend on the size of the batch, not of the dataset. On promotion the rows are
+appended to the training CSV in place (unless --no-append), and the artifact
+records the CSV's new size and hash, so `DeepfakeDetector.from_csv` keeps
+serving it instead of retraining. The hash is chained (see `dataset_hash`): the
+new one is computed from the old one and the appended bytes, so the CSV is never
+read or copied in full. Before an update, the CSV only has to have the size the
+artifact recorded; the server checks the whole hash when it loads the artifact.
+If publishing the artifact fails, the CSV is truncated back to its old size.
+
+Usage:
+    python update_deepfake.py new_rows.csv [--model models/deepfake] [--csv dataset/shuffled_file.csv]
+        [--no-append] [--max-steps 200] [--holdout-fraction 0.2] [--tolerance 0.0]
+"""
+import argparse
+import datetime
+import json
+import logging
+import math
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+
+from deepfake_proper import (
+    DEFAULT_ARTIFACT_DIR,
+    DEFAULT_DATASET_PATH,
+    KERAS_MODEL_FILE,
+    METADATA_FILE,
+    REQUIRED_FEATURES,
+    chain_hash,
+    dataset_hash,
+    read_artifact_metadata,
+)
+from mlp_inference import NUMPY_MODEL_FILE, NumpyMLP
+from train_deepfake import (
+    DEFAULT_BATCH_SIZE,
+    HOLDOUT_FILE,
+    MAX_HOLDOUT_ROWS,
+    REPLAY_FILE,
+    SEED,
+    _publish,
+    check_numpy_parity,
+    load_rows,
+    make_tf_dataset,
+    peak_memory_mb,
+    save_rows,
+)
+
+DEFAULT_MAX_STEPS = 200
+DEFAULT_EPOCHS = 3
+# Lower than a full fit: the weights are already trained
+DEFAULT_LEARNING_RATE = 1e-4
+# Replay rows drawn per new row, to keep the model from forgetting the rest of the dataset
+DEFAULT_REPLAY_RATIO = 1.0
+# Share of each batch held out from fine-tuning and added to the held-out sample
+DEFAULT_HOLDOUT_FRACTION = 0.2
+
+
+def read_labeled_rows(csv_path, label_classes):
+    """Unscaled feature rows and labels encoded in the artifact's class order, plus the parsed frame."""
+    import pandas as pd
+
+    df = pd.read_csv(csv_path)
+    missing = [column for column in REQUIRED_FEATURES + ["LABEL"] if column not in df.columns]
+    if missing:
+        raise ValueError(f"{csv_path} is missing columns: {', '.join(missing)}")
+    unlabeled = df["LABEL"].isna() | (df["LABEL"].astype(str).str.strip() == "")
+    if unlabeled.any():
+        raise ValueError(f"{csv_path} has {int(unlabeled.sum())} rows without a LABEL; "
+                         "label them (predicted_label is the model's guess, not ground truth)")
+    unknown = set(df["LABEL"]) - set(label_classes)
+    if unknown:
+        raise ValueError(f"{csv_path} has labels the model was not trained on: {', '.join(map(str, unknown))}")
+    y = df["LABEL"].map({label: i for i, label in enumerate(label_classes)}).values.astype(np.uint8)
+    return df[REQUIRED_FEATURES].values.astype(np.float64), y, df
+
+
+def merge_scaler(count, mean, var, X):
+    """Add the rows of X to running (count, mean, variance) statistics (Chan et al.)."""
+    n = len(X)
+    batch_mean = X.mean(axis=0)
+    batch_m2 = ((X - batch_mean) ** 2).sum(axis=0)
+    total = count + n
+    delta = batch_mean - mean
+    m2 = var * count + batch_m2 + delta ** 2 * count * n / total
+    return total, mean + delta * n / total, m2 / total
+
+
+def scale_from_var(var):
+    """StandardScaler's scale_: the standard deviation, with constant features left unscaled."""
+    scale = np.sqrt(var)
+    scale[scale < 10 * np.finfo(scale.dtype).eps] = 1.0
+    return scale
+
+
+def rescale_input_layer(model, old_mean, old_scale, new_mean, new_scale):
+    """Rewrite the first Dense layer for inputs scaled with the new statistics, keeping its outputs.
+
+    (x - old_mean) / old_scale == x_new * new_scale / old_scale + (new_mean - old_mean) / old_scale,
+    where x_new = (x - new_mean) / new_scale.
+    """
+    dense = next(layer for layer in model.layers if type(layer).__name__ == "Dense")
+    kernel, bias = dense.get_weights()
+    shift = (new_mean - old_mean) / old_scale
+    dense.set_weights([((new_scale / old_scale)[:, None] * kernel).astype(kernel.dtype),
+                       (bias + shift @ kernel).astype(bias.dtype)])
+
+
+def reservoir_update(X_replay, y_replay, seen, capacity, X_new, y_new, rng):
+    """Reservoir-sample the new rows into the replay set; every row seen so far is kept with equal chance."""
+    free = max(0, capacity - len(X_replay))
+    X_replay = np.concatenate([X_replay, X_new[:free]]).astype(np.float32)
+    y_replay = np.concatenate([y_replay, y_new[:free]])
+    seen += min(free, len(X_new))
+    for x, label in zip(X_new[free:], y_new[free:]):
+        seen += 1
+        slot = rng.integers(seen)
+        if slot < capacity:
+            X_replay[slot], y_replay[slot] = x, label
+    return X_replay, y_replay, seen
+
+
+def holdout_accuracy(model, mean, scale, X, y):
+    probabilities = model.predict((X - mean) / scale)[:, 0]
+    return float(np.mean((probabilities >= 0.5) == (y == 1)))
+
+
+def check_columns(df, csv_path):
+    """The training CSV's column order, after checking the new rows have every column of it."""
+    import pandas as pd
+
+    columns = list(pd.read_csv(csv_path, nrows=0).columns)
+    missing = [column for column in columns if column not in df.columns]
+    if missing:
+        raise ValueError(f"New rows are missing columns of {csv_path}: {', '.join(missing)}")
+    return columns
+
+
+def append_rows(df, csv_path, digest):
+    """Append the rows to the training CSV in place; returns (its previous size, its new size, its new hash).
+
+    `digest` is the CSV's dataset_hash before the append.
+    """
+    columns = check_columns(df, csv_path)
+    rows = df[columns].to_csv(header=False, index=False).encode()
+    with open(csv_path, "rb+") as f:
+        size = f.seek(0, os.SEEK_END)
+        if size:
+            f.seek(size - 1)
+            if f.read(1) != b"\n":
+                rows = b"\n" + rows
+        f.write(rows)
+        f.flush()
+        os.fsync(f.fileno())
+    return size, size + len(rows), chain_hash(digest, rows)
+
+
+def update(rows_csv, artifact_dir=DEFAULT_ARTIFACT_DIR, csv_path=DEFAULT_DATASET_PATH, append=True,
+           max_steps=DEFAULT_MAX_STEPS, epochs=DEFAULT_EPOCHS, batch_size=DEFAULT_BATCH_SIZE,
+           learning_rate=DEFAULT_LEARNING_RATE, replay_ratio=DEFAULT_REPLAY_RATIO,
+           holdout_fraction=DEFAULT_HOLDOUT_FRACTION, tolerance=0.0):
+    """Fine-tune the artifact on the rows of `rows_csv`; returns (promoted, metadata of the served artifact)."""
+    timings = {}
+    started_at = time.perf_counter()
+    metadata = read_artifact_metadata(artifact_dir)
+    if metadata is None:
+        raise FileNotFoundError(f"No deepfake model artifact in {artifact_dir}. Run `python train_deepfake.py` first.")
+    holdout_path = os.path.join(artifact_dir, HOLDOUT_FILE)
+    replay_path = os.path.join(artifact_dir, REPLAY_FILE)
+    if not (os.path.exists(holdout_path) and os.path.exists(replay_path)):
+        raise FileNotFoundError(f"{artifact_dir} has no held-out or replay rows. "
+                                "Run `python train_deepfake.py --force` once to write them.")
+    segments = metadata.get("dataset_segments")
+    if append:
+        if segments is None:  # Artifacts written before the CSV's size was recorded: check the hash once
+            segments = [os.path.getsize(csv_path)]
+            matches = dataset_hash(csv_path) == metadata["dataset_hash"]
+        else:
+            matches = os.path.getsize(csv_path) == segments[-1]
+        if not matches:
+            raise ValueError(f"{artifact_dir} was not built from the current {csv_path}; "
+                             "retrain it or pass append=False.")
+
+    os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+    import tensorflow as tf
+    from sklearn.utils.class_weight import compute_class_weight
+    from tensorflow import keras
+
+    tf.keras.utils.set_random_seed(SEED)
+    timings["import_seconds"] = time.perf_counter() - started_at
+
+    # =========================
+    # Scaler & Replay Rows
+    # =========================
+    stage_start = time.perf_counter()
+    X_new, y_new, new_rows = read_labeled_rows(rows_csv, metadata["label_classes"])
+    if not len(X_new):
+        raise ValueError(f"{rows_csv} has no rows")
+    if append:
+        check_columns(new_rows, csv_path)  # Before any training, not when the rows are finally appended
+
+    rng = np.random.default_rng([SEED, metadata["replay"]["seen"]])
+    held = np.zeros(len(X_new), dtype=bool)
+    held[rng.permutation(len(X_new))[:int(holdout_fraction * len(X_new))]] = True
+    X_train, y_train = X_new[~held], y_new[~held]
+    if not len(X_train):
+        raise ValueError(f"{rows_csv} has too few rows to hold {holdout_fraction:.0%} of them out")
+
+    scaler = metadata["scaler"]
+    old_mean = np.asarray(scaler["mean"])
+    old_scale = np.asarray(scaler["scale"])
+    count = scaler.get("count", metadata["dataset_rows"])
+    count, new_mean, new_var = merge_scaler(count, old_mean, np.asarray(scaler.get("var", old_scale ** 2)),
+                                            X_train)
+    new_scale = scale_from_var(new_var)
+
+    X_replay, y_replay = load_rows(replay_path)
+    holdout = metadata.get("holdout") or {"rows": metadata["holdout_rows"], "capacity": MAX_HOLDOUT_ROWS,
+                                          "seen": metadata["holdout_rows"]}
+    X_holdout, y_holdout = load_rows(holdout_path)
+    X_holdout, y_holdout, holdout_seen = reservoir_update(X_holdout, y_holdout, holdout["seen"],
+                                                          holdout["capacity"], X_new[held], y_new[held], rng)
+    replay_idx = rng.permutation(len(X_replay))[:int(math.ceil(replay_ratio * len(X_train)))]
+    X_fit = np.concatenate([X_train, X_replay[replay_idx]])
+    y_fit = np.concatenate([y_train, y_replay[replay_idx]])
+    X_fit = ((X_fit - new_mean) / new_scale).astype(np.float32)
+    classes = np.unique(y_fit)
+    class_weights = {int(c): w for c, w in zip(classes, compute_class_weight('balanced', classes=classes, y=y_fit))}
+    timings["data_seconds"] = time.perf_counter() - stage_start
+
+    # =========================
+    # Warm-Started Fine-Tuning
+    # =========================
+    stage_start = time.perf_counter()
+    model = keras.models.load_model(os.path.join(artifact_dir, KERAS_MODEL_FILE), compile=False)
+    rescale_input_layer(model, old_mean, old_scale, new_mean, new_scale)
+    model.compile(optimizer=keras.optimizers.Adam(learning_rate=learning_rate),
+                  loss='binary_crossentropy',
+                  metrics=['accuracy'])
+    steps = max(1, min(max_steps, math.ceil(epochs * len(X_fit) / batch_size)))
+    train_data = make_tf_dataset(X_fit, y_fit, batch_size, shuffle=True).repeat()
+    model.fit(train_data, epochs=1, steps_per_epoch=steps, class_weight=class_weights)
+    timings["fit_seconds"] = time.perf_counter() - stage_start
+
+    # =========================
+    # Promotion Gate
+    # =========================
+    stage_start = time.perf_counter()
+    current = NumpyMLP.load(os.path.join(artifact_dir, NUMPY_MODEL_FILE))
+    numpy_model = NumpyMLP.from_keras(model)
+    previous_accuracy = holdout_accuracy(current, old_mean, old_scale, X_holdout, y_holdout)
+    accuracy = holdout_accuracy(numpy_model, new_mean, new_scale, X_holdout, y_holdout)
+    timings["evaluate_seconds"] = time.perf_counter() - stage_start
+    if accuracy < previous_accuracy - tolerance:
+        print(f"❌ Held-out accuracy would drop from {previous_accuracy:.4f} to {accuracy:.4f}; "
+              f"keeping model artifact {metadata['model_version']}.")
+        return False, metadata
+    parity = check_numpy_parity(model, numpy_model, ((X_holdout - new_mean) / new_scale).astype(np.float32))
+
+    # =========================
+    # Artifact
+    # =========================
+    stage_start = time.perf_counter()
+    staging_dir = f"{artifact_dir}.tmp-{os.getpid()}"
+    if os.path.exists(staging_dir):
+        shutil.rmtree(staging_dir)
+    os.makedirs(staging_dir)
+    appended_at = None
+    try:
+        replay = metadata["replay"]
+        X_replay, y_replay, seen = reservoir_update(X_replay, y_replay, replay["seen"], replay["capacity"],
+                                                    X_train, y_train, rng)
+        save_rows(os.path.join(staging_dir, REPLAY_FILE), X_replay, y_replay)
+        save_rows(os.path.join(staging_dir, HOLDOUT_FILE), X_holdout, y_holdout)
+        model.save(os.path.join(staging_dir, KERAS_MODEL_FILE))
+        numpy_model.save(os.path.join(staging_dir, NUMPY_MODEL_FILE))
+
+        if append:
+            appended_at, size, digest = append_rows(new_rows, csv_path, metadata["dataset_hash"])
+            segments = segments + [size]
+        else:
+            digest = metadata["dataset_hash"]  # The CSV no longer describes the artifact; a retrain drops the rows
+        version_digest = digest if append else dataset_hash(rows_csv)
+        created_at = datetime.datetime.now(datetime.timezone.utc)
+        previous_version = metadata["model_version"]
+        metadata = dict(metadata)
+        metadata.pop("holdout_rows", None)  # Artifacts trained before the held-out sample grew
+        metadata.update({
+            "model_version": f"{version_digest.split(':')[1][:12]}-{created_at.strftime('%Y%m%d%H%M%S')}",
+            "created_at": created_at.isoformat(),
+            "dataset_hash": digest,
+            "dataset_rows": int(metadata["dataset_rows"] + len(X_new)),
+            "dataset_segments": segments,
+            "scaler": {
+                "mean": new_mean.tolist(),
+                "scale": new_scale.tolist(),
+                "count": int(count),
+                "var": new_var.tolist(),
+            },
+            "test_accuracy": accuracy,
+            "numpy_parity_max_abs_diff": parity,
+            "holdout": {"rows": int(len(X_holdout)), "capacity": holdout["capacity"], "seen": int(holdout_seen)},
+            "replay": {"rows": int(len(X_replay)), "capacity": replay["capacity"], "seen": int(seen)},
+            "update": {
+                "parent_version": previous_version,
+                "updates_since_training": metadata.get("update", {}).get("updates_since_training", 0) + 1,
+                "rows": int(len(X_new)),
+                "held_out_rows": int(held.sum()),
+                "replay_rows": int(len(replay_idx)),
+                "steps": steps,
+                "batch_size": batch_size,
+                "learning_rate": learning_rate,
+                "previous_holdout_accuracy": previous_accuracy,
+                "holdout_accuracy": accuracy,
+            },
+        })
+        timings["export_seconds"] = time.perf_counter() - stage_start
+        timings["wall_seconds"] = time.perf_counter() - started_at
+        metadata["update"].update({name: round(value, 3) for name, value in timings.items()})
+        metadata["update"]["peak_memory_mb"] = peak_memory_mb()
+        with open(os.path.join(staging_dir, METADATA_FILE), "w") as f:
+            json.dump(metadata, f, indent=2)
+
+        _publish(staging_dir, artifact_dir)
+    except BaseException:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        if appended_at is not None:
+            os.truncate(csv_path, appended_at)  # The CSV matches the artifact still published
+        raise
+
+    print(f"✅ Promoted model artifact {metadata['model_version']} over {previous_version} "
+          f"({len(X_new)} new rows, {steps} steps, held-out accuracy {previous_accuracy:.4f} -> {accuracy:.4f}).")
+    peak = metadata["update"]["peak_memory_mb"]
+    print("⏱ " + ", ".join(f"{name.replace('_seconds', '')} {value:.1f}s" for name, value in timings.items())
+          + (f", peak memory {peak:.0f} MiB" if peak is not None else ""))
+    return True, metadata
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fine-tune the deepfake detector artifact on new labeled rows.")
+    parser.add_argument("rows", help="CSV of new rows with the feature columns and LABEL.")
+    parser.add_argument("--model", default=DEFAULT_ARTIFACT_DIR, help="Artifact directory to update.")
+    parser.add_argument("--csv", default=DEFAULT_DATASET_PATH, help="Training CSV the rows are appended to.")
+    parser.add_argument("--no-append", action="store_true", help="Leave the training CSV unchanged.")
+    parser.add_argument("--max-steps", type=int, default=DEFAULT_MAX_STEPS, help="Upper bound on training batches.")
+    parser.add_argument("--epochs", type=int, default=DEFAULT_EPOCHS,
+                        help="Passes over the new and replayed rows, within --max-steps.")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--learning-rate", type=float, default=DEFAULT_LEARNING_RATE)
+    parser.add_argument("--replay-ratio", type=float, default=DEFAULT_REPLAY_RATIO,
+                        help="Replayed earlier rows per new row.")
+    parser.add_argument("--holdout-fraction", type=float, default=DEFAULT_HOLDOUT_FRACTION,
+                        help="Share of the new rows added to the held-out sample instead of trained on.")
+    parser.add_argument("--tolerance", type=float, default=0.0,
+                        help="Held-out accuracy the update may lose and still be promoted.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(name)s: %(message)s")
+    promoted, _ = update(args.rows, args.model, args.csv, append=not args.no_append, max_steps=args.max_steps,
+                         epochs=args.epochs, batch_size=args.batch_size, learning_rate=args.learning_rate,
+                         replay_ratio=args.replay_ratio, holdout_fraction=args.holdout_fraction,
+                         tolerance=args.tolerance)
+    sys.exit(0 if promoted else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Energy-based voice activity trimming.
+
+Uploads from the app (and `record_audio` in the CLI) carry up to a few seconds
+of leading/trailing silence and room noise, and every downstream stage
+(STFT features, MFCC embeddings, transcription) used to process all of it.
+`SpeechTrimmer` finds the first and last sustained speech frames from short-time
+energy, keeps a little padding around them and caps the clip length, so those
+stages only see the part that matters. Pauses inside the utterance are kept.
+
+Frame energies come from one cumulative sum of y**2, so detection is a handful
+of vectorized passes over the signal and costs far less than the STFT it saves.
+
+A frame counts as speech when its energy is above both
+`noise floor + margin_db` (the floor is a low percentile of frame energies) and
+`peak - range_db`. If no run of at least `min_speech_ms` qualifies, the clip is
+left untouched rather than being thrown away.
+"""
+import os
+
+import numpy as np
+
+FRAME_MS = 25
+HOP_MS = 10
+
+
+def frame_energy_db(y, sr, frame_ms=FRAME_MS, hop_ms=HOP_MS):
+    """Mean-square energy in dB of each frame; returns (energies, frame_length, hop_length) in samples."""
+    frame_length = max(1, int(sr * frame_ms / 1000))
+    hop_length = max(1, int(sr * hop_ms / 1000))
+    if len(y) < frame_length:
+        return np.empty(0), frame_length, hop_length
+    cumulative = np.concatenate([[0.0], np.cumsum(np.square(y, dtype=np.float64))])
+    starts = np.arange(0, len(y) - frame_length + 1, hop_length)
+    energy = (cumulative[starts + frame_length] - cumulative[starts]) / frame_length
+    return 10 * np.log10(energy + 1e-12), frame_length, hop_length
+
+
+class SpeechTrimmer:
+    def __init__(self, max_seconds=6.0, pad_ms=200, margin_db=10.0, range_db=40.0, min_speech_ms=60,
+                 noise_percentile=10, align=1):
+        self.max_seconds = max_seconds  # None or 0 disables the length cap
+        self.pad_ms = pad_ms
+        self.margin_db = margin_db
+        self.range_db = range_db
+        self.min_speech_ms = min_speech_ms
+        self.noise_percentile = noise_percentile
+        self.align = align  # The start of the speech region is moved back to a multiple of this many samples
+
+    @classmethod
+    def from_env(cls, **kwargs):
+        """The trimmer configured by VOICEPAY_VAD (off unless "1") and VOICEPAY_MAX_SPEECH_SECONDS, or None.
+
+        Off by default until benchmarks/eval_vad.py has been run on a labeled corpus and is within its tolerance.
+        """
+        if os.environ.get("VOICEPAY_VAD", "0") != "1":
+            return None
+        return cls(max_seconds=float(os.environ.get("VOICEPAY_MAX_SPEECH_SECONDS", "6")), **kwargs)
+
+    def speech_bounds(self, y, sr):
+        """(start, end) sample indices of the padded speech region, or None if no speech was found."""
+        energy_db, frame_length, hop_length = frame_energy_db(y, sr)
+        if not len(energy_db):
+            return None
+        threshold = max(np.percentile(energy_db, self.noise_percentile) + self.margin_db,
+                        energy_db.max() - self.range_db)
+        active = np.concatenate([[0], (energy_db > threshold).astype(np.int8), [0]])
+        edges = np.diff(active)
+        run_starts, run_ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+        sustained = (run_ends - run_starts) * hop_length >= sr * self.min_speech_ms / 1000
+        if not sustained.any():
+            return None
+        pad = int(sr * self.pad_ms / 1000)
+        start = max(0, run_starts[sustained][0] * hop_length - pad)
+        start -= start % self.align
+        end = min(len(y), (run_ends[sustained][-1] - 1) * hop_length + frame_length + pad)
+        return int(start), int(end)
+
+    def trim(self, y, sr):
+        """Return (trimmed signal, (start, end)); the signal is unchanged when no speech is detected."""
+        bounds = self.speech_bounds(y, sr) or (0, len(y))
+        start, end = bounds
+        if self.max_seconds:
+            end = min(end, start + int(self.max_seconds * sr))
+        return y[start:end], (start, end)
@@ -1,106 +1,127 @@
+import logging
+
 import librosa
 import numpy as np
-import os
-import io
-import tempfile
-import requests
 from cryptography.fernet import Fernet
+from audio_features import load_audio
+from request_audio import RequestAudio
+from recording_format import legacy_names, open_recording, read_metadata, recording_name
 
-def compare_with_previous_recordings(username, new_audio_data):
-    print(f"🔹 Comparing voice for user: {username}")
-    
-    # We need to download the files from Cloudinary
-    # Assuming you have a way to list or know the file URLs
-    # This is a simplified example - you might need to use Cloudinary's API to list files
-    
-    encrypted_files = []
-    key_files = []
-    
-    # For demonstration - you should replace with actual Cloudinary API calls
-    # to retrieve the URLs for the user's previous recordings
-    for i in range(1, 4):  # Get files 1, 2, 3
-        encrypted_files.append(f"https://res.cloudinary.com/dge7bcso3/raw/upload/{username}_{i}.enc")
-        key_files.append(f"https://res.cloudinary.com/dge7bcso3/raw/upload/{username}_key{i}.txt")
+logger = logging.getLogger("voicepay.voice_matching")
+
+MATCH_SR = 16000  # Sample rate the voice comparison MFCCs are computed at
+
+
+def _signal_at_match_rate(audio, sr=None):
+    """Return `audio` as a mono signal at MATCH_SR, resampling at most once per RequestAudio."""
+    if isinstance(audio, RequestAudio):
+        return audio.resampled(MATCH_SR)
+    if isinstance(audio, np.ndarray):
+        if sr is None:
+            raise ValueError("sr is required when passing a decoded signal")
+        return audio if sr == MATCH_SR else librosa.resample(audio, orig_sr=sr, target_sr=MATCH_SR)
+    y, _ = load_audio(audio, sr=MATCH_SR)
+    return y
+
+
+def mfcc_mean(audio, sr=None):
+    """Mean MFCC vector at MATCH_SR used as the voice comparison embedding."""
+    def compute():
+        y = _signal_at_match_rate(audio, sr)
+        return np.mean(librosa.feature.mfcc(y=y, sr=MATCH_SR), axis=1)
+
+    if isinstance(audio, RequestAudio):
+        return audio.cached("match_mfcc_mean", compute)
+    return compute()
+
+
+def download_reference_embeddings(username, storage, embed=mfcc_mean, kind=None, keyring=None):
+    """Fetch the user's enrollment recordings and return one reference embedding per recording.
+
+    A `.vpr` recording that already carries an embedding of `kind` is used as is;
+    otherwise its audio is decrypted and passed to `embed(audio_bytes)`. Slots
+    without a `.vpr` object fall back to the legacy .enc/key pair.
+    Only used when the store has no embeddings of the wanted kind for the user; the
+    result is written back to the store so this happens at most once per user.
+    """
+    slots = [1, 2, 3]
+    recordings = storage.get_many([recording_name(username, slot) for slot in slots])
+
+    embeddings = []
+    legacy_slots = []
+    for slot in slots:
+        blob = recordings[recording_name(username, slot)]
+        if blob is None:
+            legacy_slots.append(slot)
+            continue
+        try:
+            metadata = read_metadata(blob, keyring)
+            stored = metadata["embeddings"].get(kind) if kind else None
+            if stored is not None:
+                embeddings.append(np.asarray(stored, dtype=np.float32))
+            else:
+                embeddings.append(embed(open_recording(blob, keyring)[1]))
+        except Exception as e:
+            logger.warning("Error processing recording %d: %s", slot, e)
+    if not legacy_slots:
+        return embeddings
+
+    # All legacy objects are fetched concurrently over the storage's pooled session
+    objects = storage.get_many([name for slot in legacy_slots for name in legacy_names(username, slot)])
+    for slot in legacy_slots:
+        audio_name, key_name = legacy_names(username, slot)
+        try:
+            encrypted_audio = objects[audio_name]
+            if encrypted_audio is None:
+                logger.warning("Failed to download encrypted file: %s", audio_name)
+                continue
+            
+            encryption_key = objects[key_name]
+            if encryption_key is None:
+                logger.warning("Failed to download key file: %s", key_name)
+                continue
+            
+            # Decrypt the audio file
+            cipher = Fernet(encryption_key)
+            decrypted_audio = cipher.decrypt(encrypted_audio)
+            
+            # Extract features straight from the decrypted bytes
+            embeddings.append(embed(decrypted_audio))
+            
+        except Exception as e:
+            logger.warning("Error processing file %d: %s", slot, e)
+    return embeddings
+
+
+def compare_with_previous_recordings(username, new_audio_data, sr=None, store=None, storage=None, verifier=None):
+    """Compare new audio against the user's enrollment recordings.
+
+    `new_audio_data` is the request's RequestAudio, the raw upload bytes, a file
+    path, or an already decoded signal together with its `sr`; nothing is
+    written to disk. Scoring is done by a SpeakerVerifier (mean-MFCC unless one
+    is passed in); with an EmbeddingStore the references are a single lookup.
+    Without a verifier, pass the caller's shared `storage` (e.g. the app's), so
+    its connection pool is reused.
+    """
+    from speaker_verification import SpeakerVerifier  # speaker_verification builds on this module
+
+    if verifier is None and storage is None:
+        raise ValueError("compare_with_previous_recordings needs a verifier or the shared storage")
+    logger.debug("🔹 Comparing voice for user: %s", username)
     
     try:
-        # Create a temporary file for the new audio
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as temp_audio:
-            if isinstance(new_audio_data, bytes):
-                temp_audio.write(new_audio_data)
-                temp_audio_path = temp_audio.name
-            else:
-                # Assume new_audio_data is already a file path
-                temp_audio_path = new_audio_data
+        verifier = verifier or SpeakerVerifier(store=store, storage=storage)
+        result = verifier.verify(username, new_audio_data, sr)
+        for i, similarity in enumerate(result["scores"]):
+            logger.debug("Similarity with previous recording %d: %s", i + 1, similarity)
         
-        # Extract features from new audio
-        new_audio_features, _ = librosa.load(temp_audio_path, sr=16000)
-        new_audio_features = np.mean(librosa.feature.mfcc(y=new_audio_features, sr=16000), axis=1)
-        
-        # Clean up temp file
-        if isinstance(new_audio_data, bytes):
-            os.remove(temp_audio_path)
-        
-        # Compare with previous recordings from Cloudinary
-        matches = 0
-        valid_files = 0
-        
-        for i in range(3):  # Process all 3 pairs of files
-            try:
-                # Download encrypted audio from Cloudinary
-                encrypted_response = requests.get(encrypted_files[i])
-                if encrypted_response.status_code != 200:
-                    print(f"Failed to download encrypted file: {encrypted_files[i]}")
-                    continue
-                
-                # Download encryption key from Cloudinary
-                key_response = requests.get(key_files[i])
-                if key_response.status_code != 200:
-                    print(f"Failed to download key file: {key_files[i]}")
-                    continue
-                
-                # Decrypt the audio file
-                encryption_key = key_response.content
-                cipher = Fernet(encryption_key)
-                decrypted_audio = cipher.decrypt(encrypted_response.content)
-                
-                # Save to temporary file for processing
-                with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as temp_prev:
-                    temp_prev.write(decrypted_audio)
-                    prev_file_path = temp_prev.name
-                
-                # Extract features
-                prev_audio, _ = librosa.load(prev_file_path, sr=16000)
-                prev_audio_features = np.mean(librosa.feature.mfcc(y=prev_audio, sr=16000), axis=1)
-                
-                # Calculate similarity
-                similarity = np.dot(new_audio_features, prev_audio_features) / (
-                        np.linalg.norm(new_audio_features) * np.linalg.norm(prev_audio_features))
-                
-                print(f"Similarity with previous recording {i+1}: {similarity}")
-                
-                if similarity > 0.85:  # Acceptable voice match threshold
-                    matches += 1
-                
-                valid_files += 1
-                
-                # Clean up temp file
-                os.remove(prev_file_path)
-                
-            except Exception as e:
-                print(f"Error processing file {i+1}: {e}")
-        
-        print(f"Total matches: {matches}/{valid_files}")
-        
-        # Require at least 2 matches if we have at least 2 valid files
-        if valid_files >= 2:
-            return matches >= 2
-        elif valid_files == 1:
-            return matches == 1
-        else:
+        if not result["scores"]:
             # No valid files to compare against
-            print("No valid previous recordings found for comparison")
-            return True  # Allow if no previous records (first-time case)
+            logger.info("No valid previous recordings found for comparison")
+        else:
+            logger.debug("Total matches: %d/%d", result["matches"], len(result["scores"]))
+        return result["match"]
         
     except Exception as e:
-        print(f"Error in voice comparison: {e}")
-        return False
\ No newline at end of file
+        logger.warning("Error in voice comparison: %s", e)
+        return False
@@ -1,36 +1,42 @@
+import logging
 import os
 import random
 import speech_recognition as sr
 import librosa
 import numpy as np
-import assemblyai as aai
 import time
 import soundfile as sf
 import noisereduce as nr
-import torchaudio
-import torch
-from fuzzywuzzy import fuzz
-from speechbrain.inference import SpeakerRecognition
 from deepfake_proper import DeepfakeDetector
+from model_registry import ModelRegistry
+from vad import SpeechTrimmer
+from transcription import ASSEMBLYAI_API_KEY, AssemblyAITranscriber
 
-deepfake_detector = DeepfakeDetector("/Users/dhavalbhagat/Desktop/VoicePay/voicepay/python/dataset/shuffled_file.csv")
+
+def load_speaker_model():
+    from speechbrain.inference import SpeakerRecognition
+
+    return SpeakerRecognition.from_hparams(
+        source="speechbrain/spkrec-ecapa-voxceleb",
+        savedir=os.path.expanduser("~/.speechbrain_models/spkrec")
+    )
+
+
+# Both models are loaded on first use, so importing this module stays cheap
+models = ModelRegistry()
+models.register("deepfake", DeepfakeDetector.from_csv)
+models.register("spkrec", load_speaker_model)
 
 def check_deepfake(audio_file):
-    result = deepfake_detector.predict_audio_deepfake(audio_file)
+    result = models.get("deepfake").predict_audio_deepfake(audio_file)
     if result == "FAKE":
         print(f"🚨 Deepfake detected in {audio_file}. Please use a real voice recording.")
         return False
     print(f"✅ {audio_file} passed deepfake verification.")
     return True
 
-spkrec_model = SpeakerRecognition.from_hparams(
-    source="speechbrain/spkrec-ecapa-voxceleb",
-    savedir=os.path.expanduser("~/.speechbrain_models/spkrec")
-)
-
-# AssemblyAI API Key (Replace with a valid API key)
-API_KEY = "d5a05d4271894a61ace9741605c8a7e8"
-aai.settings.api_key = API_KEY
+# AssemblyAI API Key (set ASSEMBLYAI_API_KEY to override)
+API_KEY = ASSEMBLYAI_API_KEY
 
 # Predefined sentences for training
 SENTENCES = [
@@ -62,37 +68,22 @@ def record_audio(filename, text=None, duration=5):
 
 def noise_reduction(audio_file):
     y, sr = librosa.load(audio_file, sr=None)
+    y, _ = SpeechTrimmer().trim(y, sr)  # Denoise (and later score) only the speech region
     reduced_noise = nr.reduce_noise(y=y, sr=sr, prop_decrease=0.8)
     sf.write(audio_file, reduced_noise, sr)
     return audio_file
 
 def transcribe_audio(audio_file, max_retries=3):
-    if not aai.settings.api_key:
-        print("❌ Error: AssemblyAI API key is missing.")
-        return None
-    
-    transcriber = aai.Transcriber()
-    for attempt in range(max_retries):
-        try:
-            print("\U0001F504 Uploading audio for verification...")
-            transcript = transcriber.transcribe(audio_file)
-            if transcript.status == "completed":
-                return transcript.text.strip().lower()
-            print(f"⚠ Transcription failed. Attempt {attempt + 1}/{max_retries}")
-        except Exception as e:
-            if "Unauthorized" in str(e):
-                print("❌ Invalid AssemblyAI API key. Check your environment variable.")
-                return None  # No retries if API key is wrong
-            print(f"⚠ Error: {e}. Retrying ({attempt + 1}/{max_retries})...")
-            time.sleep(2)
-    return None
+    return AssemblyAITranscriber(API_KEY, max_retries=max_retries).transcribe(audio_file)
 
 def is_exact_match(transcribed_text, expected_text):
     return transcribed_text == expected_text.lower()
 
 def extract_voice_features(audio_file):
+    import torchaudio
+
     signal, _ = torchaudio.load(audio_file)
-    return spkrec_model.encode_batch(signal).squeeze(0).detach().numpy()
+    return models.get("spkrec").encode_batch(signal).squeeze(0).detach().numpy()
 
 def compare_voice_signatures(sig1, sig2, threshold=0.85):
     sig1 = sig1.flatten()
@@ -124,6 +115,7 @@ def verify_speech(expected_text):
     return is_exact_match(transcribed_text, expected_text)
 
 def main():
+    logging.basicConfig(level=logging.INFO, format="%(message)s")  # Library modules log instead of printing
     print("\n🔹 **Voice Training Phase** 🔹\n")
     selected_sentences = get_random_sentences()
     voice_signatures = []